@@ -1,7 +1,9 @@
+from .archive import ActivityArchive  # noqa
 from .base import (  # noqa
     activity_base,
     assign_actor,
     ImproperlyConfigured,
+    IndexProfile,
     versioning_manager,
     VersioningManager
 )
@@ -10,6 +12,8 @@ from .migrations import (  # noqa
     add_column,
     alter_column,
     change_column_name,
+    create_activity_indexes,
+    MigrationPlan,
     remove_column,
     rename_table
 )
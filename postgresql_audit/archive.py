@@ -0,0 +1,505 @@
+import heapq
+import json
+import mmap
+import os
+import zlib
+from datetime import datetime, timezone
+
+import sqlalchemy as sa
+from sqlalchemy import text
+
+ARCHIVE_FORMAT_VERSION = 1
+
+SEGMENT_SUFFIX = '.seg'
+
+INDEX_SUFFIX = '.idx'
+
+PENDING_SUFFIX = '.pending'
+
+
+def parse_datetime(value):
+    """
+    Parse a timestamp serialized by PostgreSQL's ``to_json``, which omits
+    trailing zeros of the fractional seconds.
+    """
+    if value is None:
+        return None
+    value, _, fraction = value.partition('.')
+    result = datetime.strptime(value, '%Y-%m-%dT%H:%M:%S')
+    if fraction:
+        result = result.replace(microsecond=int(fraction.ljust(6, '0')))
+    return result
+
+
+def build_archive_query(versioning_manager, source, *criteria):
+    """
+    Return a query for the activities of given table or table clause matching
+    given criteria joined to their transactions, with each activity
+    serialized as JSON.
+    """
+    transaction = versioning_manager.transaction_cls.__table__
+    rows = (
+        sa.select(
+            source.c.id,
+            source.c.schema_name,
+            source.c.table_name,
+            source.c.relid,
+            source.c.issued_at,
+            source.c.native_transaction_id,
+            source.c.verb,
+            source.c.old_data,
+            source.c.changed_data,
+            source.c.record_key,
+            source.c.transaction_id,
+            transaction.c.actor_id,
+            transaction.c.client_addr,
+            transaction.c.issued_at.label('transaction_issued_at')
+        )
+        .select_from(
+            source.outerjoin(
+                transaction,
+                source.c.transaction_id == transaction.c.id
+            )
+        )
+        .where(*criteria)
+        .subquery()
+    )
+    return sa.select(
+        rows.c.id,
+        rows.c.issued_at,
+        rows.c.table_name,
+        rows.c.actor_id,
+        sa.cast(sa.func.to_json(rows.table_valued()), sa.Text)
+    ).order_by(rows.c.id)
+
+
+class ArchiveSegment(object):
+    """
+    Read-only view of an archive segment. The segment file is memory-mapped
+    and its blocks are decompressed only when the rows of a block are read.
+
+    :param path: Path of the segment without the file suffix
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path + INDEX_SUFFIX) as file:
+            self.index = json.load(file)
+        for block in self.index['blocks']:
+            block['min_issued_at'] = parse_datetime(block['min_issued_at'])
+            block['max_issued_at'] = parse_datetime(block['max_issued_at'])
+        self.file = open(path + SEGMENT_SUFFIX, 'rb')
+        self.mmap = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    @property
+    def min_id(self):
+        return self.index['blocks'][0]['min_id']
+
+    @property
+    def max_id(self):
+        return self.index['blocks'][-1]['max_id']
+
+    def close(self):
+        self.mmap.close()
+        self.file.close()
+
+    def read_block(self, block):
+        data = zlib.decompress(
+            self.mmap[block['offset']:block['offset'] + block['length']]
+        )
+        for line in data.decode().splitlines():
+            row = json.loads(line)
+            row['issued_at'] = parse_datetime(row['issued_at'])
+            row['transaction_issued_at'] = parse_datetime(
+                row['transaction_issued_at']
+            )
+            yield row
+
+    def rows(self, tables=None, actor_id=None, start=None, end=None):
+        """
+        Iterate over the rows of the blocks of this segment that may contain
+        activities matching given filters, ordered by id.
+        """
+        for block in self.index['blocks']:
+            if tables is not None and not set(tables) & set(block['tables']):
+                continue
+            if actor_id is not None and actor_id not in block['actors']:
+                continue
+            if start is not None and block['max_issued_at'] < start:
+                continue
+            if end is not None and block['min_issued_at'] >= end:
+                continue
+            yield from self.read_block(block)
+
+
+class ActivityArchive(object):
+    """
+    Archive of activities stored in compressed, append-only segment files in
+    given directory. Each segment holds the activities moved out of the
+    database by one :meth:`archive` or :meth:`archive_partition` call, in
+    blocks of `block_size` activities compressed with zlib. An index file
+    next to each segment records the offset and the id, time, table and actor
+    ranges of each block, so queries only decompress the blocks that may
+    contain matching activities.
+
+    The index of a new segment is written under a pending name, which is
+    renamed once the transaction deleting the archived activities from the
+    database has been committed. Pending segments left behind by a crash in
+    between are completed by the next :meth:`archive` or
+    :meth:`archive_partition` call. Since their activities may have been
+    archived again, activities with the same id are returned only once::
+
+        archive = ActivityArchive('/var/lib/audit-archive')
+        archive.archive(
+            engine,
+            versioning_manager,
+            before=(
+                datetime.now(timezone.utc).replace(tzinfo=None) -
+                timedelta(days=90)
+            )
+        )
+
+        with ActivityArchive('/var/lib/audit-archive') as archive:
+            for activity in archive.history_for('article', [article_id]):
+                ...
+
+    :param path: Directory of the segment files
+    :param block_size: Number of activities per compressed block
+    :param compression_level: zlib compression level
+    """
+
+    def __init__(self, path, block_size=1000, compression_level=6):
+        self.path = path
+        self.block_size = block_size
+        self.compression_level = compression_level
+        self._segments = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        for segment in self._segments.values():
+            segment.close()
+        self._segments = {}
+
+    def segment_names(self):
+        """
+        Return the names of the complete segments of this archive. A segment
+        is complete once its index file has been written.
+        """
+        if not os.path.isdir(self.path):
+            return []
+        return sorted(
+            name[:-len(INDEX_SUFFIX)]
+            for name in os.listdir(self.path)
+            if name.endswith(INDEX_SUFFIX)
+        )
+
+    def pending_segment_names(self):
+        """
+        Return the names of the segments of this archive whose index has been
+        written but not completed yet.
+        """
+        if not os.path.isdir(self.path):
+            return []
+        suffix = INDEX_SUFFIX + PENDING_SUFFIX
+        return sorted(
+            name[:-len(suffix)]
+            for name in os.listdir(self.path)
+            if name.endswith(suffix)
+        )
+
+    def complete_segment(self, name):
+        """
+        Complete given pending segment, making its activities visible to
+        queries.
+        """
+        path = os.path.join(self.path, name + INDEX_SUFFIX)
+        os.rename(path + PENDING_SUFFIX, path)
+
+    def complete_pending_segments(self):
+        # The activities of a pending segment have either been deleted from
+        # the database or are archived again, in which case the duplicates
+        # are skipped when reading.
+        for name in self.pending_segment_names():
+            self.complete_segment(name)
+
+    @property
+    def segments(self):
+        for name in self.segment_names():
+            if name not in self._segments:
+                self._segments[name] = ArchiveSegment(
+                    os.path.join(self.path, name)
+                )
+        return [self._segments[name] for name in self.segment_names()]
+
+    def remove_segment(self, name):
+        # Removes a segment whose activities could not be deleted from the
+        # database, so that they won't be archived twice.
+        if name is None:
+            return
+        segment = self._segments.pop(name, None)
+        if segment is not None:
+            segment.close()
+        for suffix in (INDEX_SUFFIX + PENDING_SUFFIX, SEGMENT_SUFFIX):
+            os.remove(os.path.join(self.path, name + suffix))
+
+    def write_file(self, path, write):
+        # Written under a temporary name and renamed once synced to disk, so
+        # that readers never see partially written files.
+        with open(path + '.tmp', 'wb') as file:
+            write(file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.rename(path + '.tmp', path)
+
+    def write_segment(self, rows):
+        """
+        Write given rows into a new pending segment and return its name, or
+        None if there were no rows. Rows are tuples of the id, issue time,
+        table name and actor id of an activity and the activity serialized as
+        JSON, in ascending id order.
+        """
+        os.makedirs(self.path, exist_ok=True)
+        blocks = []
+        name = 'segment-{}'.format(
+            datetime.now(timezone.utc).strftime('%Y%m%d%H%M%S%f')
+        )
+        path = os.path.join(self.path, name)
+        if os.path.exists(path + SEGMENT_SUFFIX):
+            raise ValueError('Segment {} already exists.'.format(name))
+
+        def write_blocks(file):
+            offset = 0
+            block = []
+            for row in rows:
+                block.append(row)
+                if len(block) == self.block_size:
+                    offset = self.write_block(file, offset, block, blocks)
+                    block = []
+            if block:
+                self.write_block(file, offset, block, blocks)
+
+        self.write_file(path + SEGMENT_SUFFIX, write_blocks)
+        if not blocks:
+            os.remove(path + SEGMENT_SUFFIX)
+            return None
+        index = {'version': ARCHIVE_FORMAT_VERSION, 'blocks': blocks}
+        self.write_file(
+            path + INDEX_SUFFIX + PENDING_SUFFIX,
+            lambda file: file.write(json.dumps(index).encode())
+        )
+        return name
+
+    def write_block(self, file, offset, rows, blocks):
+        data = zlib.compress(
+            ''.join(row[4] + '\n' for row in rows).encode(),
+            self.compression_level
+        )
+        file.write(data)
+        issued_at = [row[1] for row in rows]
+        blocks.append({
+            'offset': offset,
+            'length': len(data),
+            'rows': len(rows),
+            'min_id': rows[0][0],
+            'max_id': rows[-1][0],
+            'min_issued_at': min(issued_at).isoformat(),
+            'max_issued_at': max(issued_at).isoformat(),
+            'tables': sorted({row[2] for row in rows}),
+            'actors': sorted(
+                {row[3] for row in rows if row[3] is not None},
+                key=str
+            ),
+        })
+        return offset + len(data)
+
+    def archive(self, engine, versioning_manager, before, batch_size=1000):
+        """
+        Move the activities issued before given datetime out of the database
+        into a new segment. The activities are streamed from a server side
+        cursor, `batch_size` rows at a time, and deleted within the same
+        repeatable read transaction once the segment has been written. Returns
+        the name of the new segment, or None if there was nothing to archive.
+
+        Transactions left without activities can be deleted afterwards with
+        :meth:`~postgresql_audit.VersioningManager.prune`.
+
+        :param engine: SQLAlchemy Engine
+        :param versioning_manager: VersioningManager of the activity table
+        :param before: Naive UTC datetime
+        :param batch_size: Number of rows to fetch at a time
+        """
+        self.complete_pending_segments()
+        activity = versioning_manager.activity_cls.__table__
+        query = build_archive_query(
+            versioning_manager,
+            activity,
+            activity.c.issued_at < before
+        )
+        name = None
+        with engine.connect().execution_options(
+            isolation_level='REPEATABLE READ'
+        ) as conn:
+            try:
+                with conn.begin():
+                    name = self.write_segment(
+                        conn.execute(
+                            query.execution_options(
+                                stream_results=True,
+                                max_row_buffer=batch_size
+                            )
+                        )
+                    )
+                    if name is not None:
+                        conn.execute(
+                            activity.delete()
+                            .where(activity.c.issued_at < before)
+                        )
+            except Exception:
+                self.remove_segment(name)
+                raise
+        if name is not None:
+            self.complete_segment(name)
+        return name
+
+    def archive_partition(
+        self,
+        engine,
+        versioning_manager,
+        name,
+        batch_size=1000
+    ):
+        """
+        Move all activities of given detached activity partition into a new
+        segment and drop the partition. Returns the name of the new segment,
+        or None if the partition was empty::
+
+            with engine.begin() as conn:
+                names = versioning_manager.detach_partitions(conn, cutoff)
+            for name in names:
+                archive.archive_partition(engine, versioning_manager, name)
+
+        :param engine: SQLAlchemy Engine
+        :param versioning_manager: VersioningManager of the activity table
+        :param name: Name of the detached partition
+        :param batch_size: Number of rows to fetch at a time
+        """
+        self.complete_pending_segments()
+        activity = versioning_manager.activity_cls.__table__
+        partition = sa.table(
+            name,
+            *(sa.column(column.name) for column in activity.c),
+            schema=versioning_manager.schema_name
+        )
+        segment = None
+        try:
+            with engine.begin() as conn:
+                segment = self.write_segment(
+                    conn.execute(
+                        build_archive_query(versioning_manager, partition)
+                        .execution_options(
+                            stream_results=True,
+                            max_row_buffer=batch_size
+                        )
+                    )
+                )
+                conn.execute(text(
+                    'DROP TABLE {}{}'.format(
+                        versioning_manager.schema_prefix,
+                        name
+                    )
+                ))
+        except Exception:
+            self.remove_segment(segment)
+            raise
+        if segment is not None:
+            self.complete_segment(segment)
+        return segment
+
+    def activities(
+        self,
+        tables=None,
+        actor_id=None,
+        start=None,
+        end=None,
+        record_key=None
+    ):
+        """
+        Iterate over the archived activities matching given filters as
+        dicts, ordered by id. The dicts have the same keys as the rows of
+        :meth:`~postgresql_audit.VersioningManager.iter_export`, along with
+        ``relid``, ``native_transaction_id``, ``record_key`` and
+        ``transaction_issued_at``.
+
+        :param tables: Optional names of the tables of the activities
+        :param actor_id: Optional id of the actor of the activities
+        :param start: Optional naive UTC datetime the activities are issued
+            at or after
+        :param end: Optional naive UTC datetime the activities are issued
+            before
+        :param record_key: Optional list of the primary key values of the
+            changed row
+        """
+        def matches(row):
+            return (
+                (tables is None or row['table_name'] in tables) and
+                (actor_id is None or row['actor_id'] == actor_id) and
+                (start is None or row['issued_at'] >= start) and
+                (end is None or row['issued_at'] < end) and
+                (record_key is None or row['record_key'] == record_key)
+            )
+
+        def unique(rows):
+            last_id = None
+            for row in rows:
+                if row['id'] != last_id:
+                    yield row
+                last_id = row['id']
+
+        rows = heapq.merge(
+            *(
+                segment.rows(tables, actor_id, start, end)
+                for segment in self.segments
+            ),
+            key=lambda row: row['id']
+        )
+        return filter(matches, unique(rows))
+
+    def history_for(self, table_name, key):
+        """
+        Iterate over the archived activities of the record of given table
+        with given primary key values, ordered by id. The archive counterpart
+        of :meth:`Activity.history_for`.
+
+        :param table_name: Name of the table
+        :param key: List of the primary key values of the record
+        """
+        return self.activities(tables=[table_name], record_key=list(key))
+
+    def actor_activities(self, actor_id, start=None, end=None):
+        """
+        Return the archived activities of the transactions issued by given
+        actor within the half-open time window from `start` to `end`,
+        ordered by the issue time of their transactions and their ids. The
+        archive counterpart of
+        :meth:`~postgresql_audit.VersioningManager.actor_activities`.
+
+        :param actor_id: Id of the actor
+        :param start: Optional naive UTC datetime
+        :param end: Optional naive UTC datetime
+        """
+        def in_window(row):
+            issued_at = row['transaction_issued_at']
+            return (
+                (start is None or issued_at >= start) and
+                (end is None or issued_at < end)
+            )
+
+        return sorted(
+            filter(in_window, self.activities(actor_id=actor_id)),
+            key=lambda row: (row['transaction_issued_at'], row['id'])
+        )
@@ -0,0 +1,100 @@
+from contextlib import asynccontextmanager
+
+import sqlalchemy as sa
+from sqlalchemy import text
+
+from .base import VersioningManager as BaseVersioningManager
+
+
+class VersioningManager(BaseVersioningManager):
+    """
+    VersioningManager for applications using SQLAlchemy's
+    :class:`~sqlalchemy.ext.asyncio.AsyncSession`.
+
+    Flushes of an AsyncSession are run by its underlying synchronous session,
+    so activity values are sent to the database the same way they are with
+    synchronous sessions. This manager adds awaitable counterparts for the
+    methods taking a session as an argument.
+    """
+
+    @asynccontextmanager
+    async def disable(self, session):
+        await session.execute(
+            text(
+                "SET LOCAL postgresql_audit.enable_versioning = 'false'"
+            )
+        )
+        try:
+            yield
+        finally:
+            await session.execute(
+                text(
+                    "SET LOCAL postgresql_audit.enable_versioning = 'true'"
+                )
+            )
+
+    async def set_async_activity_values(self, session):
+        """
+        Send the activity values to the database within the current
+        transaction of given AsyncSession. Needed only when changing audited
+        tables without flushing versioned objects.
+
+        :param session: SQLAlchemy AsyncSession object
+        """
+        await session.run_sync(self.set_activity_values)
+
+    async def stream_activities(self, session, *criteria, yield_per=1000):
+        """
+        Asynchronously iterate over the activities matching given criteria
+        ordered by id. The activities are fetched from a server side cursor
+        `yield_per` rows at a time, so large result sets are neither loaded
+        into memory at once nor block the event loop::
+
+            async for activity in versioning_manager.stream_activities(
+                session,
+                Activity.table_name == 'article'
+            ):
+                ...
+
+        :param session: SQLAlchemy AsyncSession object
+        :param criteria: SQL expressions for filtering the activities
+        :param yield_per: Number of rows to fetch at a time
+        """
+        async for activity in self._stream(
+            session,
+            self.activity_cls,
+            criteria,
+            yield_per
+        ):
+            yield activity
+
+    async def stream_transactions(self, session, *criteria, yield_per=1000):
+        """
+        Asynchronously iterate over the transactions matching given criteria
+        ordered by id. See :meth:`stream_activities`.
+
+        :param session: SQLAlchemy AsyncSession object
+        :param criteria: SQL expressions for filtering the transactions
+        :param yield_per: Number of rows to fetch at a time
+        """
+        async for transaction in self._stream(
+            session,
+            self.transaction_cls,
+            criteria,
+            yield_per
+        ):
+            yield transaction
+
+    async def _stream(self, session, cls, criteria, yield_per):
+        query = (
+            sa.select(cls)
+            .where(*criteria)
+            .order_by(cls.id)
+            .execution_options(yield_per=yield_per)
+        )
+        result = await session.stream_scalars(query)
+        async for obj in result:
+            yield obj
+
+
+versioning_manager = VersioningManager()
@@ -1,20 +1,57 @@
+import csv
+import hashlib
+import json
 import os
+import re
 import string
+import time
 import warnings
+from collections import namedtuple
 from contextlib import contextmanager
-from weakref import WeakSet
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from itertools import chain
+from weakref import WeakKeyDictionary, WeakSet
 
 import sqlalchemy as sa
 from sqlalchemy import orm, text
-from sqlalchemy.dialects.postgresql import array, INET, insert, JSONB
+from sqlalchemy.dialects.postgresql import (
+    aggregate_order_by,
+    array,
+    INET,
+    insert,
+    JSONB,
+    REGCLASS
+)
 from sqlalchemy.dialects.postgresql.base import PGDialect
 from sqlalchemy.ext.declarative import declared_attr
 from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.types import UserDefinedType
-from sqlalchemy_utils import get_class_by_table
 
 HERE = os.path.dirname(os.path.abspath(__file__))
 
+PARTITION_INTERVALS = ('day', 'week', 'month', 'year')
+
+ACTIVITY_ID_STRATEGIES = ('sequence', 'identity', 'time_ordered')
+
+# Time ordered activity ids hold the number of milliseconds elapsed since
+# ACTIVITY_ID_EPOCH in their high bits and a sequence value in their lowest
+# ACTIVITY_ID_SEQUENCE_BITS bits.
+ACTIVITY_ID_EPOCH = datetime(2020, 1, 1)
+
+ACTIVITY_ID_SEQUENCE_BITS = 22
+
+EXPORT_FORMATS = ('ndjson', 'csv')
+
+PruneResult = namedtuple(
+    'PruneResult',
+    ['activities', 'transactions', 'duration']
+)
+
+PARTITION_BOUND_RE = re.compile(
+    r"FOR VALUES FROM \('(?P<start>[^']+)'\) TO \('(?P<end>[^']+)'\)"
+)
+
 
 class XID8(UserDefinedType):
     cache_ok = True
@@ -49,6 +86,27 @@ def read_file(file_):
     return s
 
 
+@lru_cache(maxsize=None)
+def load_template(tmpl_name):
+    file_contents = read_file(
+        'templates/{}'.format(tmpl_name)
+    ).replace('$$', '$$$$')
+    return string.Template(file_contents)
+
+
+@lru_cache(maxsize=None)
+def render_template(tmpl_name, context):
+    """
+    Render given SQL template with given context. Both the templates and the
+    rendered SQL are cached, so each template is read from the disk once and
+    rendered once per context.
+
+    :param tmpl_name: Name of the template file
+    :param context: Template context as a sorted tuple of key-value pairs
+    """
+    return load_template(tmpl_name).substitute(**dict(context))
+
+
 def assign_actor(base, cls, actor_cls):
     if hasattr(cls, 'actor_id'):
         return
@@ -70,6 +128,27 @@ def assign_actor(base, cls, actor_cls):
         cls.actor_id = sa.Column(sa.Text)
 
 
+def index_actor(cls):
+    """
+    Add an index for looking up the transactions of an actor within a time
+    window to the table of given transaction class. The transaction ids are
+    included in the index so that the lookups can be answered with index-only
+    scans.
+
+    :param cls: Transaction class with an ``actor_id`` column
+    """
+    table = cls.__table__
+    name = 'ix_transaction_actor_id_issued_at'
+    if any(index.name == name for index in table.indexes):
+        return
+    sa.Index(
+        name,
+        table.c.actor_id,
+        table.c.issued_at,
+        postgresql_include=['id']
+    )
+
+
 def transaction_base(Base, schema):
     class Transaction(Base):
         __abstract__ = True
@@ -98,20 +177,217 @@ def transaction_base(Base, schema):
     return Transaction
 
 
-def activity_base(Base, schema, transaction_cls):
+def activity_id_column(schema, id_strategy, id_cache):
+    if id_strategy == 'identity':
+        return sa.Column(
+            sa.BigInteger,
+            sa.Identity(cache=id_cache),
+            primary_key=True
+        )
+    elif id_strategy == 'time_ordered':
+        # The default is set by the activity_id.sql template, as the
+        # activity_id() function needs the table to exist.
+        return sa.Column(sa.BigInteger, primary_key=True, autoincrement=False)
+    elif id_cache is not None:
+        sequence = sa.Sequence(
+            'activity_id_seq',
+            cache=id_cache,
+            schema=schema
+        )
+        return sa.Column(
+            sa.BigInteger,
+            sequence,
+            server_default=sequence.next_value(),
+            primary_key=True
+        )
+    return sa.Column(sa.BigInteger, primary_key=True, autoincrement=True)
+
+
+class IndexProfile(object):
+    """
+    Describes the indexes of the ``activity`` table besides its primary key
+    and the indexes it always has::
+
+        versioning_manager = VersioningManager(
+            index_profile=IndexProfile(
+                brin=['issued_at', 'id'],
+                gin=['old_data', 'changed_data'],
+                tables=['article']
+            )
+        )
+
+    :param brin: Names of the columns to create BRIN indexes on. As the
+        activity table is append-only, ``issued_at`` and ``id`` correlate with
+        the physical order of the rows, and BRIN indexes on them take a
+        fraction of the space of B-tree indexes.
+    :param gin: Names of the JSONB columns to create GIN indexes on
+    :param tables: Names of the audited tables to create partial B-tree
+        indexes on ``id`` for, covering only the activities of each table
+    :param pages_per_range: Number of table blocks summarized by each BRIN
+        index entry
+    """
+
+    jsonb_columns = ('old_data', 'changed_data', 'record_key')
+
+    def __init__(self, brin=(), gin=(), tables=(), pages_per_range=None):
+        unknown = set(gin) - set(self.jsonb_columns)
+        if unknown:
+            raise ImproperlyConfigured(
+                'GIN indexes can only be created on the JSONB columns {} of '
+                'the activity table, not on {}.'.format(
+                    ', '.join(self.jsonb_columns),
+                    ', '.join(sorted(unknown))
+                )
+            )
+        self.brin = list(brin)
+        self.gin = list(gin)
+        self.tables = list(tables)
+        self.pages_per_range = pages_per_range
+
+    def indexes(self, table_name='activity', concurrently=False):
+        """
+        Return the indexes of this profile as a list of
+        :class:`~sqlalchemy.schema.Index` objects referring to the columns of
+        the activity table by name.
+
+        :param table_name: Name of the activity table, used as the prefix of
+            the index names
+        :param concurrently: Whether the indexes should be created with
+            ``CREATE INDEX CONCURRENTLY``
+        """
+        options = {}
+        if concurrently:
+            options['postgresql_concurrently'] = True
+        brin_options = dict(options, postgresql_using='brin')
+        if self.pages_per_range is not None:
+            brin_options['postgresql_with'] = {
+                'pages_per_range': self.pages_per_range
+            }
+        indexes = [
+            sa.Index(
+                'ix_{}_{}_brin'.format(table_name, column),
+                column,
+                **brin_options
+            )
+            for column in self.brin
+        ]
+        indexes.extend(
+            sa.Index(
+                'ix_{}_{}_gin'.format(table_name, column),
+                column,
+                postgresql_using='gin',
+                **options
+            )
+            for column in self.gin
+        )
+        indexes.extend(
+            sa.Index(
+                'ix_{}_{}_id'.format(table_name, name),
+                'id',
+                postgresql_where=sa.column('table_name') == name,
+                **options
+            )
+            for name in self.tables
+        )
+        return indexes
+
+
+class DeclarativeClassMap(object):
+    """
+    Memoized mapping of table names to the declarative classes of given
+    declarative base. Classes of tables mapped by an inheritance hierarchy
+    are memoized by table name and polymorphic identity.
+
+    :param base: Declarative base
+    """
+
+    def __init__(self, base):
+        self.base = base
+        self.classes = {}
+        self.polymorphic_on = {}
+
+    def get(self, table_name, data):
+        """
+        Return the declarative class of the table with given name for given
+        row data, or None if the table is not mapped by any class.
+
+        :param table_name: Name of the table
+        :param data: Row data as a dict
+        """
+        cls = self.classes.get(table_name)
+        if cls is not None:
+            return cls
+        key = table_name
+        if table_name in self.polymorphic_on:
+            key = (table_name, data.get(self.polymorphic_on[table_name]))
+            cls = self.classes.get(key)
+            if cls is not None:
+                return cls
+
+        from sqlalchemy_utils import get_class_by_table
+
+        table = self.base.metadata.tables[table_name]
+        try:
+            cls = get_class_by_table(self.base, table)
+        except ValueError:
+            cls = get_class_by_table(self.base, table, data)
+            column = sa.inspect(cls).polymorphic_on.name
+            self.polymorphic_on[table_name] = column
+            key = (table_name, data.get(column))
+        if cls is not None:
+            self.classes[key] = cls
+        return cls
+
+
+def activity_base(
+    Base,
+    schema,
+    transaction_cls,
+    partitioned=False,
+    id_strategy='sequence',
+    id_cache=None,
+    actor_indexes=False,
+    index_profile=None
+):
+    table_args = {'schema': schema}
+    if partitioned:
+        table_args['postgresql_partition_by'] = 'RANGE (issued_at)'
+    class_map = DeclarativeClassMap(Base)
 
     class ActivityBase(Base):
         __abstract__ = True
-        __table_args__ = {'schema': schema}
-        id = sa.Column(sa.BigInteger, primary_key=True)
+        id = activity_id_column(schema, id_strategy, id_cache)
         schema_name = sa.Column(sa.Text)
         table_name = sa.Column(sa.Text)
         relid = sa.Column(sa.Integer)
-        issued_at = sa.Column(sa.DateTime)
+        # A partitioned table's primary key has to include the partition key.
+        issued_at = sa.Column(sa.DateTime, primary_key=partitioned)
         native_transaction_id = sa.Column(XID8(), index=True)
         verb = sa.Column(sa.Text)
         old_data = sa.Column(JSONB, default={}, server_default='{}')
         changed_data = sa.Column(JSONB, default={}, server_default='{}')
+        # Array of the primary key values of the changed row.
+        record_key = sa.Column(JSONB)
+
+        @declared_attr
+        def __table_args__(cls):
+            indexes = [
+                sa.Index(
+                    'ix_activity_record_key',
+                    'relid',
+                    'record_key',
+                    'id'
+                )
+            ]
+            if actor_indexes:
+                # Supports joining the activities of transactions found by
+                # actor.
+                indexes.append(
+                    sa.Index('ix_activity_transaction_id', 'transaction_id')
+                )
+            if index_profile is not None:
+                indexes.extend(index_profile.indexes(cls.__tablename__))
+            return tuple(indexes) + (table_args,)
 
         @declared_attr
         def transaction_id(cls):
@@ -135,11 +411,82 @@ def activity_base(Base, schema, transaction_cls):
         def data(cls):
             return cls.old_data + cls.changed_data
 
+        @classmethod
+        def history_for(cls, obj):
+            """
+            Return a query for the activities of given object ordered by id.
+            The activities are looked up by the record key of the object,
+            which is stored for the activities of tables with a primary key.
+
+            :param obj: SQLAlchemy declarative model object
+            """
+            mapper = sa.inspect(obj).mapper
+            table = mapper.local_table
+            key = [
+                sa.cast(
+                    getattr(obj, mapper.get_property_by_column(column).key),
+                    column.type
+                )
+                for column in table.primary_key.columns
+            ]
+            relid = sa.cast(
+                sa.cast(
+                    PGDialect().identifier_preparer.format_table(table),
+                    REGCLASS
+                ),
+                sa.Integer
+            )
+            return (
+                sa.select(cls)
+                .where(
+                    cls.relid == relid,
+                    cls.record_key == sa.func.jsonb_build_array(
+                        *key,
+                        type_=JSONB
+                    )
+                )
+                .order_by(cls.id)
+            )
+
         @property
         def object(self):
-            table = Base.metadata.tables[self.table_name]
-            cls = get_class_by_table(Base, table, self.data)
-            return cls(**self.data)
+            data = self.data
+            return class_map.get(self.table_name, data)(**data)
+
+        @classmethod
+        def materialize(cls, activities, as_dict=False):
+            """
+            Iterate over the objects of given activities, built the same way
+            as :attr:`object`. Given activities are consumed one at a time,
+            so they can be a list as well as a stream of activities, such as
+            the result of a query with ``yield_per``. Each activity's table is
+            resolved to a declarative class only once::
+
+                for obj in Activity.materialize(
+                    session.scalars(query).yield_per(1000)
+                ):
+                    ...
+
+            :param activities: Iterable of activities, or of rows with
+                ``table_name``, ``old_data`` and ``changed_data`` attributes
+            :param as_dict: Whether to yield the data of the activities as
+                dicts instead of objects
+            """
+            get_class = class_map.get
+            for activity in activities:
+                old_data = activity.old_data
+                changed_data = activity.changed_data
+                if old_data and changed_data:
+                    data = {**old_data, **changed_data}
+                elif as_dict:
+                    data = dict(old_data or changed_data or {})
+                else:
+                    # Passed as keyword arguments, so no need to copy.
+                    data = old_data or changed_data or {}
+                if as_dict:
+                    yield data
+                else:
+                    yield get_class(activity.table_name, data)(**data)
 
         def __repr__(self):
             return (
@@ -153,6 +500,150 @@ def activity_base(Base, schema, transaction_cls):
     return ActivityBase
 
 
+def activity_staging_table(metadata, schema, unlogged=False):
+    return sa.Table(
+        'activity_staging',
+        metadata,
+        sa.Column('id', sa.BigInteger, primary_key=True, autoincrement=False),
+        sa.Column('schema_name', sa.Text),
+        sa.Column('table_name', sa.Text),
+        sa.Column('relid', sa.Integer),
+        sa.Column('issued_at', sa.DateTime),
+        sa.Column('native_transaction_id', XID8()),
+        sa.Column('transaction_id', sa.BigInteger),
+        sa.Column('verb', sa.Text),
+        sa.Column('old_data', JSONB),
+        sa.Column('new_data', JSONB),
+        sa.Column('excluded_cols', sa.ARRAY(sa.Text)),
+        sa.Column('key_cols', sa.ARRAY(sa.Text)),
+        schema=schema,
+        prefixes=['UNLOGGED'] if unlogged else []
+    )
+
+
+def activity_checkpoint_table(metadata, schema):
+    return sa.Table(
+        'activity_checkpoint',
+        metadata,
+        sa.Column('relid', sa.Integer, primary_key=True),
+        sa.Column('record_key', JSONB, primary_key=True),
+        sa.Column('activity_id', sa.BigInteger, primary_key=True),
+        sa.Column('issued_at', sa.DateTime),
+        sa.Column('data', JSONB),
+        schema=schema
+    )
+
+
+def record_state(
+    activity_table,
+    checkpoint_table,
+    relid,
+    record_key,
+    activity_bound,
+    checkpoint_bound
+):
+    """
+    Return an SQL expression for the state of the record with given record
+    key after the activities matching `activity_bound`, or NULL if the record
+    did not exist. The state is built from the latest checkpoint matching
+    `checkpoint_bound`, or from the latest delete if there has been one since,
+    by merging the ``old_data`` and ``changed_data`` of the activities after
+    it.
+    """
+    activity = activity_table.c
+    checkpoint = checkpoint_table.c
+    activities = sa.and_(
+        activity.relid == relid,
+        activity.record_key == record_key,
+        activity_bound
+    )
+    latest_checkpoint = (
+        sa.select(checkpoint.activity_id, checkpoint.data)
+        .where(
+            checkpoint.relid == relid,
+            checkpoint.record_key == record_key,
+            checkpoint_bound
+        )
+        .order_by(checkpoint.activity_id.desc())
+        .limit(1)
+        .correlate_except(checkpoint_table)
+    )
+    checkpoint_id = latest_checkpoint.with_only_columns(
+        checkpoint.activity_id
+    ).scalar_subquery()
+    checkpoint_data = latest_checkpoint.with_only_columns(
+        checkpoint.data
+    ).scalar_subquery()
+    last_verb = (
+        sa.select(activity.verb)
+        .where(activities)
+        .order_by(activity.id.desc())
+        .limit(1)
+        .correlate_except(activity_table)
+        .scalar_subquery()
+    )
+    last_delete_id = (
+        sa.select(sa.func.max(activity.id))
+        .where(activities, activity.verb == 'delete')
+        .correlate_except(activity_table)
+        .scalar_subquery()
+    )
+    base_id = sa.func.greatest(checkpoint_id, last_delete_id)
+    entry = sa.func.jsonb_each(
+        activity.old_data.op('||')(activity.changed_data)
+    ).table_valued('key', 'value')
+    # Of duplicate keys jsonb_object_agg keeps the last value.
+    changes = (
+        sa.select(
+            sa.func.jsonb_object_agg(
+                entry.c.key,
+                aggregate_order_by(entry.c.value, activity.id)
+            )
+        )
+        .select_from(activity_table)
+        .join(entry, sa.true())
+        .where(activities, sa.or_(base_id.is_(None), activity.id > base_id))
+        .correlate_except(activity_table)
+        .scalar_subquery()
+    )
+    empty = sa.func.jsonb_build_object()
+    base_data = sa.case(
+        (
+            sa.or_(last_delete_id.is_(None), checkpoint_id > last_delete_id),
+            sa.func.coalesce(checkpoint_data, empty)
+        ),
+        else_=empty
+    )
+    return sa.case(
+        (sa.or_(last_verb.is_(None), last_verb == 'delete'), sa.null()),
+        else_=base_data.op('||')(sa.func.coalesce(changes, empty))
+    )
+
+
+def truncate_to_interval(value, interval):
+    value = datetime(value.year, value.month, value.day)
+    if interval == 'week':
+        value -= timedelta(days=value.weekday())
+    elif interval == 'month':
+        value = value.replace(day=1)
+    elif interval == 'year':
+        value = value.replace(month=1, day=1)
+    return value
+
+
+def next_interval(value, interval):
+    if interval == 'day':
+        return value + timedelta(days=1)
+    elif interval == 'week':
+        return value + timedelta(days=7)
+    elif interval == 'month':
+        return value.replace(
+            year=value.year + value.month // 12,
+            month=value.month % 12 + 1
+        )
+    return value.replace(year=value.year + 1)
+
+
 def convert_callables(values):
     return {
         key: value() if callable(value) else value
@@ -167,8 +658,31 @@ class VersioningManager(object):
         self,
         actor_cls=None,
         schema_name=None,
-        use_statement_level_triggers=True
+        use_statement_level_triggers=True,
+        partitioned=False,
+        use_generated_trigger_functions=False,
+        use_transaction_settings=False,
+        activity_id_strategy='sequence',
+        activity_id_cache=None,
+        use_staging_table=False,
+        unlogged_staging_table=False,
+        actor_indexes=False,
+        index_profile=None,
+        checkpoint_intervals=None
     ):
+        if activity_id_strategy not in ACTIVITY_ID_STRATEGIES:
+            raise ImproperlyConfigured(
+                'Unknown activity id strategy {!r}. Available strategies '
+                'are {}.'.format(
+                    activity_id_strategy,
+                    ', '.join(ACTIVITY_ID_STRATEGIES)
+                )
+            )
+        if use_staging_table and use_generated_trigger_functions:
+            raise ImproperlyConfigured(
+                'Generated trigger functions can not be used together with '
+                'the staging table.'
+            )
         if actor_cls is not None:
             self._actor_cls = actor_cls
         self.values = {}
@@ -190,9 +704,25 @@ class VersioningManager(object):
             ),
         )
         self.schema_name = schema_name
+        self.partitioned = partitioned
+        self.use_statement_level_triggers = use_statement_level_triggers
+        self.use_generated_trigger_functions = (
+            use_generated_trigger_functions
+        )
+        self.use_transaction_settings = use_transaction_settings
+        self.activity_id_strategy = activity_id_strategy
+        self.activity_id_cache = activity_id_cache
+        self.use_staging_table = use_staging_table
+        self.unlogged_staging_table = unlogged_staging_table
+        self.actor_indexes = actor_indexes
+        self.index_profile = index_profile
+        self.checkpoint_intervals = checkpoint_intervals
         self.table_listeners = self.get_table_listeners()
         self.pending_classes = WeakSet()
-        self.use_statement_level_triggers = use_statement_level_triggers
+        self._audited_attributes = WeakKeyDictionary()
+        self.audited_tables = WeakKeyDictionary()
+        self.activity_values_transactions = WeakSet()
+        self._transaction_stmts = {}
 
     def get_transaction_values(self):
         return self.values
@@ -214,10 +744,6 @@ class VersioningManager(object):
             )
 
     def render_tmpl(self, tmpl_name):
-        file_contents = read_file(
-            'templates/{}'.format(tmpl_name)
-        ).replace('$$', '$$$$')
-        tmpl = string.Template(file_contents)
         context = dict(schema_name=self.schema_name)
 
         if self.schema_name is None:
@@ -229,32 +755,926 @@ class VersioningManager(object):
                 'REVOKE ALL ON {schema_prefix}activity FROM public;'
             ).format(**context)
 
-        temp = tmpl.substitute(**context)
-        return temp
+        if self.use_transaction_settings:
+            context['transaction_id'] = (
+                '(SELECT {schema_prefix}get_transaction_id())'
+            ).format(**context)
+        else:
+            context['transaction_id'] = (
+                '(SELECT id FROM {schema_prefix}transaction '
+                'WHERE native_transaction_id = pg_current_xact_id())'
+            ).format(**context)
+
+        if self.activity_id_strategy == 'time_ordered':
+            context['activity_id'] = (
+                '{schema_prefix}activity_id()'
+            ).format(**context)
+        else:
+            context['activity_id'] = (
+                "nextval('{schema_prefix}activity_id_seq')"
+            ).format(**context)
+        # For templates building SQL within string literals.
+        context['escaped_activity_id'] = context['activity_id'].replace(
+            "'", "''"
+        )
+        context['activity_id_cache'] = self.activity_id_cache or 1
 
-    def create_operators(self, target, bind, **kwargs):
-        bind.execute(text(self.render_tmpl('operators.sql')))
+        return render_template(tmpl_name, tuple(sorted(context.items())))
 
-    def create_audit_table(self, target, bind, **kwargs):
-        sql = ''
+    def sql_objects(self):
+        """
+        Return the SQL objects installed by this manager as a list of
+        ``(name, sql)`` tuples, in the order in which they are installed.
+        """
         if self.use_statement_level_triggers:
-            sql += self.render_tmpl('create_activity_stmt_level.sql')
-            sql += self.render_tmpl('audit_table_stmt_level.sql')
+            level = 'stmt_level'
+        else:
+            level = 'row_level'
+        if self.use_staging_table:
+            create_activity = 'create_activity_staging_{}.sql'.format(level)
+        else:
+            create_activity = 'create_activity_{}.sql'.format(level)
+        if self.use_generated_trigger_functions:
+            audit_trigger_procedure = (
+                'create_table_activity_{}.sql'.format(level)
+            )
         else:
-            sql += self.render_tmpl('create_activity_row_level.sql')
-            sql += self.render_tmpl('audit_table_row_level.sql')
-        bind.execute(text(sql))
+            audit_trigger_procedure = 'audit_trigger_procedure.sql'
+
+        objects = [
+            ('jsonb_change_key_name', 'jsonb_change_key_name.sql'),
+            ('get_transaction_id', 'get_transaction_id.sql'),
+            ('record_key', 'record_key.sql'),
+            ('create_activity', create_activity),
+        ]
+        if self.use_staging_table:
+            objects.append(
+                ('drain_activity_staging', 'drain_activity_staging.sql')
+            )
+        if self.use_generated_trigger_functions:
+            objects.append(('audited_columns', 'audited_columns.sql'))
+        objects += [
+            ('audit_trigger_procedure', audit_trigger_procedure),
+            ('audit_trigger_exists', 'audit_trigger_exists.sql'),
+            ('audit_table', 'audit_table_{}.sql'.format(level)),
+            ('audit_tables', 'audit_tables.sql'),
+            ('operators', 'operators.sql'),
+        ]
+        return [
+            (name, self.render_tmpl(tmpl_name))
+            for name, tmpl_name in objects
+        ]
+
+    @property
+    def sql_object_table(self):
+        return sa.table(
+            'audit_sql_object',
+            sa.column('name'),
+            sa.column('checksum'),
+            sa.column('installed_at'),
+            schema=self.schema_name
+        )
+
+    def install_sql_objects(self, conn, force=False):
+        """
+        Install the SQL objects of this manager. The checksum of each
+        installed object is recorded in the ``audit_sql_object`` table, and
+        objects whose checksum matches the recorded one are skipped, so
+        calling this for an up to date database only costs a couple of round
+        trips. Changed objects are upgraded in place.
+
+        Returns the names of the objects that were installed.
+
+        :param conn:
+            An object that is able to execute SQL (either SQLAlchemy
+            Connection or Session)
+        :param force: Install all objects regardless of their checksums
+        """
+        conn.execute(text(self.render_tmpl('sql_object.sql')))
+        table = self.sql_object_table
+        installed = dict(
+            conn.execute(sa.select(table.c.name, table.c.checksum)).all()
+        )
+        changed = []
+        for name, sql in self.sql_objects():
+            checksum = hashlib.sha256(sql.encode('utf-8')).hexdigest()
+            if force or installed.get(name) != checksum:
+                conn.execute(text(sql))
+                changed.append({'name': name, 'checksum': checksum})
+        if changed:
+            stmt = insert(table).values(changed)
+            conn.execute(
+                stmt.on_conflict_do_update(
+                    index_elements=[table.c.name],
+                    set_={
+                        'checksum': stmt.excluded.checksum,
+                        'installed_at': sa.func.now()
+                    }
+                )
+            )
+        return [values['name'] for values in changed]
+
+    def create_audit_table(self, target, bind, **kwargs):
+        if self.activity_id_strategy == 'time_ordered':
+            bind.execute(text(self.render_tmpl('activity_id.sql')))
+        self.install_sql_objects(bind)
+
+    @property
+    def schema_prefix(self):
+        if self.schema_name is None:
+            return ''
+        return '{}.'.format(self.schema_name)
+
+    def min_activity_id(self, issued_at):
+        """
+        Return the smallest time ordered activity id an activity issued at
+        given time can have. As time ordered ids grow with ``issued_at``, the
+        returned id can be used for finding or deleting activities by time
+        using the primary key index of the activity table::
+
+            session.query(Activity).filter(
+                Activity.id < versioning_manager.min_activity_id(cutoff)
+            )
+
+        :param issued_at: Naive UTC datetime
+        """
+        if self.activity_id_strategy != 'time_ordered':
+            raise ImproperlyConfigured(
+                'Activity ids are only ordered by time when using the '
+                "'time_ordered' activity id strategy."
+            )
+        milliseconds = (issued_at - ACTIVITY_ID_EPOCH) // timedelta(
+            milliseconds=1
+        )
+        return milliseconds << ACTIVITY_ID_SEQUENCE_BITS
+
+    def actor_activities(self, actor_id, start=None, end=None):
+        """
+        Return a query for the activities of the transactions issued by given
+        actor within the half-open time window from `start` to `end`, ordered
+        by the issue time of their transactions and their ids::
+
+            activities = session.scalars(
+                versioning_manager.actor_activities(
+                    user.id,
+                    start=datetime(2024, 1, 1),
+                    end=datetime(2024, 2, 1)
+                )
+            ).all()
+
+        With ``actor_indexes=True`` the transactions are found with an
+        index-only scan of the ``ix_transaction_actor_id_issued_at`` index and
+        their activities with the ``ix_activity_transaction_id`` index.
+
+        :param actor_id: Id of the actor
+        :param start: Naive UTC datetime the transactions are issued at or
+            after, or None for no lower bound
+        :param end: Naive UTC datetime the transactions are issued before, or
+            None for no upper bound
+        """
+        Activity = self.activity_cls
+        Transaction = self.transaction_cls
+        query = (
+            sa.select(Activity)
+            .join(Transaction, Activity.transaction_id == Transaction.id)
+            .where(Transaction.actor_id == actor_id)
+        )
+        if start is not None:
+            query = query.where(Transaction.issued_at >= start)
+        if end is not None:
+            query = query.where(Transaction.issued_at < end)
+        return query.order_by(Transaction.issued_at, Activity.id)
+
+    def get_relid(self, table):
+        if hasattr(table, '__table__'):
+            table = table.__table__
+        if isinstance(table, sa.Table):
+            table = PGDialect().identifier_preparer.format_table(table)
+        return sa.cast(sa.cast(table, REGCLASS), sa.Integer)
+
+    def check_checkpoint_table(self):
+        if self.checkpoint_intervals is None:
+            raise ImproperlyConfigured(
+                'This manager does not have a checkpoint table. Pass '
+                'checkpoint_intervals to the VersioningManager for creating '
+                'one.'
+            )
+
+    def build_checkpoint_query(self, table_name, interval):
+        activity_table = self.activity_cls.__table__
+        activity = activity_table.c
+        checkpoint = self.checkpoint_table.c
+        checkpointed = activity_table.alias('checkpointed')
+        relid = self.get_relid(table_name)
+        latest_checkpoint = (
+            sa.select(
+                checkpoint.record_key,
+                sa.func.max(checkpoint.activity_id).label('activity_id')
+            )
+            .where(checkpoint.relid == relid)
+            .group_by(checkpoint.record_key)
+            .subquery()
+        )
+        pending = (
+            sa.select(
+                activity.record_key,
+                sa.func.max(activity.id).label('activity_id')
+            )
+            .select_from(
+                activity_table.outerjoin(
+                    latest_checkpoint,
+                    activity.record_key == latest_checkpoint.c.record_key
+                )
+            )
+            .where(
+                activity.relid == relid,
+                activity.record_key.isnot(None),
+                sa.or_(
+                    latest_checkpoint.c.activity_id.is_(None),
+                    activity.id > latest_checkpoint.c.activity_id
+                )
+            )
+            .group_by(activity.record_key)
+            .having(sa.func.count() >= interval)
+            .subquery()
+        )
+        states = (
+            sa.select(
+                pending.c.record_key,
+                pending.c.activity_id,
+                checkpointed.c.issued_at,
+                record_state(
+                    activity_table,
+                    self.checkpoint_table,
+                    relid,
+                    pending.c.record_key,
+                    activity.id <= pending.c.activity_id,
+                    checkpoint.activity_id <= pending.c.activity_id
+                ).label('data')
+            )
+            .join(checkpointed, checkpointed.c.id == pending.c.activity_id)
+            .subquery()
+        )
+        return self.checkpoint_table.insert().from_select(
+            ['relid', 'record_key', 'activity_id', 'issued_at', 'data'],
+            sa.select(
+                relid,
+                states.c.record_key,
+                states.c.activity_id,
+                states.c.issued_at,
+                states.c.data
+            ).where(states.c.data.isnot(None))
+        )
+
+    def create_checkpoints(self, conn, tables=None):
+        """
+        Store the full state of the records of the tables in
+        ``checkpoint_intervals`` which have at least as many activities since
+        their latest checkpoint as the interval of their table into the
+        activity_checkpoint table. Returns the number of checkpoints created.
+        Meant to be called periodically, for example from a scheduled job.
+
+        :param conn:
+            An object that is able to execute SQL (either SQLAlchemy
+            Connection or Session)
+        :param tables:
+            Optional names of the tables to create checkpoints for. Defaults
+            to all tables in ``checkpoint_intervals``.
+        """
+        self.check_checkpoint_table()
+        count = 0
+        for table_name, interval in self.checkpoint_intervals.items():
+            if tables is not None and table_name not in tables:
+                continue
+            count += conn.execute(
+                self.build_checkpoint_query(table_name, interval)
+            ).rowcount
+        return count
+
+    def reconstruct(self, conn, table, key, at=None):
+        """
+        Return the state of the record of given table with given primary key
+        as of given time as a dict, or None if the record did not exist at
+        that time. The state is built in a single query, starting from the
+        latest checkpoint of the record created before that time and merging
+        the ``old_data`` and ``changed_data`` of the later activities::
+
+            versioning_manager.reconstruct(
+                session,
+                Article,
+                article_id,
+                at=datetime(2024, 1, 1)
+            )
+
+        :param conn:
+            An object that is able to execute SQL (either SQLAlchemy
+            Connection or Session)
+        :param table:
+            Declarative class, :class:`~sqlalchemy.schema.Table` or name of
+            the table
+        :param key:
+            Primary key value of the record, or a sequence of them for
+            composite primary keys
+        :param at:
+            Naive UTC datetime, or None for the latest state
+        """
+        self.check_checkpoint_table()
+        if not isinstance(key, (list, tuple)):
+            key = [key]
+        activity = self.activity_cls.__table__.c
+        checkpoint = self.checkpoint_table.c
+        activity_bound = sa.true()
+        checkpoint_bound = sa.true()
+        if at is not None:
+            activity_bound = activity.issued_at <= at
+            checkpoint_bound = checkpoint.issued_at <= at
+        state = record_state(
+            self.activity_cls.__table__,
+            self.checkpoint_table,
+            self.get_relid(table),
+            sa.literal(list(key), JSONB),
+            activity_bound,
+            checkpoint_bound
+        )
+        return conn.execute(
+            sa.select(sa.type_coerce(state, JSONB))
+        ).scalar()
+
+    def drain_staging_table(self, conn, batch_size=1000):
+        """
+        Move a batch of the oldest changes from the activity_staging table
+        into the activity table. Returns the number of staged changes
+        processed, which is less than `batch_size` once the staging table has
+        been drained.
+
+        Staged changes locked by concurrent drains are skipped, so this can
+        be called from several connections at the same time.
+
+        :param conn:
+            An object that is able to execute SQL (either SQLAlchemy
+            Connection or Session)
+        :param batch_size: Maximum number of staged changes to process
+        """
+        return conn.execute(
+            text(
+                'SELECT {}drain_activity_staging(:batch_size)'.format(
+                    self.schema_prefix
+                )
+            ),
+            {'batch_size': batch_size}
+        ).scalar()
+
+    def drain(self, engine, batch_size=1000, workers=1):
+        """
+        Drain the activity_staging table using a pool of `workers` threads,
+        each of which moves batches of staged changes into the activity table
+        in transactions of their own until the staging table is empty.
+        Returns the total number of staged changes processed.
+
+        :param engine: SQLAlchemy Engine
+        :param batch_size: Maximum number of staged changes per transaction
+        :param workers: Number of threads draining the staging table
+        """
+        from concurrent.futures import ThreadPoolExecutor
+
+        def drain_batches():
+            processed = 0
+            while True:
+                with engine.begin() as conn:
+                    count = self.drain_staging_table(conn, batch_size)
+                processed += count
+                if count < batch_size:
+                    return processed
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(drain_batches) for _ in range(workers)
+            ]
+            return sum(future.result() for future in futures)
+
+    def build_export_query(
+        self,
+        tables=None,
+        actor_id=None,
+        start=None,
+        end=None
+    ):
+        Activity = self.activity_cls
+        Transaction = self.transaction_cls
+        query = (
+            sa.select(
+                Activity.id,
+                Activity.schema_name,
+                Activity.table_name,
+                Activity.issued_at,
+                Activity.verb,
+                Activity.old_data,
+                Activity.changed_data,
+                Activity.transaction_id,
+                Transaction.actor_id,
+                Transaction.client_addr
+            )
+            .outerjoin_from(
+                Activity,
+                Transaction,
+                Activity.transaction_id == Transaction.id
+            )
+            .order_by(Activity.id)
+        )
+        if tables is not None:
+            query = query.where(Activity.table_name.in_(tables))
+        if actor_id is not None:
+            query = query.where(Transaction.actor_id == actor_id)
+        if start is not None:
+            query = query.where(Activity.issued_at >= start)
+        if end is not None:
+            query = query.where(Activity.issued_at < end)
+        return query
+
+    def iter_export(
+        self,
+        conn,
+        tables=None,
+        actor_id=None,
+        start=None,
+        end=None,
+        batch_size=1000
+    ):
+        """
+        Iterate over the activities matching given filters, joined to their
+        transactions, as dicts ordered by activity id. The rows are fetched
+        from a server side cursor `batch_size` rows at a time, so only a
+        bounded number of them is held in memory at once. See :meth:`export`
+        for the filters.
+
+        :param conn:
+            An object that is able to execute SQL (either SQLAlchemy
+            Connection or Session)
+        :param batch_size: Number of rows to fetch at a time
+        """
+        query = self.build_export_query(tables, actor_id, start, end)
+        result = conn.execute(
+            query.execution_options(
+                stream_results=True,
+                max_row_buffer=batch_size
+            )
+        )
+        for row in result.mappings():
+            yield dict(row)
+
+    def export(
+        self,
+        conn,
+        file,
+        format='ndjson',
+        tables=None,
+        actor_id=None,
+        start=None,
+        end=None,
+        batch_size=1000,
+        use_copy=True
+    ):
+        """
+        Write the activities matching given filters, joined to the actor and
+        client address of their transactions, into given file ordered by
+        activity id. Returns the number of activities written.
+
+        The activities are written incrementally, so memory use stays bounded
+        regardless of the number of activities exported::
+
+            with open('activity.csv', 'w') as file:
+                versioning_manager.export(
+                    conn,
+                    file,
+                    format='csv',
+                    start=datetime(2024, 1, 1),
+                    end=datetime(2024, 7, 1)
+                )
+
+        With ``format='ndjson'`` each activity is written as a JSON object on
+        a line of its own, serialized by PostgreSQL and fetched from a server
+        side cursor. With ``format='csv'`` the activities are written with a
+        header row using ``COPY ... TO STDOUT`` when the database driver
+        supports it (psycopg2), and from a server side cursor otherwise.
+
+        :param conn:
+            An object that is able to execute SQL (either SQLAlchemy
+            Connection or Session)
+        :param file: File-like object opened in text mode
+        :param format: Either ``'ndjson'`` or ``'csv'``
+        :param tables: Optional names of the tables to export activities of
+        :param actor_id: Optional id of the actor to export activities of
+        :param start: Optional naive UTC datetime the activities are issued
+            at or after
+        :param end: Optional naive UTC datetime the activities are issued
+            before
+        :param batch_size: Number of rows to fetch from a server side cursor
+            at a time
+        :param use_copy: Whether to use ``COPY`` for CSV exports when
+            possible
+        """
+        if format not in EXPORT_FORMATS:
+            raise ValueError(
+                'Unknown export format {!r}. Available formats are {}.'.format(
+                    format,
+                    ', '.join(EXPORT_FORMATS)
+                )
+            )
+        if isinstance(conn, orm.Session):
+            conn = conn.connection()
+        query = self.build_export_query(tables, actor_id, start, end)
+        rows = query.subquery()
+        if format == 'ndjson':
+            query = sa.select(
+                sa.cast(sa.func.to_json(rows.table_valued()), sa.Text)
+            )
+        else:
+            query = sa.select(
+                *(sa.cast(column, sa.Text).label(column.name)
+                  for column in rows.c)
+            )
+        query = query.order_by(rows.c.id)
+        if format == 'csv' and use_copy and conn.dialect.driver == 'psycopg2':
+            return self.copy_export(conn, file, query)
+
+        result = conn.execute(
+            query.execution_options(
+                stream_results=True,
+                max_row_buffer=batch_size
+            )
+        )
+        count = 0
+        if format == 'ndjson':
+            for line in result.scalars():
+                file.write(line)
+                file.write('\n')
+                count += 1
+        else:
+            writer = csv.writer(file)
+            writer.writerow(result.keys())
+            for row in result:
+                writer.writerow(row)
+                count += 1
+        return count
+
+    def copy_export(self, conn, file, query):
+        compiled = query.compile(
+            dialect=conn.dialect,
+            compile_kwargs={'render_postcompile': True}
+        )
+        cursor = conn.connection.dbapi_connection.cursor()
+        try:
+            cursor.copy_expert(
+                'COPY ({}) TO STDOUT WITH (FORMAT csv, HEADER)'.format(
+                    cursor.mogrify(compiled.string, compiled.params).decode()
+                ),
+                file
+            )
+            return cursor.rowcount
+        finally:
+            cursor.close()
+
+    def create_default_partition(self, target, bind, **kwargs):
+        bind.execute(text(
+            'CREATE TABLE IF NOT EXISTS {0}activity_default '
+            'PARTITION OF {0}activity DEFAULT'.format(self.schema_prefix)
+        ))
+
+    def create_partition(self, conn, start, end, name=None):
+        """
+        Create a partition of the activity table holding the activities
+        issued within given half-open range. The partition is not created if
+        a partition with the same name already exists.
+
+        Activities within the range that have already ended up in the
+        ``activity_default`` partition are moved to the new partition. The
+        default partition is detached for the duration of the move, which
+        locks the activity table until the end of the transaction.
+
+        :param conn:
+            An object that is able to execute SQL (either SQLAlchemy
+            Connection or Session)
+        :param start: Inclusive lower bound of the partition
+        :param end: Exclusive upper bound of the partition
+        :param name:
+            Name of the partition. Defaults to ``activity_pYYYYMMDD`` where
+            the date is the lower bound of the partition.
+        """
+        if name is None:
+            name = 'activity_p{:%Y%m%d}'.format(start)
+        create_sql = (
+            "CREATE TABLE IF NOT EXISTS {0}{1} PARTITION OF {0}activity "
+            "FOR VALUES FROM ('{2}') TO ('{3}')".format(
+                self.schema_prefix,
+                name,
+                start.isoformat(' '),
+                end.isoformat(' ')
+            )
+        )
+        params = {
+            'name': '{}{}'.format(self.schema_prefix, name),
+            'default': '{}activity_default'.format(self.schema_prefix),
+            'start': start,
+            'end': end
+        }
+        partition_exists, default_exists = conn.execute(
+            text(
+                'SELECT to_regclass(:name) IS NOT NULL, '
+                'to_regclass(:default) IS NOT NULL'
+            ),
+            params
+        ).one()
+        if partition_exists or not default_exists or not conn.execute(
+            text(
+                'SELECT EXISTS (SELECT 1 FROM {}activity_default '
+                'WHERE issued_at >= :start AND issued_at < :end)'.format(
+                    self.schema_prefix
+                )
+            ),
+            params
+        ).scalar():
+            conn.execute(text(create_sql))
+            return name
+
+        # Creating the partition would violate the constraint of the default
+        # partition, so the matching rows are moved while it is detached.
+        conn.execute(text(
+            'ALTER TABLE {0}activity DETACH PARTITION {0}activity_default'
+            .format(self.schema_prefix)
+        ))
+        conn.execute(text(create_sql))
+        conn.execute(
+            text(
+                'WITH moved AS ('
+                'DELETE FROM {0}activity_default '
+                'WHERE issued_at >= :start AND issued_at < :end '
+                'RETURNING *'
+                ') INSERT INTO {0}{1} SELECT * FROM moved'.format(
+                    self.schema_prefix,
+                    name
+                )
+            ),
+            params
+        )
+        conn.execute(text(
+            'ALTER TABLE {0}activity ATTACH PARTITION {0}activity_default '
+            'DEFAULT'.format(self.schema_prefix)
+        ))
+        return name
+
+    def create_partitions(self, conn, count=1, interval='month', start=None):
+        """
+        Pre-create activity partitions for upcoming periods. Already existing
+        partitions are left untouched, which makes this function safe to call
+        periodically, for example from a scheduled job.
+
+        ::
+
+            # Make sure partitions exist for this month and the next two.
+            versioning_manager.create_partitions(conn, count=3)
+
+        :param conn:
+            An object that is able to execute SQL (either SQLAlchemy
+            Connection or Session)
+        :param count: Number of partitions to create
+        :param interval:
+            Period covered by a single partition. One of ``'day'``,
+            ``'week'``, ``'month'`` and ``'year'``.
+        :param start:
+            Datetime within the first period to create a partition for.
+            Defaults to the current UTC time.
+        """
+        if interval not in PARTITION_INTERVALS:
+            raise ValueError(
+                'Unknown partition interval {!r}. Expected one of {}.'.format(
+                    interval, ', '.join(PARTITION_INTERVALS)
+                )
+            )
+        if start is None:
+            start = datetime.now(timezone.utc).replace(tzinfo=None)
+        start = truncate_to_interval(start, interval)
+        names = []
+        for _ in range(count):
+            end = next_interval(start, interval)
+            names.append(self.create_partition(conn, start, end))
+            start = end
+        return names
+
+    def get_partitions(self, conn):
+        """
+        Return ``(name, start, end)`` tuples of the range partitions of the
+        activity table ordered by their lower bound. The default partition is
+        not included.
+
+        :param conn:
+            An object that is able to execute SQL (either SQLAlchemy
+            Connection or Session)
+        """
+        rows = conn.execute(
+            text(
+                'SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) '
+                'FROM pg_inherits i '
+                'JOIN pg_class c ON c.oid = i.inhrelid '
+                'WHERE i.inhparent = CAST(:parent AS regclass)'
+            ),
+            {'parent': '{}activity'.format(self.schema_prefix)}
+        )
+        partitions = []
+        for name, bound in rows:
+            match = PARTITION_BOUND_RE.search(bound)
+            if match:
+                partitions.append((
+                    name,
+                    datetime.fromisoformat(match.group('start')),
+                    datetime.fromisoformat(match.group('end'))
+                ))
+        return sorted(partitions, key=lambda partition: partition[1])
+
+    def detach_partitions(self, conn, before):
+        """
+        Detach all activity partitions containing only activities issued
+        before given datetime. Detached partitions become regular tables
+        which can be archived or dropped separately.
+
+        :param conn:
+            An object that is able to execute SQL (either SQLAlchemy
+            Connection or Session)
+        :param before: Datetime to compare partition upper bounds against
+        :return: Names of the detached partitions
+        """
+        names = []
+        for name, start, end in self.get_partitions(conn):
+            if end <= before:
+                conn.execute(text(
+                    'ALTER TABLE {0}activity DETACH PARTITION {0}{1}'.format(
+                        self.schema_prefix, name
+                    )
+                ))
+                names.append(name)
+        return names
+
+    def drop_partitions(self, conn, before):
+        """
+        Drop all activity partitions containing only activities issued before
+        given datetime. This makes removing old history a metadata operation
+        instead of a long running ``DELETE``.
+
+        ::
+
+            versioning_manager.drop_partitions(
+                conn,
+                before=(
+                    datetime.now(timezone.utc).replace(tzinfo=None) -
+                    timedelta(days=365)
+                )
+            )
+
+        :param conn:
+            An object that is able to execute SQL (either SQLAlchemy
+            Connection or Session)
+        :param before: Datetime to compare partition upper bounds against
+        :return: Names of the dropped partitions
+        """
+        names = self.detach_partitions(conn, before)
+        for name in names:
+            conn.execute(text(
+                'DROP TABLE {}{}'.format(self.schema_prefix, name)
+            ))
+        return names
+
+    def delete_in_batches(self, engine, table, condition, batch_size, sleep):
+        """
+        Delete the rows of given table matching given condition in batches of
+        at most `batch_size` rows in ascending id order, each in a transaction
+        of its own. Returns the number of rows deleted.
+        """
+        deleted = 0
+        last_id = None
+        while True:
+            batch = sa.select(table.c.id).where(condition)
+            if last_id is not None:
+                batch = batch.where(table.c.id > last_id)
+            batch = batch.order_by(table.c.id).limit(batch_size)
+            with engine.begin() as conn:
+                ids = conn.execute(
+                    table.delete()
+                    .where(table.c.id.in_(batch))
+                    .returning(table.c.id)
+                ).scalars().all()
+            deleted += len(ids)
+            if len(ids) < batch_size:
+                return deleted
+            last_id = max(ids)
+            if sleep:
+                time.sleep(sleep)
+
+    def prune(
+        self,
+        engine,
+        retention=None,
+        default_retention=None,
+        batch_size=1000,
+        sleep=0
+    ):
+        """
+        Delete the activities older than the retention period of their
+        table, and the transactions left without activities. Rows are
+        deleted in batches of ascending ids, each batch in a transaction of
+        its own, so that the tables are never locked for long::
+
+            versioning_manager.prune(
+                engine,
+                retention={'article': timedelta(days=90)},
+                default_retention=timedelta(days=365),
+                sleep=0.1
+            )
+
+        Returns a ``PruneResult`` named tuple with the numbers of
+        ``activities`` and ``transactions`` deleted and the ``duration`` of
+        the pruning in seconds.
+
+        Only transactions issued before the shortest retention period are
+        deleted. Looking up transactions without activities is fast only
+        when the ``transaction_id`` column of the activity table is indexed,
+        see the ``actor_indexes`` option.
+
+        :param engine: SQLAlchemy Engine
+        :param retention:
+            Dict mapping table names to the :class:`~datetime.timedelta` for
+            which their activities are kept
+        :param default_retention:
+            :class:`~datetime.timedelta` for which the activities of the
+            tables not in `retention` are kept, or None for keeping them
+            forever
+        :param batch_size: Maximum number of rows to delete per transaction
+        :param sleep: Number of seconds to sleep between batches
+        """
+        start = time.perf_counter()
+        retention = dict(retention or {})
+        periods = list(retention.values())
+        if default_retention is not None:
+            periods.append(default_retention)
+        if not periods:
+            return PruneResult(0, 0, time.perf_counter() - start)
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        activity = self.activity_cls.__table__
+        conditions = [
+            sa.and_(
+                activity.c.table_name == table_name,
+                activity.c.issued_at < now - period
+            )
+            for table_name, period in retention.items()
+        ]
+        if default_retention is not None:
+            conditions.append(
+                sa.and_(
+                    activity.c.table_name.notin_(list(retention)),
+                    activity.c.issued_at < now - default_retention
+                )
+            )
+        activities = self.delete_in_batches(
+            engine,
+            activity,
+            sa.or_(*conditions),
+            batch_size,
+            sleep
+        )
+
+        transaction = self.transaction_cls.__table__
+        conditions = [
+            transaction.c.issued_at < now - min(periods),
+            ~sa.exists().where(activity.c.transaction_id == transaction.c.id)
+        ]
+        if self.use_staging_table:
+            # Staged changes have not been moved to the activity table yet.
+            conditions.append(
+                ~sa.exists().where(
+                    self.staging_table.c.transaction_id == transaction.c.id
+                )
+            )
+        transactions = self.delete_in_batches(
+            engine,
+            transaction,
+            sa.and_(*conditions),
+            batch_size,
+            sleep
+        )
+        return PruneResult(
+            activities,
+            transactions,
+            time.perf_counter() - start
+        )
 
     def get_table_listeners(self):
         listeners = {'transaction': []}
 
         listeners['activity'] = [
-            ('after_create', sa.schema.DDL(
-                self.render_tmpl('jsonb_change_key_name.sql')
-            )),
             ('after_create', self.create_audit_table),
-            ('after_create', self.create_operators)
         ]
+        if self.partitioned:
+            listeners['activity'].append(
+                ('after_create', self.create_default_partition)
+            )
         if self.schema_name is not None:
             listeners['transaction'] = [
                 ('before_create', sa.schema.DDL(
@@ -266,39 +1686,108 @@ class VersioningManager(object):
             ]
         return listeners
 
+    def check_exclude_columns(self, table, exclude_columns):
+        for column in exclude_columns or []:
+            if column not in table.c:
+                raise ImproperlyConfigured(
+                    "Could not configure versioning. Table '{}'' does "
+                    "not have a column named '{}'.".format(
+                        table.name, column
+                    )
+                )
+
+    def audit_function(self, name):
+        if self.schema_name is None:
+            return getattr(sa.func, name)
+        return getattr(getattr(sa.func, self.schema_name), name)
+
     def build_audit_table_query(self, table, exclude_columns=None):
         args = [table.name]
         if exclude_columns:
-            for column in exclude_columns:
-                if column not in table.c:
-                    raise ImproperlyConfigured(
-                        "Could not configure versioning. Table '{}'' does "
-                        "not have a column named '{}'.".format(
-                            table.name, column
-                        )
-                    )
+            self.check_exclude_columns(table, exclude_columns)
             args.append(array(exclude_columns))
+        return sa.select(self.audit_function('audit_table')(*args))
+
+    def build_audit_tables_query(self, tables):
+        preparer = PGDialect().identifier_preparer
+        config = {}
+        for table in tables:
+            exclude_columns = None
+            if isinstance(table, tuple):
+                table, exclude_columns = table
+            self.check_exclude_columns(table, exclude_columns)
+            config[preparer.format_table(table)] = list(exclude_columns or [])
+        return sa.select(
+            self.audit_function('audit_tables')(
+                sa.bindparam('tables', config, type_=JSONB)
+            )
+        )
 
-        if self.schema_name is None:
-            func = sa.func.audit_table
-        else:
-            func = getattr(getattr(sa.func, self.schema_name), 'audit_table')
-        return sa.select(func(*args))
+    def audit_tables(self, conn, tables):
+        """
+        Create the audit triggers of given tables in a single round trip.
+        Triggers that are already up to date are left alone.
+
+        :param conn:
+            An object that is able to execute SQL (either SQLAlchemy
+            Connection or Session)
+        :param tables:
+            Iterable of SQLAlchemy Table objects or of (Table,
+            exclude_columns) tuples
+        """
+        tables = list(tables)
+        if tables:
+            conn.execute(self.build_audit_tables_query(tables))
 
     def audit_table(self, table, exclude_columns=None):
-        query = self.build_audit_table_query(
-            table=table, exclude_columns=exclude_columns
+        """
+        Audit given table once it has been created. Tables created by the
+        same ``MetaData.create_all`` call are audited all at once after all
+        of them have been created.
+
+        :param table: SQLAlchemy Table object
+        :param exclude_columns: Names of the columns not to audit
+        """
+        self.check_exclude_columns(table, exclude_columns)
+        self.audited_tables[table] = exclude_columns
+        listeners = (
+            (table, self.receive_table_after_create),
+            (table.metadata, self.receive_metadata_after_create),
         )
+        for target, fn in listeners:
+            if not sa.event.contains(target, 'after_create', fn):
+                sa.event.listen(target, 'after_create', fn)
+
+    def receive_table_after_create(self, target, connection, **kw):
+        if not kw.get('_is_metadata_operation'):
+            self.audit_tables(
+                connection,
+                [(target, self.audited_tables[target])]
+            )
 
-        @sa.event.listens_for(table, 'after_create')
-        def receive_after_create(target, connection, **kw):
-            connection.execute(query)
+    def receive_metadata_after_create(
+        self,
+        target,
+        connection,
+        tables=(),
+        **kw
+    ):
+        self.audit_tables(
+            connection,
+            [
+                (table, self.audited_tables[table])
+                for table in tables
+                if table in self.audited_tables
+            ]
+        )
 
     def set_activity_values(self, session):
+        if self.has_activity_values(session):
+            return
+
         transaction_mapper = sa.inspect(self.transaction_cls)
         engine = session.get_bind(transaction_mapper)
         dialect = engine.dialect
-        table = self.transaction_cls.__table__
 
         if not isinstance(dialect, PGDialect):
             warnings.warn(
@@ -310,6 +1799,59 @@ class VersioningManager(object):
 
         values = convert_callables(self.get_transaction_values())
         if values:
+            if self.use_transaction_settings:
+                # The transaction row is created by the audit trigger once
+                # the transaction changes an audited table.
+                stmt = sa.select(
+                    sa.func.set_config(
+                        'postgresql_audit.transaction_values',
+                        json.dumps(values, default=str),
+                        True
+                    )
+                )
+                session.execute(stmt)
+            else:
+                stmt = self.transaction_insert_stmt(tuple(sorted(values)))
+                session.execute(stmt, values)
+            self.activity_values_transactions.add(
+                session.get_nested_transaction() or session.get_transaction()
+            )
+
+    def has_activity_values(self, session):
+        """
+        Return whether the activity values have already been sent to the
+        database within the current transaction of given session.
+
+        Savepoints are tracked separately from their enclosing transaction, so
+        that the values are sent again after rolling back to a savepoint.
+
+        :param session: SQLAlchemy session object
+        """
+        transaction = (
+            session.get_nested_transaction() or session.get_transaction()
+        )
+        while transaction is not None:
+            if transaction in self.activity_values_transactions:
+                return True
+            transaction = transaction.parent
+        return False
+
+    def transaction_insert_stmt(self, keys):
+        """
+        Return the statement inserting a row with given keys into the
+        transaction table. The statements are cached per set of keys, so that
+        SQLAlchemy only needs to compile each of them once.
+
+        :param keys: tuple of transaction table column names
+        """
+        try:
+            return self._transaction_stmts[keys]
+        except KeyError:
+            table = self.transaction_cls.__table__
+            values = {
+                key: sa.bindparam(key, type_=table.c[key].type)
+                for key in keys
+            }
             values['native_transaction_id'] = sa.func.pg_current_xact_id()
             values['issued_at'] = sa.text("now() AT TIME ZONE 'UTC'")
             stmt = (
@@ -319,7 +1861,8 @@ class VersioningManager(object):
                     constraint='transaction_unique_native_tx_id'
                 )
             )
-            session.execute(stmt)
+            self._transaction_stmts[keys] = stmt
+            return stmt
 
     def modified_columns(self, obj):
         columns = set()
@@ -337,21 +1880,62 @@ class VersioningManager(object):
                 )
         return columns
 
+    def audited_attributes(self, cls):
+        """
+        Return a dict mapping the keys of the attributes of given versioned
+        class to the names of the audited columns they are mapped to.
+        Attributes mapped only to excluded columns are left out. The mapping
+        is computed once per class.
+
+        :param cls: Versioned declarative class
+        """
+        try:
+            return self._audited_attributes[cls]
+        except KeyError:
+            pass
+        excluded = set(cls.__versioned__.get('exclude', []))
+        mapper = sa.inspect(cls)
+        attributes = {}
+        for key, prop in mapper.attrs.items():
+            if key in mapper.synonyms:
+                continue
+            if isinstance(prop, sa.orm.ColumnProperty):
+                columns = prop.columns
+            else:
+                columns = [local for local, remote in prop.local_remote_pairs]
+            names = tuple(
+                column.name for column in columns
+                if isinstance(column, sa.Column) and
+                column.name not in excluded
+            )
+            if names:
+                attributes[key] = names
+        self._audited_attributes[cls] = attributes
+        return attributes
+
     def is_modified(self, obj_or_session):
         if hasattr(obj_or_session, '__mapper__'):
             if not hasattr(obj_or_session, '__versioned__'):
                 raise ClassNotVersioned(obj_or_session.__class__.__name__)
-            excluded = obj_or_session.__versioned__.get('exclude', [])
-            return bool(
-                set([
-                    column.name
-                    for column in self.modified_columns(obj_or_session)
-                ]) - set(excluded)
+            attributes = self.audited_attributes(obj_or_session.__class__)
+            state = sa.inspect(obj_or_session)
+            # Only the attributes that have been set since the object was
+            # loaded have an entry in committed_state.
+            return any(
+                key in attributes and state.attrs[key].history.has_changes()
+                for key in state.committed_state
             )
         else:
+            # Only the pending, modified and deleted objects can have changes,
+            # so there's no need to go through the whole identity map.
+            if any(
+                hasattr(entity, '__versioned__')
+                for entity in obj_or_session.deleted
+            ):
+                return True
             return any(
-                self.is_modified(entity) or entity in obj_or_session.deleted
-                for entity in obj_or_session
+                self.is_modified(entity)
+                for entity in chain(obj_or_session.new, obj_or_session.dirty)
                 if hasattr(entity, '__versioned__')
             )
 
@@ -376,7 +1960,10 @@ class VersioningManager(object):
         """
         for cls in self.pending_classes:
             self.audit_table(cls.__table__, cls.__versioned__.get('exclude'))
+            self.audited_attributes(cls)
         assign_actor(self.base, self.transaction_cls, self.actor_cls)
+        if self.actor_indexes:
+            index_actor(self.transaction_cls)
 
     def attach_table_listeners(self):
         for values in self.table_listeners['transaction']:
@@ -425,7 +2012,16 @@ class VersioningManager(object):
             sa.event.remove(*listener)
 
     def activity_model_factory(self, base, transaction_cls):
-        class Activity(activity_base(base, self.schema_name, transaction_cls)):
+        class Activity(activity_base(
+            base,
+            self.schema_name,
+            transaction_cls,
+            partitioned=self.partitioned,
+            id_strategy=self.activity_id_strategy,
+            id_cache=self.activity_id_cache,
+            actor_indexes=self.actor_indexes,
+            index_profile=self.index_profile
+        )):
             __tablename__ = 'activity'
 
         return Activity
@@ -438,11 +2034,23 @@ class VersioningManager(object):
 
     def init(self, base):
         self.base = base
+        self._transaction_stmts = {}
         self.transaction_cls = self.transaction_model_factory(base)
         self.activity_cls = self.activity_model_factory(
             base,
             self.transaction_cls
         )
+        if self.use_staging_table:
+            self.staging_table = activity_staging_table(
+                base.metadata,
+                self.schema_name,
+                unlogged=self.unlogged_staging_table
+            )
+        if self.checkpoint_intervals is not None:
+            self.checkpoint_table = activity_checkpoint_table(
+                base.metadata,
+                self.schema_name
+            )
         self.attach_listeners()
 
 
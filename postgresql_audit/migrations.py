@@ -1,23 +1,272 @@
 import sqlalchemy as sa
-from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.dialects.postgresql import ARRAY, array, JSONB
 
 from .expressions import jsonb_change_key_name
 
 
-def get_activity_table(schema=None):
+def get_activity_table(schema=None, indexes=()):
     return sa.Table(
         'activity',
         sa.MetaData(),
         sa.Column('id', sa.Integer, primary_key=True),
         sa.Column('table_name', sa.String),
+        sa.Column('issued_at', sa.DateTime),
         sa.Column('verb', sa.String),
         sa.Column('old_data', JSONB),
         sa.Column('changed_data', JSONB),
+        sa.Column('record_key', JSONB),
+        *indexes,
         schema=schema,
     )
 
 
-def alter_column(conn, table, column_name, func, schema=None):
+def create_activity_indexes(
+    conn,
+    index_profile,
+    schema=None,
+    concurrently=False
+):
+    """
+    Create the indexes of given index profile on an existing activity table.
+    Indexes that already exist are left alone. Returns the names of the
+    indexes of the profile.
+
+    ::
+
+        from alembic import op
+        from postgresql_audit import create_activity_indexes, IndexProfile
+
+
+        def upgrade():
+            create_activity_indexes(
+                op,
+                IndexProfile(brin=['issued_at', 'id'], gin=['changed_data'])
+            )
+
+    Pass `concurrently=True` for creating the indexes without blocking writes
+    to the activity table. ``CREATE INDEX CONCURRENTLY`` can't run inside a
+    transaction block, so `conn` has to be in autocommit mode then, and the
+    activity table can't be a partitioned table.
+
+    :param conn:
+        An object that is able to execute SQL (either SQLAlchemy Connection,
+        Engine or Alembic Operations object)
+    :param index_profile:
+        :class:`~postgresql_audit.IndexProfile` describing the indexes
+    :param schema:
+        Optional name of schema to use.
+    :param concurrently:
+        Whether to create the indexes with ``CREATE INDEX CONCURRENTLY``
+    """
+    indexes = index_profile.indexes(concurrently=concurrently)
+    get_activity_table(schema=schema, indexes=indexes)
+    for index in indexes:
+        conn.execute(sa.schema.CreateIndex(index, if_not_exists=True))
+    return [index.name for index in indexes]
+
+
+def get_migration_chunk_table(schema=None):
+    return sa.Table(
+        'activity_migration_chunk',
+        sa.MetaData(),
+        sa.Column('name', sa.Text, primary_key=True),
+        sa.Column('start_id', sa.BigInteger, primary_key=True),
+        sa.Column('end_id', sa.BigInteger, nullable=False),
+        sa.Column('completed_at', sa.DateTime),
+        schema=schema,
+    )
+
+
+def plan_migration_chunks(
+    conn,
+    query,
+    activity_table,
+    chunk_table,
+    name,
+    chunk_size
+):
+    """
+    Split the activities matched by given UPDATE query into ranges of
+    `chunk_size` consecutive ids and store them into the chunk table, unless
+    a migration with given name has already been planned.
+    """
+    conn.execute(
+        sa.select(sa.func.pg_advisory_xact_lock(sa.func.hashtext(name)))
+    )
+    planned = conn.execute(
+        sa.select(sa.func.count())
+        .where(chunk_table.c.name == name)
+    ).scalar()
+    if planned:
+        return
+    numbered = (
+        sa.select(
+            activity_table.c.id,
+            sa.func.row_number().over(
+                order_by=activity_table.c.id
+            ).label('number')
+        )
+        .where(query.whereclause)
+        .subquery()
+    )
+    start_ids = conn.execute(
+        sa.select(numbered.c.id)
+        .where((numbered.c.number - 1) % chunk_size == 0)
+        .order_by(numbered.c.id)
+    ).scalars().all()
+    if not start_ids:
+        return
+    max_id = conn.execute(
+        sa.select(sa.func.max(activity_table.c.id))
+        .where(query.whereclause)
+    ).scalar()
+    end_ids = start_ids[1:] + [max_id + 1]
+    conn.execute(
+        chunk_table.insert(),
+        [
+            {'name': name, 'start_id': start_id, 'end_id': end_id}
+            for start_id, end_id in zip(start_ids, end_ids)
+        ]
+    )
+
+
+def execute_migration(
+    conn,
+    query,
+    activity_table,
+    name,
+    chunk_size=None,
+    workers=1,
+    progress=None,
+    checkpoint=None
+):
+    """
+    Execute given UPDATE query against the activity table. By default the
+    query is executed as a single statement. When `chunk_size` is given, the
+    activities are instead updated in ranges of `chunk_size` consecutive ids,
+    each in a transaction of its own.
+
+    The ranges are planned when the migration starts and stored in the
+    ``activity_migration_chunk`` table, where each range is marked as
+    completed in the same transaction that updates its activities. If the
+    migration is interrupted, running it again with the same checkpoint name
+    resumes it from the ranges that have not been completed yet. The ranges
+    are removed once all of them have been completed. Activities created after
+    the migration has been planned are not updated.
+
+    Returns the number of updated activities when `chunk_size` is given, and
+    the result of the query otherwise.
+
+    :param conn:
+        An object that is able to execute SQL. Must be an SQLAlchemy Engine
+        when `chunk_size` is given.
+    :param query:
+        The UPDATE query to execute
+    :param activity_table:
+        The activity table updated by the query
+    :param name:
+        Default checkpoint name of the migration
+    :param chunk_size:
+        Optional number of activities to update per transaction
+    :param workers:
+        Number of connections updating disjoint ranges in parallel
+    :param progress:
+        Optional callable called after each completed range with the number of
+        completed ranges and the total number of ranges. When using multiple
+        workers it is called from the worker threads.
+    :param checkpoint:
+        Name identifying the migration in the ``activity_migration_chunk``
+        table. Defaults to a name derived from the migration arguments.
+    """
+    if chunk_size is None:
+        return conn.execute(query)
+    if not isinstance(conn, sa.engine.Engine):
+        raise ValueError(
+            'Migrations can be run in chunks only using an Engine, since '
+            'each chunk is committed separately.'
+        )
+    from concurrent.futures import ThreadPoolExecutor
+    from threading import Lock
+
+    name = checkpoint or name
+    chunk_table = get_migration_chunk_table(schema=activity_table.schema)
+    with conn.begin() as connection:
+        chunk_table.create(connection, checkfirst=True)
+    with conn.begin() as connection:
+        plan_migration_chunks(
+            connection,
+            query,
+            activity_table,
+            chunk_table,
+            name,
+            chunk_size
+        )
+        completed, total = connection.execute(
+            sa.select(
+                sa.func.count(chunk_table.c.completed_at),
+                sa.func.count()
+            )
+            .where(chunk_table.c.name == name)
+        ).one()
+    state = {'completed': completed}
+    lock = Lock()
+
+    def update_chunks():
+        rowcount = 0
+        while True:
+            with conn.begin() as connection:
+                chunk = connection.execute(
+                    sa.select(chunk_table.c.start_id, chunk_table.c.end_id)
+                    .where(
+                        chunk_table.c.name == name,
+                        chunk_table.c.completed_at.is_(None)
+                    )
+                    .order_by(chunk_table.c.start_id)
+                    .limit(1)
+                    .with_for_update(skip_locked=True)
+                ).first()
+                if chunk is None:
+                    return rowcount
+                rowcount += connection.execute(
+                    query.where(
+                        activity_table.c.id >= chunk.start_id,
+                        activity_table.c.id < chunk.end_id
+                    )
+                ).rowcount
+                connection.execute(
+                    chunk_table.update()
+                    .where(
+                        chunk_table.c.name == name,
+                        chunk_table.c.start_id == chunk.start_id
+                    )
+                    .values(completed_at=sa.func.now())
+                )
+            if progress is not None:
+                with lock:
+                    state['completed'] += 1
+                    progress(state['completed'], total)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(update_chunks) for _ in range(workers)]
+        rowcount = sum(future.result() for future in futures)
+    with conn.begin() as connection:
+        connection.execute(
+            chunk_table.delete().where(chunk_table.c.name == name)
+        )
+    return rowcount
+
+
+def alter_column(
+    conn,
+    table,
+    column_name,
+    func,
+    schema=None,
+    chunk_size=None,
+    workers=1,
+    progress=None,
+    checkpoint=None
+):
     """
     Run given callable against given table and given column in activity table
     jsonb data columns. This function is useful when you want to reflect type
@@ -61,6 +310,15 @@ def alter_column(conn, table, column_name, func, schema=None):
         corresponding to given column_name and activity table object.
     :param schema:
         Optional name of schema to use.
+    :param chunk_size:
+        Optional number of activities to update per transaction. See
+        :func:`execute_migration`.
+    :param workers:
+        Number of connections updating the activities in parallel
+    :param progress:
+        Optional callable called after each completed chunk
+    :param checkpoint:
+        Optional name for resuming an interrupted chunked migration
     """
     activity_table = get_activity_table(schema=schema)
     query = (
@@ -90,7 +348,16 @@ def alter_column(conn, table, column_name, func, schema=None):
         )
         .where(activity_table.c.table_name == table)
     )
-    return conn.execute(query)
+    return execute_migration(
+        conn,
+        query,
+        activity_table,
+        'alter_column:{}:{}'.format(table, column_name),
+        chunk_size=chunk_size,
+        workers=workers,
+        progress=progress,
+        checkpoint=checkpoint
+    )
 
 
 def change_column_name(
@@ -98,7 +365,11 @@ def change_column_name(
     table,
     old_column_name,
     new_column_name,
-    schema=None
+    schema=None,
+    chunk_size=None,
+    workers=1,
+    progress=None,
+    checkpoint=None
 ):
     """
     Changes given `activity` jsonb data column key. This function is useful
@@ -131,6 +402,15 @@ def change_column_name(
         New colum name
     :param schema:
         Optional name of schema to use.
+    :param chunk_size:
+        Optional number of activities to update per transaction. See
+        :func:`execute_migration`.
+    :param workers:
+        Number of connections updating the activities in parallel
+    :param progress:
+        Optional callable called after each completed chunk
+    :param checkpoint:
+        Optional name for resuming an interrupted chunked migration
     """
     activity_table = get_activity_table(schema=schema)
     query = (
@@ -150,10 +430,33 @@ def change_column_name(
         )
         .where(activity_table.c.table_name == table)
     )
-    return conn.execute(query)
+    return execute_migration(
+        conn,
+        query,
+        activity_table,
+        'change_column_name:{}:{}:{}'.format(
+            table,
+            old_column_name,
+            new_column_name
+        ),
+        chunk_size=chunk_size,
+        workers=workers,
+        progress=progress,
+        checkpoint=checkpoint
+    )
 
 
-def add_column(conn, table, column_name, default_value=None, schema=None):
+def add_column(
+    conn,
+    table,
+    column_name,
+    default_value=None,
+    schema=None,
+    chunk_size=None,
+    workers=1,
+    progress=None,
+    checkpoint=None
+):
     """
     Adds given column to `activity` table jsonb data columns.
 
@@ -183,6 +486,15 @@ def add_column(conn, table, column_name, default_value=None, schema=None):
         The default value of the column
     :param schema:
         Optional name of schema to use.
+    :param chunk_size:
+        Optional number of activities to update per transaction. See
+        :func:`execute_migration`.
+    :param workers:
+        Number of connections updating the activities in parallel
+    :param progress:
+        Optional callable called after each completed chunk
+    :param checkpoint:
+        Optional name for resuming an interrupted chunked migration
     """
     activity_table = get_activity_table(schema=schema)
     data = {column_name: default_value}
@@ -213,10 +525,28 @@ def add_column(conn, table, column_name, default_value=None, schema=None):
         )
         .where(activity_table.c.table_name == table)
     )
-    return conn.execute(query)
+    return execute_migration(
+        conn,
+        query,
+        activity_table,
+        'add_column:{}:{}'.format(table, column_name),
+        chunk_size=chunk_size,
+        workers=workers,
+        progress=progress,
+        checkpoint=checkpoint
+    )
 
 
-def remove_column(conn, table, column_name, schema=None):
+def remove_column(
+    conn,
+    table,
+    column_name,
+    schema=None,
+    chunk_size=None,
+    workers=1,
+    progress=None,
+    checkpoint=None
+):
     """
     Removes given `activity` jsonb data column key. This function is useful
     when you are doing schema changes that require removing a column.
@@ -245,6 +575,15 @@ def remove_column(conn, table, column_name, schema=None):
         Name of the column to remove
     :param schema:
         Optional name of schema to use.
+    :param chunk_size:
+        Optional number of activities to update per transaction. See
+        :func:`execute_migration`.
+    :param workers:
+        Number of connections updating the activities in parallel
+    :param progress:
+        Optional callable called after each completed chunk
+    :param checkpoint:
+        Optional name for resuming an interrupted chunked migration
     """
     activity_table = get_activity_table(schema=schema)
     remove = sa.cast(column_name, sa.Text)
@@ -257,10 +596,28 @@ def remove_column(conn, table, column_name, schema=None):
         )
         .where(activity_table.c.table_name == table)
     )
-    return conn.execute(query)
+    return execute_migration(
+        conn,
+        query,
+        activity_table,
+        'remove_column:{}:{}'.format(table, column_name),
+        chunk_size=chunk_size,
+        workers=workers,
+        progress=progress,
+        checkpoint=checkpoint
+    )
 
 
-def rename_table(conn, old_table_name, new_table_name, schema=None):
+def rename_table(
+    conn,
+    old_table_name,
+    new_table_name,
+    schema=None,
+    chunk_size=None,
+    workers=1,
+    progress=None,
+    checkpoint=None
+):
     """
     Renames given table in activity table. You should remember to call this
     function whenever you rename a versioned table.
@@ -285,6 +642,15 @@ def rename_table(conn, old_table_name, new_table_name, schema=None):
         New name of the renamed table
     :param schema:
         Optional name of schema to use.
+    :param chunk_size:
+        Optional number of activities to update per transaction. See
+        :func:`execute_migration`.
+    :param workers:
+        Number of connections updating the activities in parallel
+    :param progress:
+        Optional callable called after each completed chunk
+    :param checkpoint:
+        Optional name for resuming an interrupted chunked migration
     """
     activity_table = get_activity_table(schema=schema)
     query = (
@@ -293,4 +659,311 @@ def rename_table(conn, old_table_name, new_table_name, schema=None):
         .values(table_name=new_table_name)
         .where(activity_table.c.table_name == old_table_name)
     )
-    return conn.execute(query)
+    return execute_migration(
+        conn,
+        query,
+        activity_table,
+        'rename_table:{}:{}'.format(old_table_name, new_table_name),
+        chunk_size=chunk_size,
+        workers=workers,
+        progress=progress,
+        checkpoint=checkpoint
+    )
+
+
+class MigrationPlan(object):
+    """
+    Collects migration operations for the activities of given table and
+    compiles them into a single UPDATE, so that each activity is rewritten
+    once no matter how many operations the plan has. The operations are
+    applied in the order in which they were added.
+
+    ::
+
+        from alembic import op
+        from postgresql_audit import MigrationPlan
+
+
+        def upgrade():
+            plan = MigrationPlan('user')
+            plan.change_column_name('name', 'full_name')
+            plan.remove_column('nickname')
+            plan.alter_column(
+                'age',
+                lambda value, activity_table: sa.cast(value, sa.Integer)
+            )
+            plan.execute(op)
+
+    Unless the plan adds columns or renames the table, only the activities
+    whose ``old_data`` or ``changed_data`` contain any of the columns the plan
+    changes are rewritten. This condition can use GIN indexes on the
+    ``old_data`` and ``changed_data`` columns.
+
+    :param table:
+        The table to run the operations against
+    :param schema:
+        Optional name of schema to use.
+    """
+
+    def __init__(self, table, schema=None):
+        self.table = table
+        self.schema = schema
+        self.operations = []
+        self.new_table_name = None
+        # Column names mapped to the names they may have had before the
+        # operations of this plan renamed them.
+        self.original_names = {}
+
+    def add_operation(self, name, columns, operation):
+        """
+        Add an operation to this plan.
+
+        :param name: Name describing the operation
+        :param columns:
+            Names of the columns the operation changes, or ``None`` if the
+            operation changes all activities of the table
+        :param operation:
+            A callable taking the ``old_data`` and ``changed_data``
+            expressions and the activity table, and returning the new
+            ``old_data`` and ``changed_data`` expressions
+        """
+        if columns is None:
+            keys = None
+        else:
+            keys = set()
+            for column in columns:
+                keys.add(column)
+                keys.update(self.original_names.get(column, ()))
+        self.operations.append((name, keys, operation))
+        return self
+
+    def change_column_name(self, old_column_name, new_column_name):
+        """
+        Change given key of the jsonb data columns. See
+        :func:`change_column_name`.
+        """
+        def operation(old_data, changed_data, activity_table):
+            return (
+                jsonb_change_key_name(
+                    old_data,
+                    old_column_name,
+                    new_column_name
+                ),
+                jsonb_change_key_name(
+                    changed_data,
+                    old_column_name,
+                    new_column_name
+                )
+            )
+
+        self.add_operation(
+            'change_column_name:{}:{}'.format(
+                old_column_name,
+                new_column_name
+            ),
+            [old_column_name],
+            operation
+        )
+        self.original_names[new_column_name] = (
+            self.original_names.get(new_column_name, set()) |
+            self.original_names.get(old_column_name, set()) |
+            {old_column_name}
+        )
+        return self
+
+    def alter_column(self, column_name, func):
+        """
+        Run given callable against given key of the jsonb data columns. See
+        :func:`alter_column`. Unlike :func:`alter_column`, the key is left
+        alone in the data columns not containing it.
+        """
+        path = sa.cast(array([column_name]), ARRAY(sa.Text))
+
+        def alter(data, activity_table):
+            return sa.func.jsonb_set_lax(
+                data,
+                path,
+                sa.cast(sa.func.json_build_object(
+                    column_name,
+                    func(
+                        sa.type_coerce(data, JSONB)[column_name],
+                        activity_table
+                    )
+                ), JSONB)[column_name],
+                False,
+                'use_json_null',
+                type_=JSONB
+            )
+
+        def operation(old_data, changed_data, activity_table):
+            return (
+                alter(old_data, activity_table),
+                alter(changed_data, activity_table)
+            )
+
+        return self.add_operation(
+            'alter_column:{}'.format(column_name),
+            [column_name],
+            operation
+        )
+
+    def add_column(self, column_name, default_value=None):
+        """
+        Add given key to the jsonb data columns. See :func:`add_column`.
+        """
+        data = {column_name: default_value}
+
+        def operation(old_data, changed_data, activity_table):
+            return (
+                sa.case(
+                    (
+                        sa.cast(old_data, sa.Text) != '{}',
+                        sa.type_coerce(old_data, JSONB) + data
+                    ),
+                    else_=sa.cast({}, JSONB)
+                ),
+                sa.case(
+                    (
+                        sa.and_(
+                            sa.cast(changed_data, sa.Text) != '{}',
+                            activity_table.c.verb != 'update'
+                        ),
+                        sa.type_coerce(changed_data, JSONB) + data
+                    ),
+                    else_=changed_data
+                )
+            )
+
+        return self.add_operation(
+            'add_column:{}'.format(column_name),
+            None,
+            operation
+        )
+
+    def remove_column(self, column_name):
+        """
+        Remove given key from the jsonb data columns. See
+        :func:`remove_column`.
+        """
+        remove = sa.cast(column_name, sa.Text)
+
+        def operation(old_data, changed_data, activity_table):
+            return (
+                sa.type_coerce(old_data, JSONB) - remove,
+                sa.type_coerce(changed_data, JSONB) - remove
+            )
+
+        return self.add_operation(
+            'remove_column:{}'.format(column_name),
+            [column_name],
+            operation
+        )
+
+    def rename_table(self, new_table_name):
+        """
+        Rename the table of the activities. See :func:`rename_table`.
+        """
+        self.new_table_name = new_table_name
+        return self
+
+    @property
+    def name(self):
+        names = [name for name, keys, operation in self.operations]
+        if self.new_table_name is not None:
+            names.append('rename_table:{}'.format(self.new_table_name))
+        return 'migration_plan:{}:{}'.format(self.table, ','.join(names))
+
+    def query(self):
+        """
+        Return the UPDATE query running the operations of this plan.
+        """
+        activity_table = get_activity_table(schema=self.schema)
+        old_data = activity_table.c.old_data
+        changed_data = activity_table.c.changed_data
+        keys = set()
+        for name, operation_keys, operation in self.operations:
+            old_data, changed_data = operation(
+                old_data,
+                changed_data,
+                activity_table
+            )
+            if keys is not None and operation_keys is not None:
+                keys.update(operation_keys)
+            else:
+                keys = None
+
+        values = {}
+        if self.operations:
+            values['old_data'] = old_data
+            values['changed_data'] = changed_data
+        if self.new_table_name is not None:
+            values['table_name'] = self.new_table_name
+        query = (
+            activity_table
+            .update()
+            .values(**values)
+            .where(activity_table.c.table_name == self.table)
+        )
+        if self.new_table_name is None and keys is not None:
+            keys = sorted(keys)
+            query = query.where(
+                sa.or_(
+                    activity_table.c.old_data.has_any(
+                        sa.cast(array(keys), ARRAY(sa.Text))
+                    ),
+                    activity_table.c.changed_data.has_any(
+                        sa.cast(array(keys), ARRAY(sa.Text))
+                    )
+                )
+            )
+        return query
+
+    def execute(
+        self,
+        conn,
+        chunk_size=None,
+        workers=1,
+        progress=None,
+        checkpoint=None
+    ):
+        """
+        Run the operations of this plan and return the number of rewritten
+        activities.
+
+        :param conn:
+            An object that is able to execute SQL (either SQLAlchemy
+            Connection, Engine or Alembic Operations object)
+        :param chunk_size:
+            Optional number of activities to update per transaction. See
+            :func:`execute_migration`.
+        :param workers:
+            Number of connections updating the activities in parallel
+        :param progress:
+            Optional callable called after each completed chunk
+        :param checkpoint:
+            Optional name for resuming an interrupted chunked migration
+        """
+        if not self.operations and self.new_table_name is None:
+            return 0
+        if (
+            chunk_size is None and
+            hasattr(conn, 'get_bind') and
+            not isinstance(conn, sa.orm.Session)
+        ):
+            # Alembic operations don't return the result of the statement, so
+            # the update is run using the connection of the migration context.
+            conn = conn.get_bind()
+        query = self.query()
+        result = execute_migration(
+            conn,
+            query,
+            query.table,
+            self.name,
+            chunk_size=chunk_size,
+            workers=workers,
+            progress=progress,
+            checkpoint=checkpoint
+        )
+        if chunk_size is None:
+            return result.rowcount
+        return result
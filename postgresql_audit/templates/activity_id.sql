@@ -0,0 +1,20 @@
+-- Returns a time ordered activity id. The high bits of the id hold the number
+-- of milliseconds elapsed between 2020-01-01 and the start of the current
+-- statement, which is also used as the issued_at of the activity. The lowest
+-- 22 bits hold a value from a cached sequence, which keeps concurrent writers
+-- from contending on the sequence.
+CREATE SEQUENCE IF NOT EXISTS ${schema_prefix}activity_id_seq
+    CACHE ${activity_id_cache}
+    OWNED BY ${schema_prefix}activity.id;
+
+CREATE OR REPLACE FUNCTION ${schema_prefix}activity_id() RETURNS bigint AS $$
+    SELECT (
+        floor(extract(epoch FROM statement_timestamp()) * 1000)::bigint -
+        1577836800000
+    ) << 22 | (nextval('${schema_prefix}activity_id_seq') & 4194303)
+$$
+LANGUAGE sql
+VOLATILE;
+
+ALTER TABLE ${schema_prefix}activity
+    ALTER COLUMN id SET DEFAULT ${schema_prefix}activity_id();
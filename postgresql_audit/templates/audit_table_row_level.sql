@@ -1,24 +1,38 @@
+-- Creates the audit trigger of given table. The trigger is left alone if it
+-- is already up to date, so that calling this function for an audited table
+-- doesn't lock the table.
 CREATE OR REPLACE FUNCTION
 ${schema_prefix}audit_table(target_table regclass, ignored_cols text[])
 RETURNS void AS $$
 DECLARE
-    query text;
-    excluded_columns_text text = '';
+    trigger_procedure text;
+    create_trigger text = 'CREATE OR REPLACE TRIGGER ';
+    trigger_condition text =
+        E'(get_setting(\'postgresql_audit.enable_versioning\'::text, \'true\'::text))::boolean';
 BEGIN
-    EXECUTE 'DROP TRIGGER IF EXISTS audit_trigger_row ON ' || target_table;
+    trigger_procedure = ${schema_prefix}audit_trigger_procedure(target_table, ignored_cols);
 
-    IF array_length(ignored_cols, 1) > 0 THEN
-        excluded_columns_text = ', ' || quote_literal(ignored_cols);
+    -- Row level trigger for INSERT, DELETE and UPDATE.
+    IF ${schema_prefix}audit_trigger_exists(
+        target_table,
+        'audit_trigger_row',
+        29::int2,
+        trigger_procedure,
+        trigger_condition
+    ) THEN
+        RETURN;
     END IF;
 
-    query = 'CREATE TRIGGER audit_trigger_row AFTER INSERT OR UPDATE OR DELETE ON ' ||
-             target_table || ' FOR EACH ROW ' ||
-             E'WHEN (get_setting(\'postgresql_audit.enable_versioning\', \'true\')::bool) ' ||
-             ' EXECUTE PROCEDURE ${schema_prefix}create_activity(' ||
-             excluded_columns_text ||
-             ');';
-    RAISE NOTICE '%', query;
-    EXECUTE query;
+    -- CREATE OR REPLACE TRIGGER is available on PostgreSQL 14 and newer.
+    IF current_setting('server_version_num')::int < 140000 THEN
+        EXECUTE 'DROP TRIGGER IF EXISTS audit_trigger_row ON ' || target_table;
+        create_trigger = 'CREATE TRIGGER ';
+    END IF;
+
+    EXECUTE create_trigger || 'audit_trigger_row AFTER INSERT OR UPDATE OR DELETE ON ' ||
+        target_table || ' FOR EACH ROW ' ||
+        'WHEN (' || trigger_condition || ')' ||
+        ' EXECUTE PROCEDURE ' || trigger_procedure;
 END;
 $$
 language 'plpgsql';
@@ -1,41 +1,52 @@
+-- Creates the audit triggers of given table. Triggers that are already up to
+-- date are left alone, so that calling this function for an audited table
+-- doesn't lock the table.
 CREATE OR REPLACE FUNCTION
 ${schema_prefix}audit_table(target_table regclass, ignored_cols text[])
 RETURNS void AS $$
 DECLARE
-    query text;
-    excluded_columns_text text = '';
+    trigger_procedure text;
+    create_trigger text = 'CREATE OR REPLACE TRIGGER ';
+    trigger_condition text =
+        E'(get_setting(\'postgresql_audit.enable_versioning\'::text, \'true\'::text))::boolean';
+    audit_trigger record;
 BEGIN
-    EXECUTE 'DROP TRIGGER IF EXISTS audit_trigger_insert ON ' || target_table;
-    EXECUTE 'DROP TRIGGER IF EXISTS audit_trigger_update ON ' || target_table;
-    EXECUTE 'DROP TRIGGER IF EXISTS audit_trigger_delete ON ' || target_table;
+    trigger_procedure = ${schema_prefix}audit_trigger_procedure(target_table, ignored_cols);
 
-    IF array_length(ignored_cols, 1) > 0 THEN
-        excluded_columns_text = ', ' || quote_literal(ignored_cols);
+    -- CREATE OR REPLACE TRIGGER is available on PostgreSQL 14 and newer.
+    IF current_setting('server_version_num')::int < 140000 THEN
+        create_trigger = 'CREATE TRIGGER ';
     END IF;
-    query = 'CREATE TRIGGER audit_trigger_insert AFTER INSERT ON ' ||
-             target_table || ' REFERENCING NEW TABLE AS new_table FOR EACH STATEMENT ' ||
-             E'WHEN (get_setting(\'postgresql_audit.enable_versioning\', \'true\')::bool)' ||
-             ' EXECUTE PROCEDURE ${schema_prefix}create_activity(' ||
-             excluded_columns_text ||
-             ');';
-    RAISE NOTICE '%', query;
-    EXECUTE query;
-    query = 'CREATE TRIGGER audit_trigger_update AFTER UPDATE ON ' ||
-             target_table || ' REFERENCING NEW TABLE AS new_table OLD TABLE AS old_table FOR EACH STATEMENT ' ||
-             E'WHEN (get_setting(\'postgresql_audit.enable_versioning\', \'true\')::bool)' ||
-             ' EXECUTE PROCEDURE ${schema_prefix}create_activity(' ||
-             excluded_columns_text ||
-             ');';
-    RAISE NOTICE '%', query;
-    EXECUTE query;
-    query = 'CREATE TRIGGER audit_trigger_delete AFTER DELETE ON ' ||
-             target_table || ' REFERENCING OLD TABLE AS old_table FOR EACH STATEMENT ' ||
-             E'WHEN (get_setting(\'postgresql_audit.enable_versioning\', \'true\')::bool)' ||
-             ' EXECUTE PROCEDURE ${schema_prefix}create_activity(' ||
-             excluded_columns_text ||
-             ');';
-    RAISE NOTICE '%', query;
-    EXECUTE query;
+
+    FOR audit_trigger IN
+        SELECT *
+        FROM (VALUES
+            ('audit_trigger_insert', 'INSERT', 4, 'NEW TABLE AS new_table'),
+            ('audit_trigger_update', 'UPDATE', 16, 'NEW TABLE AS new_table OLD TABLE AS old_table'),
+            ('audit_trigger_delete', 'DELETE', 8, 'OLD TABLE AS old_table')
+        ) AS triggers(name, event, type, transition_tables)
+        WHERE NOT ${schema_prefix}audit_trigger_exists(
+            target_table,
+            triggers.name,
+            triggers.type::int2,
+            trigger_procedure,
+            trigger_condition
+        )
+    LOOP
+        IF create_trigger = 'CREATE TRIGGER ' THEN
+            EXECUTE format(
+                'DROP TRIGGER IF EXISTS %I ON %s',
+                audit_trigger.name,
+                target_table
+            );
+        END IF;
+        EXECUTE create_trigger || quote_ident(audit_trigger.name) ||
+            ' AFTER ' || audit_trigger.event || ' ON ' || target_table ||
+            ' REFERENCING ' || audit_trigger.transition_tables ||
+            ' FOR EACH STATEMENT ' ||
+            'WHEN (' || trigger_condition || ')' ||
+            ' EXECUTE PROCEDURE ' || trigger_procedure;
+    END LOOP;
 END;
 $$
 language 'plpgsql';
@@ -0,0 +1,58 @@
+-- Audits several tables at once. Takes a JSON object mapping table names to
+-- arrays of the names of the columns to exclude, for example
+-- '{"article": [], "public.user": ["password"]}'.
+CREATE OR REPLACE FUNCTION ${schema_prefix}audit_tables(tables jsonb)
+RETURNS void AS $$
+DECLARE
+    audited_table record;
+BEGIN
+    FOR audited_table IN SELECT key, value FROM jsonb_each(tables) LOOP
+        PERFORM ${schema_prefix}audit_table(
+            audited_table.key::regclass,
+            ARRAY(SELECT jsonb_array_elements_text(audited_table.value))
+        );
+    END LOOP;
+END;
+$$
+LANGUAGE plpgsql;
+
+
+-- Audits all tables of given schema, excluding the tables of
+-- PostgreSQL-Audit itself and the partitions of partitioned tables.
+CREATE OR REPLACE FUNCTION
+${schema_prefix}audit_schema(target_schema name, ignored_cols text[])
+RETURNS void AS $$
+DECLARE
+    audited_table regclass;
+BEGIN
+    FOR audited_table IN
+        SELECT c.oid
+        FROM pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = target_schema
+        AND c.relkind IN ('r', 'p')
+        AND NOT c.relispartition
+        AND c.oid NOT IN (
+            SELECT to_regclass(name)
+            FROM unnest(ARRAY[
+                '${schema_prefix}activity',
+                '${schema_prefix}activity_checkpoint',
+                '${schema_prefix}activity_migration_chunk',
+                '${schema_prefix}activity_staging',
+                '${schema_prefix}audit_sql_object',
+                '${schema_prefix}transaction'
+            ]) AS name
+            WHERE to_regclass(name) IS NOT NULL
+        )
+        ORDER BY c.relname
+    LOOP
+        PERFORM ${schema_prefix}audit_table(audited_table, ignored_cols);
+    END LOOP;
+END;
+$$
+LANGUAGE plpgsql;
+
+
+CREATE OR REPLACE FUNCTION ${schema_prefix}audit_schema(target_schema name) RETURNS void AS $$
+SELECT ${schema_prefix}audit_schema(target_schema, ARRAY[]::text[]);
+$$ LANGUAGE SQL;
@@ -0,0 +1,32 @@
+DROP FUNCTION IF EXISTS
+${schema_prefix}audit_trigger_exists(regclass, text, int2, text);
+
+-- Returns whether given table already has an enabled audit trigger with given
+-- name and type (see the tgtype column of pg_trigger) executing given trigger
+-- procedure when given condition holds. The condition is compared against
+-- the WHEN clause deparsed by pg_get_triggerdef, so it has to be written the
+-- way PostgreSQL deparses it for the trigger to be considered up to date.
+CREATE OR REPLACE FUNCTION ${schema_prefix}audit_trigger_exists(
+    target_table regclass,
+    trigger_name text,
+    trigger_type int2,
+    trigger_procedure text,
+    trigger_condition text
+)
+RETURNS boolean AS $$
+SELECT EXISTS (
+    SELECT 1
+    FROM pg_trigger
+    WHERE tgrelid = target_table
+    AND tgname = trigger_name
+    AND tgtype = trigger_type
+    AND tgenabled <> 'D'
+    AND tgfoid = to_regprocedure(split_part(trigger_procedure, '(', 1) || '()')
+    AND substring(pg_get_triggerdef(oid) FROM ' WHEN \((.*)\) EXECUTE FUNCTION ') =
+        trigger_condition
+    AND substring(pg_get_triggerdef(oid) FROM 'EXECUTE FUNCTION [^(]*\((.*)\)') =
+        substring(trigger_procedure FROM '\((.*)\)')
+)
+$$
+LANGUAGE SQL
+STABLE;
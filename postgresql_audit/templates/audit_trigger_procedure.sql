@@ -0,0 +1,20 @@
+-- Returns the call of the trigger function auditing given table. The primary
+-- key columns of the table are passed to the trigger function for storing
+-- the record keys of the activities, unless some of them are excluded.
+CREATE OR REPLACE FUNCTION
+${schema_prefix}audit_trigger_procedure(target_table regclass, ignored_cols text[])
+RETURNS text AS $$
+SELECT '${schema_prefix}create_activity(' ||
+    CASE
+        WHEN key_columns IS NOT NULL AND NOT key_columns && coalesce(ignored_cols, ARRAY[]::text[])
+            THEN quote_literal(coalesce(ignored_cols, ARRAY[]::text[])) || ', ' ||
+                quote_literal(key_columns)
+        WHEN array_length(ignored_cols, 1) > 0 THEN quote_literal(ignored_cols)
+        ELSE ''
+    END ||
+    ')'
+FROM (
+    SELECT ${schema_prefix}primary_key_columns(target_table) AS key_columns
+) AS k;
+$$
+LANGUAGE SQL;
@@ -0,0 +1,34 @@
+-- Returns the audited columns of given table together with a format() string
+-- comparing the column of two records. Columns whose type has no default
+-- b-tree operator class (such as json or point) are compared by their text
+-- representation.
+CREATE OR REPLACE FUNCTION
+${schema_prefix}audited_columns(target_table regclass, ignored_cols text[])
+RETURNS TABLE (column_name text, comparison text) AS $$
+SELECT
+    a.attname::text,
+    CASE
+        WHEN EXISTS (
+            SELECT 1
+            FROM pg_opclass oc
+            JOIN pg_am am ON am.oid = oc.opcmethod
+            WHERE am.amname = 'btree'
+            AND oc.opcdefault
+            AND oc.opcintype = coalesce(nullif(t.typbasetype, 0), t.oid)
+        )
+        THEN '%s.' || c.ident || ' IS DISTINCT FROM %s.' || c.ident
+        ELSE '%s.' || c.ident || '::text IS DISTINCT FROM %s.' || c.ident || '::text'
+    END
+FROM pg_attribute a
+CROSS JOIN LATERAL (
+    SELECT replace(quote_ident(a.attname), '%', '%%') AS ident
+) c
+JOIN pg_type t ON t.oid = a.atttypid
+WHERE a.attrelid = target_table
+AND a.attnum > 0
+AND NOT a.attisdropped
+AND a.attname <> ALL (coalesce(ignored_cols, ARRAY[]::text[]))
+ORDER BY a.attnum;
+$$
+LANGUAGE SQL
+STABLE;
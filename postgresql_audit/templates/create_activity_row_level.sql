@@ -2,18 +2,14 @@ CREATE OR REPLACE FUNCTION ${schema_prefix}create_activity() RETURNS TRIGGER AS
 DECLARE
     audit_row ${schema_prefix}activity;
     excluded_cols text[] = ARRAY[]::text[];
+    key_cols text[] = TG_ARGV[1]::text[];
 BEGIN
-    audit_row.id = nextval('${schema_prefix}activity_id_seq');
+    audit_row.id = ${activity_id};
     audit_row.schema_name = TG_TABLE_SCHEMA::text;
     audit_row.table_name = TG_TABLE_NAME::text;
     audit_row.relid = TG_RELID;
     audit_row.issued_at = statement_timestamp() AT TIME ZONE 'UTC';
     audit_row.native_transaction_id = pg_current_xact_id();
-    audit_row.transaction_id = (
-        SELECT id
-        FROM ${schema_prefix}transaction
-        WHERE native_transaction_id = pg_current_xact_id()
-    );
     audit_row.verb = LOWER(TG_OP);
     audit_row.old_data = '{}'::jsonb;
     audit_row.changed_data = '{}'::jsonb;
@@ -36,6 +32,13 @@ BEGIN
     ELSIF (TG_OP = 'INSERT' AND TG_LEVEL = 'ROW') THEN
         audit_row.changed_data = row_to_json(NEW.*)::jsonb - excluded_cols;
     END IF;
+    IF key_cols IS NOT NULL THEN
+        audit_row.record_key = ${schema_prefix}record_key(
+            audit_row.old_data || audit_row.changed_data,
+            key_cols
+        );
+    END IF;
+    audit_row.transaction_id = ${transaction_id};
     INSERT INTO ${schema_prefix}activity VALUES (audit_row.*);
     RETURN NULL;
 END;
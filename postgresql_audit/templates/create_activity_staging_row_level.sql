@@ -0,0 +1,28 @@
+-- Stages the old and new versions of the changed row into the
+-- activity_staging table. The changes are diffed and moved into the activity
+-- table later by drain_activity_staging().
+CREATE OR REPLACE FUNCTION ${schema_prefix}create_activity() RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO ${schema_prefix}activity_staging(
+        id, schema_name, table_name, relid, issued_at, native_transaction_id,
+        transaction_id, verb, old_data, new_data, excluded_cols, key_cols)
+    VALUES (
+        ${activity_id},
+        TG_TABLE_SCHEMA::text,
+        TG_TABLE_NAME::text,
+        TG_RELID,
+        statement_timestamp() AT TIME ZONE 'UTC',
+        pg_current_xact_id(),
+        ${transaction_id},
+        LOWER(TG_OP),
+        CASE WHEN TG_OP <> 'INSERT' THEN to_jsonb(OLD) END,
+        CASE WHEN TG_OP <> 'DELETE' THEN to_jsonb(NEW) END,
+        coalesce(TG_ARGV[0]::text[], ARRAY[]::text[]),
+        TG_ARGV[1]::text[]
+    );
+    RETURN NULL;
+END;
+$$
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = pg_catalog, public;
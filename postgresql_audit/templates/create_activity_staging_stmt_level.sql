@@ -0,0 +1,120 @@
+-- Stages the old and new versions of the rows changed by a statement into the
+-- activity_staging table. The changes are diffed and moved into the activity
+-- table later by drain_activity_staging().
+CREATE OR REPLACE FUNCTION ${schema_prefix}create_activity() RETURNS TRIGGER AS $$
+DECLARE
+    excluded_cols text[] = coalesce(TG_ARGV[0]::text[], ARRAY[]::text[]);
+    key_cols text[] = TG_ARGV[1]::text[];
+    primary_key_match text;
+    pair_by_primary_key boolean = false;
+    pairs text;
+BEGIN
+    IF (TG_OP = 'UPDATE') THEN
+        -- Pair the old and new versions of the updated rows the same way
+        -- create_activity() does when not staging.
+        -- The primary key columns are passed in by audit_table(), unless
+        -- some of them are excluded from auditing.
+        SELECT string_agg(
+            format('new_table.%I = old_table.%I', k.name, k.name),
+            ' AND '
+        )
+        INTO primary_key_match
+        FROM unnest(
+            coalesce(key_cols, ${schema_prefix}primary_key_columns(TG_RELID))
+        ) AS k(name);
+
+        IF primary_key_match IS NOT NULL THEN
+            EXECUTE
+                'SELECT NOT EXISTS (' ||
+                'SELECT 1 FROM old_table WHERE NOT EXISTS (' ||
+                'SELECT 1 FROM new_table WHERE ' || primary_key_match || '))'
+            INTO pair_by_primary_key;
+        END IF;
+
+        IF pair_by_primary_key THEN
+            pairs = 'SELECT ' ||
+                'to_jsonb(old_table.*) AS old_data, ' ||
+                'to_jsonb(new_table.*) AS new_data ' ||
+                'FROM old_table JOIN new_table ON ' || primary_key_match;
+        ELSE
+            pairs = 'SELECT * FROM (' ||
+                'SELECT to_jsonb(old_table.*) AS old_data, ' ||
+                'row_number() OVER () FROM old_table' ||
+                ') AS old_table JOIN (' ||
+                'SELECT to_jsonb(new_table.*) AS new_data, ' ||
+                'row_number() OVER () FROM new_table' ||
+                ') AS new_table USING (row_number)';
+        END IF;
+
+        EXECUTE format(
+            'INSERT INTO ${schema_prefix}activity_staging('
+            '    id, schema_name, table_name, relid, issued_at,'
+            '    native_transaction_id, transaction_id, verb, old_data,'
+            '    new_data, excluded_cols, key_cols)'
+            'SELECT'
+            '    ${escaped_activity_id},'
+            '    %L::text,'
+            '    %L::text,'
+            '    %L::oid,'
+            '    statement_timestamp() AT TIME ZONE ''UTC'','
+            '    pg_current_xact_id(),'
+            '    ${transaction_id},'
+            '    ''update'','
+            '    old_data,'
+            '    new_data,'
+            '    %L::text[],'
+            '    %L::text[] '
+            'FROM (',
+            TG_TABLE_SCHEMA,
+            TG_TABLE_NAME,
+            TG_RELID,
+            excluded_cols,
+            key_cols
+        ) || pairs || ') AS pairs';
+    ELSIF (TG_OP = 'INSERT') THEN
+        INSERT INTO ${schema_prefix}activity_staging(
+            id, schema_name, table_name, relid, issued_at,
+            native_transaction_id, transaction_id, verb, new_data,
+            excluded_cols, key_cols)
+        SELECT
+            ${activity_id},
+            TG_TABLE_SCHEMA::text,
+            TG_TABLE_NAME::text,
+            TG_RELID,
+            statement_timestamp() AT TIME ZONE 'UTC',
+            pg_current_xact_id(),
+            ${transaction_id},
+            'insert',
+            to_jsonb(new_table.*),
+            excluded_cols,
+            key_cols
+        FROM new_table;
+    ELSIF (TG_OP = 'DELETE') THEN
+        INSERT INTO ${schema_prefix}activity_staging(
+            id, schema_name, table_name, relid, issued_at,
+            native_transaction_id, transaction_id, verb, old_data,
+            excluded_cols, key_cols)
+        SELECT
+            ${activity_id},
+            TG_TABLE_SCHEMA::text,
+            TG_TABLE_NAME::text,
+            TG_RELID,
+            statement_timestamp() AT TIME ZONE 'UTC',
+            pg_current_xact_id(),
+            ${transaction_id},
+            'delete',
+            to_jsonb(old_table.*),
+            excluded_cols,
+            key_cols
+        FROM old_table;
+    END IF;
+    RETURN NULL;
+END;
+$$
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = pg_catalog, public
+-- The transition tables have no statistics, so without these settings large
+-- updates could end up pairing rows with a quadratic nested loop join.
+SET enable_nestloop = off
+SET enable_mergejoin = off;
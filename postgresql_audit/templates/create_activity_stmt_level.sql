@@ -1,56 +1,89 @@
 CREATE OR REPLACE FUNCTION ${schema_prefix}create_activity() RETURNS TRIGGER AS $$
 DECLARE
     excluded_cols text[] = ARRAY[]::text[];
-    _transaction_id BIGINT;
+    key_cols text[] = TG_ARGV[1]::text[];
+    primary_key_match text;
+    pair_by_primary_key boolean = false;
+    pairs text;
 BEGIN
-    _transaction_id := (
-        SELECT id
-        FROM ${schema_prefix}transaction
-        WHERE native_transaction_id = pg_current_xact_id()
-    );
-
     IF TG_ARGV[0] IS NOT NULL THEN
         excluded_cols = TG_ARGV[0]::text[];
     END IF;
 
     IF (TG_OP = 'UPDATE') THEN
-        INSERT INTO ${schema_prefix}activity(
-            id, schema_name, table_name, relid, issued_at, native_transaction_id,
-            verb, old_data, changed_data, transaction_id)
-        SELECT
-            nextval('${schema_prefix}activity_id_seq') as id,
-            TG_TABLE_SCHEMA::text AS schema_name,
-            TG_TABLE_NAME::text AS table_name,
-            TG_RELID AS relid,
-            statement_timestamp() AT TIME ZONE 'UTC' AS issued_at,
-            pg_current_xact_id() AS native_transaction_id,
-            LOWER(TG_OP) AS verb,
-            old_data - excluded_cols AS old_data,
-            new_data - old_data - excluded_cols AS changed_data,
-            _transaction_id AS transaction_id
-        FROM (
-            SELECT *
-            FROM (
-                SELECT
-                    row_to_json(old_table.*)::jsonb AS old_data,
-                    row_number() OVER ()
-                FROM old_table
-            ) AS old_table
-            JOIN (
-                SELECT
-                    row_to_json(new_table.*)::jsonb AS new_data,
-                    row_number() OVER ()
-                FROM new_table
-            ) AS new_table
-            USING(row_number)
-        ) as sub
-        WHERE new_data - old_data - excluded_cols != '{}'::jsonb;
+        -- Pair the old and new versions of the updated rows by primary key,
+        -- unless the statement changed primary key values, in which case
+        -- the rows are paired by their position in the transition tables.
+        -- The primary key columns are passed in by audit_table(), unless
+        -- some of them are excluded from auditing.
+        SELECT string_agg(
+            format('new_table.%I = old_table.%I', k.name, k.name),
+            ' AND '
+        )
+        INTO primary_key_match
+        FROM unnest(
+            coalesce(key_cols, ${schema_prefix}primary_key_columns(TG_RELID))
+        ) AS k(name);
+
+        IF primary_key_match IS NOT NULL THEN
+            EXECUTE
+                'SELECT NOT EXISTS (' ||
+                'SELECT 1 FROM old_table WHERE NOT EXISTS (' ||
+                'SELECT 1 FROM new_table WHERE ' || primary_key_match || '))'
+            INTO pair_by_primary_key;
+        END IF;
+
+        IF pair_by_primary_key THEN
+            pairs = 'SELECT ' ||
+                'row_to_json(old_table.*)::jsonb AS old_data, ' ||
+                'row_to_json(new_table.*)::jsonb AS new_data ' ||
+                'FROM old_table JOIN new_table ON ' || primary_key_match;
+        ELSE
+            pairs = 'SELECT * FROM (' ||
+                'SELECT row_to_json(old_table.*)::jsonb AS old_data, ' ||
+                'row_number() OVER () FROM old_table' ||
+                ') AS old_table JOIN (' ||
+                'SELECT row_to_json(new_table.*)::jsonb AS new_data, ' ||
+                'row_number() OVER () FROM new_table' ||
+                ') AS new_table USING (row_number)';
+        END IF;
+
+        EXECUTE format(
+            'INSERT INTO ${schema_prefix}activity('
+            '    id, schema_name, table_name, relid, issued_at, native_transaction_id,'
+            '    verb, old_data, changed_data, record_key, transaction_id)'
+            'SELECT'
+            '    ${escaped_activity_id} as id,'
+            '    %L::text AS schema_name,'
+            '    %L::text AS table_name,'
+            '    %L::oid AS relid,'
+            '    statement_timestamp() AT TIME ZONE ''UTC'' AS issued_at,'
+            '    pg_current_xact_id() AS native_transaction_id,'
+            '    ''update'' AS verb,'
+            '    old_data - %L::text[] AS old_data,'
+            '    new_data - old_data - %L::text[] AS changed_data,'
+            '    ${schema_prefix}record_key(new_data, %L::text[]) AS record_key,'
+            '    ${transaction_id} AS transaction_id '
+            'FROM (',
+            TG_TABLE_SCHEMA,
+            TG_TABLE_NAME,
+            TG_RELID,
+            excluded_cols,
+            excluded_cols,
+            key_cols
+        ) ||
+        pairs ||
+        format(
+            ') AS sub '
+            'WHERE new_data - old_data - %L::text[] != ''{}''::jsonb',
+            excluded_cols
+        );
     ELSIF (TG_OP = 'INSERT') THEN
         INSERT INTO ${schema_prefix}activity(
             id, schema_name, table_name, relid, issued_at, native_transaction_id,
-            verb, old_data, changed_data, transaction_id)
+            verb, old_data, changed_data, record_key, transaction_id)
         SELECT
-            nextval('${schema_prefix}activity_id_seq') as id,
+            ${activity_id} as id,
             TG_TABLE_SCHEMA::text AS schema_name,
             TG_TABLE_NAME::text AS table_name,
             TG_RELID AS relid,
@@ -58,29 +91,39 @@ BEGIN
             pg_current_xact_id() AS native_transaction_id,
             LOWER(TG_OP) AS verb,
             '{}'::jsonb AS old_data,
-            row_to_json(new_table.*)::jsonb - excluded_cols AS changed_data,
-            _transaction_id AS transaction_id
-        FROM new_table;
+            data - excluded_cols AS changed_data,
+            ${schema_prefix}record_key(data, key_cols) AS record_key,
+            ${transaction_id} AS transaction_id
+        FROM (
+            SELECT row_to_json(new_table.*)::jsonb AS data FROM new_table
+        ) AS rows;
     ELSEIF TG_OP = 'DELETE' THEN
         INSERT INTO ${schema_prefix}activity(
             id, schema_name, table_name, relid, issued_at, native_transaction_id,
-            verb, old_data, changed_data, transaction_id)
+            verb, old_data, changed_data, record_key, transaction_id)
         SELECT
-            nextval('${schema_prefix}activity_id_seq') as id,
+            ${activity_id} as id,
             TG_TABLE_SCHEMA::text AS schema_name,
             TG_TABLE_NAME::text AS table_name,
             TG_RELID AS relid,
             statement_timestamp() AT TIME ZONE 'UTC' AS issued_at,
             pg_current_xact_id() AS native_transaction_id,
             LOWER(TG_OP) AS verb,
-            row_to_json(old_table.*)::jsonb - excluded_cols AS old_data,
+            data - excluded_cols AS old_data,
             '{}'::jsonb AS changed_data,
-            _transaction_id AS transaction_id
-        FROM old_table;
+            ${schema_prefix}record_key(data, key_cols) AS record_key,
+            ${transaction_id} AS transaction_id
+        FROM (
+            SELECT row_to_json(old_table.*)::jsonb AS data FROM old_table
+        ) AS rows;
     END IF;
     RETURN NULL;
 END;
 $$
 LANGUAGE plpgsql
 SECURITY DEFINER
-SET search_path = pg_catalog, public;
+SET search_path = pg_catalog, public
+-- The transition tables have no statistics, so without these settings large
+-- updates could end up pairing rows with a quadratic nested loop join.
+SET enable_nestloop = off
+SET enable_mergejoin = off;
@@ -0,0 +1,89 @@
+-- Generates a trigger function specific to the given table. Instead of
+-- diffing whole row documents the generated function compares the audited
+-- columns one by one and only serializes the columns that have changed.
+CREATE OR REPLACE FUNCTION
+${schema_prefix}audit_trigger_procedure(target_table regclass, ignored_cols text[])
+RETURNS text AS $$
+DECLARE
+    function_name text;
+    excluded_cols text;
+    column_checks text = '';
+    column_record record;
+    key_columns text[] = ${schema_prefix}primary_key_columns(target_table);
+    record_key text;
+    record_key_assignment text = '';
+BEGIN
+    -- Table names may be truncated to the same identifier, so the generated
+    -- function is named after the oid of the table instead.
+    function_name = '${schema_prefix}' ||
+        quote_ident('create_activity_' || target_table::oid);
+
+    excluded_cols = quote_literal(coalesce(ignored_cols, ARRAY[]::text[])) || '::text[]';
+
+    -- The record key expression is built with a placeholder for the row.
+    IF NOT key_columns && coalesce(ignored_cols, ARRAY[]::text[]) THEN
+        SELECT
+            'jsonb_build_array(' ||
+            string_agg('__ROW__.' || quote_ident(k.name), ', ' ORDER BY k.position) ||
+            ')'
+        INTO record_key
+        FROM unnest(key_columns) WITH ORDINALITY AS k(name, position);
+    END IF;
+    IF record_key IS NOT NULL THEN
+        record_key_assignment =
+            E'    IF TG_OP = ''DELETE'' THEN\n' ||
+            E'        audit_row.record_key = ' || replace(record_key, '__ROW__', 'OLD') || E';\n' ||
+            E'    ELSE\n' ||
+            E'        audit_row.record_key = ' || replace(record_key, '__ROW__', 'NEW') || E';\n' ||
+            E'    END IF;\n';
+    END IF;
+
+    FOR column_record IN
+        SELECT * FROM ${schema_prefix}audited_columns(target_table, ignored_cols)
+    LOOP
+        column_checks = column_checks ||
+            E'        IF ' || format(column_record.comparison, 'OLD', 'NEW') || E' THEN\n' ||
+            E'            audit_row.changed_data = audit_row.changed_data || ' ||
+            'jsonb_build_object(' || quote_literal(column_record.column_name) ||
+            ', NEW.' || quote_ident(column_record.column_name) || E');\n' ||
+            E'        END IF;\n';
+    END LOOP;
+
+    EXECUTE
+        'CREATE OR REPLACE FUNCTION ' || function_name || '() RETURNS TRIGGER AS ' ||
+        quote_literal(
+            E'\nDECLARE\n' ||
+            E'    audit_row ${schema_prefix}activity;\n' ||
+            E'BEGIN\n' ||
+            E'    audit_row.old_data = ''{}''::jsonb;\n' ||
+            E'    audit_row.changed_data = ''{}''::jsonb;\n' ||
+            E'    IF TG_OP = ''UPDATE'' THEN\n' ||
+            column_checks ||
+            E'        IF audit_row.changed_data = ''{}''::jsonb THEN\n' ||
+            E'            -- All changed fields are ignored. Skip this update.\n' ||
+            E'            RETURN NULL;\n' ||
+            E'        END IF;\n' ||
+            E'        audit_row.old_data = to_jsonb(OLD) - ' || excluded_cols || E';\n' ||
+            E'    ELSIF TG_OP = ''DELETE'' THEN\n' ||
+            E'        audit_row.old_data = to_jsonb(OLD) - ' || excluded_cols || E';\n' ||
+            E'    ELSIF TG_OP = ''INSERT'' THEN\n' ||
+            E'        audit_row.changed_data = to_jsonb(NEW) - ' || excluded_cols || E';\n' ||
+            E'    END IF;\n' ||
+            record_key_assignment ||
+            E'    audit_row.id = ${escaped_activity_id};\n' ||
+            E'    audit_row.schema_name = TG_TABLE_SCHEMA::text;\n' ||
+            E'    audit_row.table_name = TG_TABLE_NAME::text;\n' ||
+            E'    audit_row.relid = TG_RELID;\n' ||
+            E'    audit_row.issued_at = statement_timestamp() AT TIME ZONE ''UTC'';\n' ||
+            E'    audit_row.native_transaction_id = pg_current_xact_id();\n' ||
+            E'    audit_row.transaction_id = ${transaction_id};\n' ||
+            E'    audit_row.verb = LOWER(TG_OP);\n' ||
+            E'    INSERT INTO ${schema_prefix}activity VALUES (audit_row.*);\n' ||
+            E'    RETURN NULL;\n' ||
+            E'END;\n'
+        ) ||
+        ' LANGUAGE plpgsql SECURITY DEFINER SET search_path = pg_catalog, public';
+    RETURN function_name || '()';
+END;
+$$
+LANGUAGE plpgsql;
@@ -0,0 +1,171 @@
+-- Generates a trigger function specific to the given table. Instead of
+-- diffing whole row documents the generated function compares the audited
+-- columns one by one and only collects the columns that have changed.
+CREATE OR REPLACE FUNCTION
+${schema_prefix}audit_trigger_procedure(target_table regclass, ignored_cols text[])
+RETURNS text AS $$
+DECLARE
+    function_name text;
+    excluded_cols text;
+    column_changes text;
+    primary_key_match text;
+    update_query text;
+    update_queries text;
+    key_columns text[] = ${schema_prefix}primary_key_columns(target_table);
+    record_key text = 'NULL::jsonb';
+    columns text = 'id, schema_name, table_name, relid, issued_at, ' ||
+        'native_transaction_id, verb, old_data, changed_data, record_key, ' ||
+        'transaction_id';
+    common_values text =
+        E'            ${escaped_activity_id} AS id,\n' ||
+        E'            TG_TABLE_SCHEMA::text AS schema_name,\n' ||
+        E'            TG_TABLE_NAME::text AS table_name,\n' ||
+        E'            TG_RELID AS relid,\n' ||
+        E'            statement_timestamp() AT TIME ZONE ''UTC'' AS issued_at,\n' ||
+        E'            pg_current_xact_id() AS native_transaction_id,\n' ||
+        E'            LOWER(TG_OP) AS verb,\n';
+BEGIN
+    -- Table names may be truncated to the same identifier, so the generated
+    -- function is named after the oid of the table instead.
+    function_name = '${schema_prefix}' ||
+        quote_ident('create_activity_' || target_table::oid);
+
+    excluded_cols = quote_literal(coalesce(ignored_cols, ARRAY[]::text[])) || '::text[]';
+
+    SELECT string_agg(
+        '(' || quote_literal(column_name) || ', ' ||
+        format(comparison, '(old_row)', '(new_row)') || ')',
+        E',\n                        '
+    )
+    INTO column_changes
+    FROM ${schema_prefix}audited_columns(target_table, ignored_cols);
+
+    -- The record key expression is built with a placeholder for the row.
+    IF NOT key_columns && coalesce(ignored_cols, ARRAY[]::text[]) THEN
+        SELECT
+            'jsonb_build_array(' ||
+            string_agg('__ROW__.' || quote_ident(k.name), ', ' ORDER BY k.position) ||
+            ')'
+        INTO record_key
+        FROM unnest(key_columns) WITH ORDINALITY AS k(name, position);
+    END IF;
+
+    SELECT string_agg(
+        format('new_table.%I = old_table.%I', a.attname, a.attname),
+        ' AND '
+    )
+    INTO primary_key_match
+    FROM pg_index i
+    CROSS JOIN LATERAL unnest(i.indkey::int2[]) AS k(attnum)
+    JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = k.attnum
+    WHERE i.indrelid = target_table AND i.indisprimary;
+
+    -- The update query is built with a placeholder for the way the old and
+    -- new versions of the updated rows are paired.
+    update_query =
+        E'        INSERT INTO ${schema_prefix}activity(' || columns || E')\n' ||
+        E'        SELECT\n' ||
+        common_values ||
+        E'            old_data,\n' ||
+        E'            changed_data,\n' ||
+        E'            record_key,\n' ||
+        E'            ${transaction_id} AS transaction_id\n' ||
+        E'        FROM (\n' ||
+        E'            SELECT\n' ||
+        E'                old_data,\n' ||
+        E'                record_key,\n' ||
+        E'                (\n' ||
+        E'                    SELECT jsonb_object_agg(c.key, new_data -> c.key)\n' ||
+        E'                    FROM (VALUES\n' ||
+        E'                        ' || coalesce(column_changes, '(NULL, false)') || E'\n' ||
+        E'                    ) AS c(key, changed)\n' ||
+        E'                    WHERE c.changed\n' ||
+        E'                ) AS changed_data\n' ||
+        E'            FROM (\n' ||
+        E'                SELECT\n' ||
+        E'                    old_row,\n' ||
+        E'                    new_row,\n' ||
+        E'                    to_jsonb(old_row) - ' || excluded_cols || E' AS old_data,\n' ||
+        E'                    to_jsonb(new_row) AS new_data,\n' ||
+        E'                    ' || replace(record_key, '__ROW__', '(new_row)') || E' AS record_key\n' ||
+        E'                FROM (\n' ||
+        E'__PAIRS__' ||
+        E'                ) AS pairs\n' ||
+        E'                -- Keeps new_data from being evaluated once per changed column.\n' ||
+        E'                OFFSET 0\n' ||
+        E'            ) AS rows\n' ||
+        E'        ) AS sub\n' ||
+        E'        WHERE changed_data IS NOT NULL;\n';
+
+    -- Rows are paired by their position in the transition tables when the
+    -- table has no primary key or the statement changed primary key values.
+    update_queries = replace(
+        update_query,
+        '__PAIRS__',
+        E'                    SELECT old_row, new_row\n' ||
+        E'                    FROM (\n' ||
+        E'                        SELECT old_table AS old_row, row_number() OVER ()\n' ||
+        E'                        FROM old_table\n' ||
+        E'                    ) AS old_rows\n' ||
+        E'                    JOIN (\n' ||
+        E'                        SELECT new_table AS new_row, row_number() OVER ()\n' ||
+        E'                        FROM new_table\n' ||
+        E'                    ) AS new_rows\n' ||
+        E'                    USING (row_number)\n'
+    );
+    IF primary_key_match IS NOT NULL THEN
+        update_queries =
+            E'        IF NOT EXISTS (\n' ||
+            E'            SELECT 1 FROM old_table WHERE NOT EXISTS (\n' ||
+            E'                SELECT 1 FROM new_table WHERE ' || primary_key_match || E'\n' ||
+            E'            )\n' ||
+            E'        ) THEN\n' ||
+            replace(
+                update_query,
+                '__PAIRS__',
+                E'                    SELECT old_table AS old_row, new_table AS new_row\n' ||
+                E'                    FROM old_table\n' ||
+                E'                    JOIN new_table ON ' || primary_key_match || E'\n'
+            ) ||
+            E'        ELSE\n' ||
+            update_queries ||
+            E'        END IF;\n';
+    END IF;
+
+    EXECUTE
+        'CREATE OR REPLACE FUNCTION ' || function_name || '() RETURNS TRIGGER AS ' ||
+        quote_literal(
+            E'\nBEGIN\n' ||
+            E'    IF TG_OP = ''UPDATE'' THEN\n' ||
+            update_queries ||
+            E'    ELSIF TG_OP = ''INSERT'' THEN\n' ||
+            E'        INSERT INTO ${schema_prefix}activity(' || columns || E')\n' ||
+            E'        SELECT\n' ||
+            common_values ||
+            E'            ''{}''::jsonb AS old_data,\n' ||
+            E'            to_jsonb(new_table) - ' || excluded_cols || E' AS changed_data,\n' ||
+            E'            ' || replace(record_key, '__ROW__', 'new_table') || E' AS record_key,\n' ||
+            E'            ${transaction_id} AS transaction_id\n' ||
+            E'        FROM new_table;\n' ||
+            E'    ELSIF TG_OP = ''DELETE'' THEN\n' ||
+            E'        INSERT INTO ${schema_prefix}activity(' || columns || E')\n' ||
+            E'        SELECT\n' ||
+            common_values ||
+            E'            to_jsonb(old_table) - ' || excluded_cols || E' AS old_data,\n' ||
+            E'            ''{}''::jsonb AS changed_data,\n' ||
+            E'            ' || replace(record_key, '__ROW__', 'old_table') || E' AS record_key,\n' ||
+            E'            ${transaction_id} AS transaction_id\n' ||
+            E'        FROM old_table;\n' ||
+            E'    END IF;\n' ||
+            E'    RETURN NULL;\n' ||
+            E'END;\n'
+        ) ||
+        ' LANGUAGE plpgsql SECURITY DEFINER SET search_path = pg_catalog, public' ||
+        -- The transition tables have no statistics, so without these settings
+        -- large updates could end up pairing rows with a quadratic nested loop
+        -- join.
+        ' SET enable_nestloop = off SET enable_mergejoin = off';
+    RETURN function_name || '()';
+END;
+$$
+LANGUAGE plpgsql;
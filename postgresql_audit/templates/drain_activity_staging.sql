@@ -0,0 +1,57 @@
+-- Moves at most batch_size of the oldest staged changes into the activity
+-- table, diffing the old and new versions of updated rows on the way. Staged
+-- rows locked by concurrent calls are skipped, so this function can be called
+-- from several connections in parallel. Returns the number of staged rows
+-- processed.
+CREATE OR REPLACE FUNCTION
+${schema_prefix}drain_activity_staging(batch_size integer) RETURNS integer AS $$
+DECLARE
+    processed integer;
+BEGIN
+    WITH batch AS (
+        DELETE FROM ${schema_prefix}activity_staging
+        WHERE id IN (
+            SELECT id
+            FROM ${schema_prefix}activity_staging
+            ORDER BY id
+            LIMIT batch_size
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING *
+    ), moved AS (
+        INSERT INTO ${schema_prefix}activity(
+            id, schema_name, table_name, relid, issued_at,
+            native_transaction_id, verb, old_data, changed_data,
+            record_key, transaction_id)
+        SELECT *
+        FROM (
+            SELECT
+                id,
+                schema_name,
+                table_name,
+                relid,
+                issued_at,
+                native_transaction_id,
+                verb,
+                coalesce(old_data - excluded_cols, '{}'::jsonb) AS old_data,
+                CASE verb
+                    WHEN 'update' THEN new_data - old_data - excluded_cols
+                    WHEN 'insert' THEN new_data - excluded_cols
+                    ELSE '{}'::jsonb
+                END AS changed_data,
+                ${schema_prefix}record_key(
+                    coalesce(new_data, old_data),
+                    key_cols
+                ) AS record_key,
+                transaction_id
+            FROM batch
+        ) AS sub
+        WHERE verb <> 'update' OR changed_data <> '{}'::jsonb
+    )
+    SELECT count(*) INTO processed FROM batch;
+    RETURN processed;
+END;
+$$
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = pg_catalog, public;
@@ -0,0 +1,55 @@
+-- Returns the id of the transaction row of the current transaction. The row is
+-- created from the values stored in the postgresql_audit.transaction_values
+-- setting the first time this function is called within a transaction, and
+-- its id is cached in the transaction local postgresql_audit.transaction_id
+-- setting for subsequent calls.
+CREATE OR REPLACE FUNCTION ${schema_prefix}get_transaction_id() RETURNS BIGINT AS $$
+DECLARE
+    _transaction_id BIGINT;
+    transaction_values jsonb;
+    transaction_row ${schema_prefix}transaction;
+BEGIN
+    _transaction_id = nullif(
+        current_setting('postgresql_audit.transaction_id', true),
+        ''
+    )::bigint;
+    IF _transaction_id IS NOT NULL THEN
+        RETURN _transaction_id;
+    END IF;
+
+    transaction_values = nullif(
+        current_setting('postgresql_audit.transaction_values', true),
+        ''
+    )::jsonb;
+    IF transaction_values IS NULL THEN
+        RETURN NULL;
+    END IF;
+
+    _transaction_id = (
+        SELECT id
+        FROM ${schema_prefix}transaction
+        WHERE native_transaction_id = pg_current_xact_id()
+    );
+    IF _transaction_id IS NULL THEN
+        transaction_row = jsonb_populate_record(
+            NULL::${schema_prefix}transaction,
+            transaction_values
+        );
+        transaction_row.id = nextval('${schema_prefix}transaction_id_seq');
+        transaction_row.native_transaction_id = pg_current_xact_id();
+        transaction_row.issued_at = now() AT TIME ZONE 'UTC';
+        INSERT INTO ${schema_prefix}transaction VALUES (transaction_row.*);
+        _transaction_id = transaction_row.id;
+    END IF;
+
+    PERFORM set_config(
+        'postgresql_audit.transaction_id',
+        _transaction_id::text,
+        true
+    );
+    RETURN _transaction_id;
+END;
+$$
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = pg_catalog, public;
@@ -1,11 +1,12 @@
 CREATE OR REPLACE FUNCTION jsonb_change_key_name(data jsonb, old_key text, new_key text)
 RETURNS jsonb
 IMMUTABLE
+PARALLEL SAFE
 LANGUAGE sql
 AS $$
-    SELECT ('{'||string_agg(to_json(CASE WHEN key = old_key THEN new_key ELSE key END)||':'||value, ',')||'}')::jsonb
-    FROM (
-        SELECT *
-        FROM jsonb_each(data)
-    ) t;
+    SELECT CASE
+        WHEN data ? old_key
+        THEN jsonb_build_object(new_key, data -> old_key) || (data - old_key)
+        ELSE data
+    END;
 $$;
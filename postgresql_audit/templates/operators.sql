@@ -1,29 +1,49 @@
 -- http://coussej.github.io/2016/05/24/A-Minus-Operator-For-PostgreSQLs-JSONB/
-DROP FUNCTION IF EXISTS jsonb_subtract(jsonb,jsonb) CASCADE;
-CREATE FUNCTION jsonb_subtract(arg1 jsonb, arg2 jsonb)
-RETURNS jsonb AS $$
-SELECT
-  COALESCE(json_object_agg(key, value), '{}')::jsonb
-FROM
-  jsonb_each(arg1)
-WHERE
-  (arg1 -> key) <> (arg2 -> key) OR (arg2 -> key) IS NULL
-$$ LANGUAGE SQL;
+-- Returns the keys of arg1 whose values differ from the ones in arg2. The
+-- documents are joined instead of looking up each key of arg1 in arg2, which
+-- would decompress arg2 once per key.
+CREATE OR REPLACE FUNCTION jsonb_subtract(arg1 jsonb, arg2 jsonb)
+RETURNS jsonb
+IMMUTABLE
+PARALLEL SAFE
+LANGUAGE sql
+AS $$
+    SELECT coalesce(jsonb_object_agg(a.key, a.value), '{}')
+    FROM jsonb_each(arg1) AS a
+    LEFT JOIN jsonb_each(arg2) AS b ON a.key = b.key
+    WHERE a.value IS DISTINCT FROM b.value;
+$$;
 
-DROP OPERATOR IF EXISTS - (jsonb, jsonb);
+-- The operator keeps pointing at jsonb_subtract when the function is
+-- replaced, so it only needs to be created once.
+DO $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1
+        FROM pg_operator
+        WHERE
+            oprname = '-' AND
+            oprleft = 'jsonb'::regtype AND
+            oprright = 'jsonb'::regtype AND
+            oprnamespace = current_schema()::regnamespace
+    ) THEN
+        CREATE OPERATOR - (
+          LEFTARG = jsonb,
+          RIGHTARG = jsonb,
+          PROCEDURE = jsonb_subtract
+        );
+    END IF;
+END
+$$;
 
-CREATE OPERATOR - (
-  LEFTARG = jsonb,
-  RIGHTARG = jsonb,
-  PROCEDURE = jsonb_subtract
-);
-
-
-DROP FUNCTION IF EXISTS get_setting(text, text) CASCADE;
-CREATE FUNCTION get_setting(setting text, default_value text)
-RETURNS text AS $$
+CREATE OR REPLACE FUNCTION get_setting(setting text, default_value text)
+RETURNS text
+STABLE
+PARALLEL SAFE
+LANGUAGE sql
+AS $$
     SELECT coalesce(
         nullif(current_setting(setting, 't'), ''),
         default_value
     );
-$$ LANGUAGE SQL;
+$$;
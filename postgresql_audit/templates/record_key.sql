@@ -0,0 +1,24 @@
+-- Returns the names of the primary key columns of given table in the order
+-- of the primary key, or NULL if the table has no primary key.
+CREATE OR REPLACE FUNCTION ${schema_prefix}primary_key_columns(target_table regclass)
+RETURNS text[] AS $$
+SELECT array_agg(a.attname::text ORDER BY k.position)
+FROM pg_index i
+CROSS JOIN LATERAL unnest(i.indkey::int2[]) WITH ORDINALITY AS k(attnum, position)
+JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = k.attnum
+WHERE i.indrelid = target_table AND i.indisprimary
+$$
+LANGUAGE SQL
+STABLE;
+
+
+-- Returns the record key of given row document, which is an array of the
+-- values of given key columns.
+CREATE OR REPLACE FUNCTION ${schema_prefix}record_key(data jsonb, key_columns text[])
+RETURNS jsonb AS $$
+SELECT jsonb_agg(data -> k.name ORDER BY k.position)
+FROM unnest(key_columns) WITH ORDINALITY AS k(name, position)
+$$
+LANGUAGE SQL
+IMMUTABLE
+PARALLEL SAFE;
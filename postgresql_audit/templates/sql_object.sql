@@ -0,0 +1,9 @@
+-- Serializes concurrent installations, so that each of them sees the objects
+-- installed by the previous ones.
+SELECT pg_advisory_xact_lock(hashtext('postgresql_audit'));
+
+CREATE TABLE IF NOT EXISTS ${schema_prefix}audit_sql_object (
+    name text PRIMARY KEY,
+    checksum text NOT NULL,
+    installed_at timestamp NOT NULL DEFAULT now()
+);
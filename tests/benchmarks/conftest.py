@@ -0,0 +1,78 @@
+import json
+import os
+import statistics
+import time
+from contextlib import contextmanager
+
+import pytest
+
+BENCHMARK_OUTPUT = os.environ.get('POSTGRESQL_AUDIT_BENCHMARK')
+
+
+class Benchmark(object):
+    """
+    Records the timings of a benchmark under its name and parameters.
+    """
+
+    def __init__(self, name, results):
+        self.name = name
+        self.results = results
+
+    def __call__(self, func, rounds=5, **params):
+        """
+        Call given function `rounds` times and record the timings of the
+        calls.
+        """
+        timings = []
+        for _ in range(rounds):
+            with self.timer(timings):
+                func()
+        return self.record(timings, **params)
+
+    @contextmanager
+    def timer(self, timings):
+        start = time.perf_counter()
+        yield
+        timings.append(time.perf_counter() - start)
+
+    def record(self, timings, rows=None, **params):
+        """
+        Record given timings in seconds. When the number of rows processed
+        in each round is given, the throughput is recorded as well.
+        """
+        result = {
+            'name': self.name,
+            'params': params,
+            'rounds': len(timings),
+            'min': min(timings),
+            'median': statistics.median(timings),
+            'max': max(timings),
+        }
+        if rows is not None:
+            result['rows'] = rows
+            result['rows_per_second'] = rows / result['median']
+        self.results.append(result)
+        return result
+
+
+@pytest.fixture(autouse=True)
+def require_benchmark_output():
+    if not BENCHMARK_OUTPUT:
+        pytest.skip(
+            'Set POSTGRESQL_AUDIT_BENCHMARK to the path of the results file '
+            'for running the benchmarks.'
+        )
+
+
+@pytest.fixture(scope='session')
+def benchmark_results():
+    results = []
+    yield results
+    if results:
+        with open(BENCHMARK_OUTPUT, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+@pytest.fixture
+def benchmark(request, benchmark_results):
+    return Benchmark(request.node.originalname, benchmark_results)
@@ -0,0 +1,101 @@
+import pytest
+
+# The implementations of the SQL helper functions preceding the native jsonb
+# ones, for comparison.
+PREVIOUS_FUNCTIONS = '''
+CREATE FUNCTION pg_temp.jsonb_change_key_name(
+    data jsonb,
+    old_key text,
+    new_key text
+)
+RETURNS jsonb
+IMMUTABLE
+LANGUAGE sql
+AS $$
+    SELECT ('{'||string_agg(to_json(CASE WHEN key = old_key THEN new_key ELSE key END)||':'||value, ',')||'}')::jsonb
+    FROM (
+        SELECT *
+        FROM jsonb_each(data)
+    ) t;
+$$;
+
+CREATE FUNCTION pg_temp.jsonb_subtract(arg1 jsonb, arg2 jsonb)
+RETURNS jsonb AS $$
+SELECT
+  COALESCE(json_object_agg(key, value), '{}')::jsonb
+FROM
+  jsonb_each(arg1)
+WHERE
+  (arg1 -> key) <> (arg2 -> key) OR (arg2 -> key) IS NULL
+$$ LANGUAGE SQL;
+
+CREATE FUNCTION pg_temp.get_setting(setting text, default_value text)
+RETURNS text AS $$
+    SELECT coalesce(
+        nullif(current_setting(setting, 't'), ''),
+        default_value
+    );
+$$ LANGUAGE SQL;
+'''  # noqa: E501
+
+QUERIES = {
+    'jsonb_change_key_name': (
+        "SELECT count({prefix}jsonb_change_key_name(data, 'key_1', 'key')) "
+        "FROM benchmark_document"
+    ),
+    'jsonb_subtract': (
+        'SELECT count({prefix}jsonb_subtract(data, other_data)) '
+        'FROM benchmark_document'
+    ),
+    'get_setting': (
+        'SELECT count(*) FROM benchmark_document '
+        "WHERE {prefix}get_setting("
+        "'postgresql_audit.enable_versioning', 'true'"
+        ")::bool"
+    ),
+}
+
+
+@pytest.fixture
+def connection(engine):
+    with engine.connect() as connection:
+        connection.exec_driver_sql(PREVIOUS_FUNCTIONS)
+        yield connection
+        connection.rollback()
+
+
+def create_documents(connection, keys, rows=100):
+    connection.exec_driver_sql(
+        '''
+        CREATE TEMPORARY TABLE benchmark_document ON COMMIT DROP AS
+        SELECT
+            data,
+            data || jsonb_build_object('key_1', 'changed') AS other_data
+        FROM (
+            SELECT (
+                SELECT jsonb_object_agg('key_' || key, row || '_' || key)
+                FROM generate_series(1, {keys}) AS key
+            ) AS data
+            FROM generate_series(1, {rows}) AS row
+        ) AS documents
+        '''.format(keys=keys, rows=rows)
+    )
+
+
+@pytest.mark.usefixtures('activity_cls', 'table_creator')
+@pytest.mark.parametrize('function', sorted(QUERIES))
+@pytest.mark.parametrize('keys', [10, 100, 1000])
+def test_json_functions(connection, benchmark, function, keys):
+    create_documents(connection, keys)
+    results = {}
+    for implementation, prefix in (('previous', 'pg_temp.'), ('native', '')):
+        query = QUERIES[function].format(prefix=prefix)
+        benchmark(
+            lambda: connection.exec_driver_sql(query).scalar(),
+            function=function,
+            implementation=implementation,
+            rounds=3,
+            keys=keys
+        )
+        results[implementation] = connection.exec_driver_sql(query).scalar()
+    assert results['previous'] == results['native']
@@ -0,0 +1,32 @@
+import pytest
+import sqlalchemy as sa
+
+
+@pytest.fixture
+def activities(versioning_manager, activity_cls, user_class):
+    sa.orm.configure_mappers()
+    return [
+        activity_cls(
+            table_name='user',
+            verb='update',
+            old_data={'id': i, 'name': 'John', 'age': 15},
+            changed_data={'name': 'Luke'}
+        )
+        for i in range(5000)
+    ]
+
+
+@pytest.mark.parametrize('method', ['object', 'materialize', 'as_dict'])
+def test_materialize(benchmark, activities, activity_cls, method):
+    if method == 'object':
+        def func():
+            return [activity.object for activity in activities]
+    else:
+        def func():
+            return list(
+                activity_cls.materialize(
+                    activities,
+                    as_dict=method == 'as_dict'
+                )
+            )
+    benchmark(func, rows=len(activities), method=method)
@@ -0,0 +1,41 @@
+import pytest
+
+from postgresql_audit import base, VersioningManager
+
+MANAGERS = 100
+
+
+@pytest.fixture(params=['cached', 'uncached'])
+def cache(request, monkeypatch):
+    if request.param == 'uncached':
+        # Bypass the caches so that every template is read from the disk and
+        # rendered again, as before the templates were cached.
+        monkeypatch.setattr(
+            base,
+            'load_template',
+            base.load_template.__wrapped__
+        )
+        monkeypatch.setattr(
+            base,
+            'render_template',
+            base.render_template.__wrapped__
+        )
+    return request.param
+
+
+def test_versioning_manager_construction(benchmark, cache):
+    def func():
+        for _ in range(MANAGERS):
+            VersioningManager(schema_name='audit')
+
+    func()
+    benchmark(func, rows=MANAGERS, cache=cache)
+
+
+def test_render_sql_objects(benchmark, cache):
+    def func():
+        for _ in range(MANAGERS):
+            VersioningManager(schema_name='audit').sql_objects()
+
+    func()
+    benchmark(func, rows=MANAGERS, cache=cache)
@@ -0,0 +1,122 @@
+import pytest
+import sqlalchemy as sa
+
+from postgresql_audit import VersioningManager
+
+ROUNDS = 5
+
+WIDTHS = {'narrow': 3, 'wide': 50}
+
+
+@pytest.fixture
+def trigger_level(request):
+    return request.param
+
+
+@pytest.fixture
+def versioning_manager(base, trigger_level):
+    vm = VersioningManager(
+        use_statement_level_triggers=trigger_level == 'stmt_level'
+    )
+    vm.init(base)
+    yield vm
+    vm.remove_listeners()
+
+
+@pytest.fixture(params=sorted(WIDTHS))
+def width(request):
+    return request.param
+
+
+@pytest.fixture
+def benchmark_table(
+    engine,
+    versioning_manager,
+    table_creator,
+    trigger_level,
+    width,
+    exclude
+):
+    columns = ['column_{}'.format(i) for i in range(WIDTHS[width])]
+    table = sa.Table(
+        'benchmark_{}'.format(width),
+        sa.MetaData(),
+        sa.Column('id', sa.Integer, primary_key=True),
+        *(sa.Column(column, sa.Text) for column in columns)
+    )
+    with engine.begin() as connection:
+        table.create(connection)
+        if trigger_level != 'unaudited':
+            # Exclude every other column from the audited data.
+            excluded = columns[1::2] if exclude else None
+            connection.execute(
+                versioning_manager.build_audit_table_query(table, excluded)
+            )
+    yield table
+    with engine.begin() as connection:
+        table.drop(connection)
+
+
+def insert_sql(table, rows):
+    columns = [column.name for column in table.c if column.name != 'id']
+    return (
+        'INSERT INTO {table} ({columns}) '
+        'SELECT {values} FROM generate_series(1, {rows}) AS i'.format(
+            table=table.name,
+            columns=', '.join(columns),
+            values=', '.join("'value ' || i" for _ in columns),
+            rows=rows
+        )
+    )
+
+
+def operation_sql(table, operation, rows):
+    if operation == 'insert':
+        return insert_sql(table, rows)
+    elif operation == 'update':
+        return "UPDATE {} SET column_0 = column_0 || 'x'".format(table.name)
+    return 'DELETE FROM {}'.format(table.name)
+
+
+@pytest.mark.parametrize(
+    ('trigger_level', 'exclude'),
+    (
+        ('unaudited', False),
+        ('row_level', False),
+        ('row_level', True),
+        ('stmt_level', False),
+        ('stmt_level', True),
+    ),
+    indirect=['trigger_level']
+)
+@pytest.mark.parametrize('rows', [1, 10000])
+@pytest.mark.parametrize('operation', ['insert', 'update', 'delete'])
+def test_trigger_overhead(
+    engine,
+    benchmark,
+    benchmark_table,
+    trigger_level,
+    width,
+    exclude,
+    rows,
+    operation
+):
+    timings = []
+    for _ in range(ROUNDS):
+        with engine.connect() as connection:
+            transaction = connection.begin()
+            if operation != 'insert':
+                connection.exec_driver_sql(insert_sql(benchmark_table, rows))
+            with benchmark.timer(timings):
+                connection.exec_driver_sql(
+                    operation_sql(benchmark_table, operation, rows)
+                )
+            transaction.rollback()
+    benchmark.record(
+        timings,
+        rows=rows,
+        trigger_level=trigger_level,
+        width=width,
+        exclude=exclude,
+        operation=operation
+    )
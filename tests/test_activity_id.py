@@ -0,0 +1,134 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import text
+
+from postgresql_audit import ImproperlyConfigured, VersioningManager
+
+from .utils import last_activity
+
+
+@pytest.fixture
+def activity_id_strategy():
+    return 'sequence'
+
+
+@pytest.fixture
+def activity_id_cache():
+    return None
+
+
+@pytest.fixture(params=[True, False], ids=['stmt_level', 'row_level'])
+def versioning_manager(
+    base,
+    schema_name,
+    activity_id_strategy,
+    activity_id_cache,
+    request
+):
+    vm = VersioningManager(
+        schema_name=schema_name,
+        use_statement_level_triggers=request.param,
+        activity_id_strategy=activity_id_strategy,
+        activity_id_cache=activity_id_cache
+    )
+    vm.init(base)
+    yield vm
+    vm.remove_listeners()
+
+
+def sequence_cache_size(session):
+    return session.execute(
+        text(
+            "SELECT cache_size FROM pg_sequences "
+            "WHERE sequencename = 'activity_id_seq'"
+        )
+    ).scalar()
+
+
+class TestActivityIdStrategyValidation(object):
+    def test_unknown_strategy(self):
+        with pytest.raises(ImproperlyConfigured):
+            VersioningManager(activity_id_strategy='uuid')
+
+    def test_min_activity_id_requires_time_ordered_ids(self):
+        with pytest.raises(ImproperlyConfigured):
+            VersioningManager().min_activity_id(datetime(2024, 1, 1))
+
+    def test_min_activity_id(self):
+        manager = VersioningManager(activity_id_strategy='time_ordered')
+        assert manager.min_activity_id(datetime(2020, 1, 1)) == 0
+        assert manager.min_activity_id(
+            datetime(2020, 1, 1, 0, 0, 1)
+        ) == 1000 << 22
+
+
+@pytest.mark.usefixtures('versioning_manager', 'table_creator')
+class TestCachedSequence(object):
+    @pytest.fixture
+    def activity_id_cache(self):
+        return 20
+
+    def test_sequence_is_cached(self, session):
+        assert sequence_cache_size(session) == 20
+
+    def test_insert(self, user, session):
+        assert last_activity(session)['id'] == 1
+
+
+@pytest.mark.usefixtures('versioning_manager', 'table_creator')
+class TestIdentity(object):
+    @pytest.fixture
+    def activity_id_strategy(self):
+        return 'identity'
+
+    @pytest.fixture
+    def activity_id_cache(self):
+        return 20
+
+    def test_id_is_identity_column(self, session):
+        assert session.execute(
+            text(
+                "SELECT attidentity FROM pg_attribute "
+                "WHERE attrelid = 'activity'::regclass AND attname = 'id'"
+            )
+        ).scalar() == 'd'
+        assert sequence_cache_size(session) == 20
+
+    def test_insert(self, user, session):
+        assert last_activity(session)['id'] == 1
+
+
+@pytest.mark.usefixtures('versioning_manager', 'table_creator')
+class TestTimeOrdered(object):
+    @pytest.fixture
+    def activity_id_strategy(self):
+        return 'time_ordered'
+
+    def test_id_encodes_issued_at(self, versioning_manager, user, session):
+        activity = last_activity(session)
+        issued_at = activity['issued_at']
+        assert (
+            versioning_manager.min_activity_id(issued_at) <=
+            activity['id'] <
+            versioning_manager.min_activity_id(
+                issued_at + timedelta(milliseconds=1)
+            )
+        )
+
+    def test_ids_grow_with_time(self, user_class, session):
+        session.add(user_class(name='John'))
+        session.commit()
+        first = last_activity(session)['id']
+        session.add(user_class(name='Luke'))
+        session.commit()
+        assert last_activity(session)['id'] > first
+
+    def test_column_default(self, session):
+        session.execute(
+            text(
+                "INSERT INTO activity (issued_at, verb) "
+                "VALUES (now() AT TIME ZONE 'UTC', 'insert')"
+            )
+        )
+        assert last_activity(session)['id'] > 0
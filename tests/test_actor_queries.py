@@ -0,0 +1,157 @@
+from datetime import datetime, timedelta
+
+import pytest
+import sqlalchemy as sa
+from sqlalchemy import text
+
+from postgresql_audit import VersioningManager
+
+
+@pytest.fixture
+def versioning_manager(base):
+    vm = VersioningManager(actor_indexes=True)
+    vm.init(base)
+    yield vm
+    vm.remove_listeners()
+
+
+def index_names(table):
+    return {index.name for index in table.indexes}
+
+
+def create_users(versioning_manager, session, user_class, actor_id, *names):
+    versioning_manager.values = {'actor_id': actor_id}
+    for name in names:
+        session.add(user_class(name=name))
+        session.commit()
+
+
+@pytest.mark.usefixtures('table_creator')
+class TestActorIndexes(object):
+    def test_declares_indexes(self, activity_cls, transaction_cls):
+        assert 'ix_activity_transaction_id' in index_names(
+            activity_cls.__table__
+        )
+        assert 'ix_transaction_actor_id_issued_at' in index_names(
+            transaction_cls.__table__
+        )
+
+    def test_creates_indexes(self, engine):
+        inspector = sa.inspect(engine)
+        assert 'ix_activity_transaction_id' in {
+            index['name'] for index in inspector.get_indexes('activity')
+        }
+        assert 'ix_transaction_actor_id_issued_at' in {
+            index['name'] for index in inspector.get_indexes('transaction')
+        }
+
+
+class TestWithoutActorIndexes(object):
+    def test_does_not_declare_indexes(self, base):
+        vm = VersioningManager()
+        vm.init(base)
+        try:
+            sa.orm.configure_mappers()
+            assert 'ix_activity_transaction_id' not in index_names(
+                vm.activity_cls.__table__
+            )
+            assert 'ix_transaction_actor_id_issued_at' not in index_names(
+                vm.transaction_cls.__table__
+            )
+        finally:
+            vm.remove_listeners()
+
+
+@pytest.mark.usefixtures('table_creator')
+class TestActorActivities(object):
+    def test_filters_by_actor(
+        self,
+        versioning_manager,
+        user_class,
+        session
+    ):
+        create_users(versioning_manager, session, user_class, '1', 'John')
+        create_users(versioning_manager, session, user_class, '2', 'Jack')
+        activities = session.scalars(
+            versioning_manager.actor_activities('1')
+        ).all()
+        assert [activity.changed_data['name'] for activity in activities] == [
+            'John'
+        ]
+
+    def test_orders_by_issue_time(
+        self,
+        versioning_manager,
+        user_class,
+        session
+    ):
+        create_users(
+            versioning_manager,
+            session,
+            user_class,
+            '1',
+            'John',
+            'Jack',
+            'Luke'
+        )
+        activities = session.scalars(
+            versioning_manager.actor_activities('1')
+        ).all()
+        assert [activity.changed_data['name'] for activity in activities] == [
+            'John',
+            'Jack',
+            'Luke'
+        ]
+
+    def test_time_window(
+        self,
+        versioning_manager,
+        user_class,
+        transaction_cls,
+        session
+    ):
+        create_users(
+            versioning_manager,
+            session,
+            user_class,
+            '1',
+            'John',
+            'Jack',
+            'Luke'
+        )
+        start = datetime(2024, 1, 1)
+        transactions = session.scalars(
+            sa.select(transaction_cls).order_by(transaction_cls.id)
+        ).all()
+        for days, transaction in enumerate(transactions):
+            transaction.issued_at = start + timedelta(days=days)
+        session.commit()
+        activities = session.scalars(
+            versioning_manager.actor_activities(
+                '1',
+                start=start + timedelta(days=1),
+                end=start + timedelta(days=2)
+            )
+        ).all()
+        assert [activity.changed_data['name'] for activity in activities] == [
+            'Jack'
+        ]
+
+    def test_uses_indexes(self, versioning_manager, session):
+        query = versioning_manager.actor_activities(
+            '1',
+            start=datetime(2024, 1, 1),
+            end=datetime(2024, 2, 1)
+        ).compile(dialect=session.bind.dialect)
+        session.execute(text('SET LOCAL enable_seqscan = off'))
+        session.execute(text('SET LOCAL enable_bitmapscan = off'))
+        plan = '\n'.join(
+            session.connection().exec_driver_sql(
+                'EXPLAIN ' + query.string,
+                query.params
+            ).scalars()
+        )
+        assert 'Index Only Scan using ix_transaction_actor_id_issued_at' in (
+            plan
+        )
+        assert 'ix_activity_transaction_id' in plan
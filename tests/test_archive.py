@@ -0,0 +1,357 @@
+import os
+from datetime import datetime, timedelta, timezone
+
+import pytest
+import sqlalchemy as sa
+from sqlalchemy import text
+
+from postgresql_audit import ActivityArchive, VersioningManager
+
+
+@pytest.fixture
+def archive(tmp_path):
+    with ActivityArchive(str(tmp_path / 'archive'), block_size=2) as archive:
+        yield archive
+
+
+def utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def age(session, cls, days, *criteria):
+    session.execute(
+        sa.update(cls)
+        .where(*criteria)
+        .values(issued_at=utcnow() - timedelta(days=days))
+    )
+    session.commit()
+
+
+def live_activities(session, activity_cls):
+    return session.scalars(
+        sa.select(activity_cls).order_by(activity_cls.id)
+    ).all()
+
+
+@pytest.fixture
+def users(versioning_manager, session, user_class):
+    users = []
+    for actor_id, name in [('1', 'John'), ('2', 'Jack'), ('1', 'Luke')]:
+        versioning_manager.values = {'actor_id': actor_id}
+        user = user_class(name=name, age=15)
+        session.add(user)
+        session.commit()
+        users.append(user)
+    versioning_manager.values = {'actor_id': '1'}
+    users[0].name = 'Leia'
+    session.commit()
+    versioning_manager.values = {}
+    return users
+
+
+@pytest.mark.usefixtures('versioning_manager', 'table_creator')
+class TestArchive(object):
+    def test_moves_old_activities(
+        self,
+        archive,
+        versioning_manager,
+        users,
+        article,
+        activity_cls,
+        engine,
+        session
+    ):
+        age(session, activity_cls, 100, activity_cls.table_name == 'user')
+        old = live_activities(session, activity_cls)[:4]
+        name = archive.archive(
+            engine,
+            versioning_manager,
+            before=utcnow() - timedelta(days=30)
+        )
+        assert archive.segment_names() == [name]
+        assert [
+            activity.table_name
+            for activity in live_activities(session, activity_cls)
+        ] == ['article']
+        rows = list(archive.activities())
+        assert [row['id'] for row in rows] == [activity.id for activity in old]
+        assert rows[0]['changed_data'] == old[0].changed_data
+        assert rows[0]['issued_at'] == old[0].issued_at
+        assert rows[0]['record_key'] == [users[0].id]
+        assert rows[0]['actor_id'] == '1'
+
+    def test_nothing_to_archive(
+        self,
+        archive,
+        versioning_manager,
+        users,
+        engine
+    ):
+        assert archive.archive(
+            engine,
+            versioning_manager,
+            before=utcnow() - timedelta(days=30)
+        ) is None
+        assert archive.segment_names() == []
+        assert not os.listdir(archive.path)
+
+    def test_history_for(
+        self,
+        archive,
+        versioning_manager,
+        users,
+        activity_cls,
+        engine,
+        session
+    ):
+        expected = [
+            (activity.id, activity.changed_data)
+            for activity in session.scalars(
+                activity_cls.history_for(users[0])
+            )
+        ]
+        archive.archive(engine, versioning_manager, before=utcnow())
+        assert [
+            (row['id'], row['changed_data'])
+            for row in archive.history_for('user', [users[0].id])
+        ] == expected
+        assert len(expected) == 2
+
+    def test_actor_activities(
+        self,
+        archive,
+        versioning_manager,
+        users,
+        engine,
+        session
+    ):
+        expected = [
+            activity.id
+            for activity in session.scalars(
+                versioning_manager.actor_activities('1')
+            )
+        ]
+        archive.archive(engine, versioning_manager, before=utcnow())
+        assert [
+            row['id'] for row in archive.actor_activities('1')
+        ] == expected
+        assert [
+            row['id'] for row in archive.actor_activities(
+                '1',
+                end=utcnow() - timedelta(days=1)
+            )
+        ] == []
+
+    def test_time_filters(
+        self,
+        archive,
+        versioning_manager,
+        users,
+        activity_cls,
+        engine,
+        session
+    ):
+        age(session, activity_cls, 100)
+        age(session, activity_cls, 50, activity_cls.verb == 'update')
+        archive.archive(engine, versioning_manager, before=utcnow())
+        rows = archive.activities(
+            start=utcnow() - timedelta(days=60)
+        )
+        assert [row['verb'] for row in rows] == ['update']
+
+    def test_merges_segments(
+        self,
+        archive,
+        versioning_manager,
+        users,
+        activity_cls,
+        engine,
+        session
+    ):
+        age(session, activity_cls, 100, activity_cls.verb == 'update')
+        archive.archive(
+            engine,
+            versioning_manager,
+            before=utcnow() - timedelta(days=30)
+        )
+        archive.archive(engine, versioning_manager, before=utcnow())
+        assert len(archive.segment_names()) == 2
+        ids = [row['id'] for row in archive.activities()]
+        assert ids == sorted(ids)
+        assert len(ids) == 4
+
+    def test_skips_blocks(
+        self,
+        archive,
+        versioning_manager,
+        users,
+        article,
+        engine,
+        monkeypatch
+    ):
+        archive.archive(engine, versioning_manager, before=utcnow())
+        segment = archive.segments[0]
+        assert [block['tables'] for block in segment.index['blocks']] == [
+            ['user'],
+            ['user'],
+            ['article'],
+        ]
+        read = []
+        read_block = segment.read_block
+
+        def read_block_spy(block):
+            read.append(block['offset'])
+            return read_block(block)
+
+        monkeypatch.setattr(segment, 'read_block', read_block_spy)
+        rows = list(archive.activities(tables=['article']))
+        assert [row['table_name'] for row in rows] == ['article']
+        assert len(read) == 1
+        assert list(archive.activities(actor_id='2')) == [
+            row for row in archive.activities() if row['actor_id'] == '2'
+        ]
+
+    def test_keeps_segment_on_reopen(
+        self,
+        archive,
+        versioning_manager,
+        users,
+        engine
+    ):
+        archive.archive(engine, versioning_manager, before=utcnow())
+        with ActivityArchive(archive.path) as reopened:
+            assert len(list(reopened.activities())) == 4
+
+    def test_removes_segment_on_failure(
+        self,
+        archive,
+        versioning_manager,
+        users,
+        engine
+    ):
+        @sa.event.listens_for(engine, 'before_cursor_execute')
+        def fail_delete(conn, cursor, statement, *args):
+            if statement.startswith('DELETE'):
+                raise RuntimeError
+
+        with pytest.raises(RuntimeError):
+            archive.archive(
+                engine,
+                versioning_manager,
+                before=utcnow()
+            )
+        sa.event.remove(engine, 'before_cursor_execute', fail_delete)
+        assert archive.segment_names() == []
+        assert not os.listdir(archive.path)
+
+    def test_removes_segment_when_commit_fails(
+        self,
+        archive,
+        versioning_manager,
+        users,
+        activity_cls,
+        engine,
+        session
+    ):
+        @sa.event.listens_for(engine, 'commit')
+        def fail_commit(conn):
+            raise RuntimeError
+
+        with pytest.raises(RuntimeError):
+            archive.archive(engine, versioning_manager, before=utcnow())
+        sa.event.remove(engine, 'commit', fail_commit)
+        assert not os.listdir(archive.path)
+        assert len(live_activities(session, activity_cls)) == 4
+
+    def test_completes_pending_segment(
+        self,
+        archive,
+        versioning_manager,
+        users,
+        engine,
+        monkeypatch
+    ):
+        def crash(name):
+            raise RuntimeError
+
+        with monkeypatch.context() as patch:
+            patch.setattr(archive, 'complete_segment', crash)
+            with pytest.raises(RuntimeError):
+                archive.archive(engine, versioning_manager, before=utcnow())
+        assert archive.segment_names() == []
+        assert len(archive.pending_segment_names()) == 1
+        assert archive.archive(
+            engine,
+            versioning_manager,
+            before=utcnow()
+        ) is None
+        assert archive.pending_segment_names() == []
+        assert len(list(archive.activities())) == 4
+
+    def test_skips_activities_archived_twice(
+        self,
+        archive,
+        versioning_manager,
+        users,
+        engine,
+        monkeypatch
+    ):
+        @sa.event.listens_for(engine, 'commit')
+        def fail_commit(conn):
+            raise RuntimeError
+
+        # Crashing before the commit leaves the pending segment behind.
+        with monkeypatch.context() as patch:
+            patch.setattr(archive, 'remove_segment', lambda name: None)
+            with pytest.raises(RuntimeError):
+                archive.archive(engine, versioning_manager, before=utcnow())
+        sa.event.remove(engine, 'commit', fail_commit)
+        archive.archive(engine, versioning_manager, before=utcnow())
+        assert len(archive.segment_names()) == 2
+        rows = list(archive.activities())
+        assert len(rows) == 4
+        assert len(list(archive.history_for('user', [users[0].id]))) == 2
+
+
+@pytest.mark.usefixtures('table_creator')
+class TestArchivePartition(object):
+    @pytest.fixture
+    def versioning_manager(self, base):
+        vm = VersioningManager(partitioned=True)
+        vm.init(base)
+        yield vm
+        vm.remove_listeners()
+
+    def test_archive_partition(
+        self,
+        archive,
+        versioning_manager,
+        users,
+        activity_cls,
+        engine,
+        session
+    ):
+        versioning_manager.create_partitions(
+            session,
+            count=1,
+            interval='year',
+            start=datetime(2020, 1, 1)
+        )
+        session.execute(
+            sa.update(activity_cls).values(issued_at=datetime(2020, 6, 1))
+        )
+        session.commit()
+        names = versioning_manager.detach_partitions(
+            session,
+            before=datetime(2021, 1, 1)
+        )
+        session.commit()
+        assert archive.archive_partition(
+            engine,
+            versioning_manager,
+            names[0]
+        ) is not None
+        assert len(list(archive.activities())) == 4
+        assert session.execute(
+            text("SELECT to_regclass('activity_p20200101')")
+        ).scalar() is None
@@ -0,0 +1,142 @@
+import pytest
+import sqlalchemy as sa
+from sqlalchemy import text
+
+from postgresql_audit import VersioningManager
+from postgresql_audit.base import activity_checkpoint_table
+from postgresql_audit.migrations import get_migration_chunk_table
+
+from .utils import last_activity
+
+
+@pytest.fixture(params=[True, False], ids=['stmt_level', 'row_level'])
+def versioning_manager(base, schema_name, request):
+    vm = VersioningManager(
+        schema_name=schema_name,
+        use_statement_level_triggers=request.param
+    )
+    vm.init(base)
+    yield vm
+    vm.remove_listeners()
+
+
+def audit_triggers(session, table_name):
+    return session.execute(
+        text(
+            "SELECT tgname, xmin::text, pg_get_triggerdef(oid) "
+            "FROM pg_trigger "
+            "WHERE tgrelid = to_regclass(:table_name) AND NOT tgisinternal "
+            "ORDER BY tgname"
+        ),
+        {'table_name': table_name}
+    ).all()
+
+
+@pytest.mark.usefixtures('versioning_manager', 'table_creator')
+class TestAuditTables(object):
+    def test_create_all_audits_tables_in_one_statement(
+        self,
+        base,
+        engine,
+        versioning_manager,
+        session
+    ):
+        statements = []
+
+        def receive_before_cursor_execute(conn, cursor, statement, *args):
+            if 'audit_table' in statement:
+                statements.append(statement)
+
+        class Tag(base):
+            __tablename__ = 'tag'
+            __versioned__ = {}
+            id = sa.Column(sa.Integer, primary_key=True)
+
+        class Comment(base):
+            __tablename__ = 'comment'
+            __versioned__ = {'exclude': ['content']}
+            id = sa.Column(sa.Integer, primary_key=True)
+            content = sa.Column(sa.Text)
+
+        sa.orm.configure_mappers()
+        sa.event.listen(
+            engine,
+            'before_cursor_execute',
+            receive_before_cursor_execute
+        )
+        try:
+            with engine.begin() as connection:
+                base.metadata.create_all(connection)
+        finally:
+            sa.event.remove(
+                engine,
+                'before_cursor_execute',
+                receive_before_cursor_execute
+            )
+        assert len(statements) == 1
+        assert audit_triggers(session, 'tag')
+        assert "'{content}'" in audit_triggers(session, 'comment')[0][2]
+
+    def test_audit_table_leaves_up_to_date_triggers_alone(self, session):
+        triggers = audit_triggers(session, 'user')
+        session.execute(text("SELECT audit_table('user')"))
+        assert audit_triggers(session, 'user') == triggers
+
+    def test_audit_table_replaces_triggers_with_changed_condition(
+        self,
+        session
+    ):
+        for name, xmin, definition in audit_triggers(session, 'user'):
+            session.execute(text(
+                definition
+                .replace('CREATE TRIGGER', 'CREATE OR REPLACE TRIGGER')
+                .replace('WHEN (', 'WHEN (NOT ')
+            ))
+        session.execute(text("SELECT audit_table('user')"))
+        for name, xmin, definition in audit_triggers(session, 'user'):
+            assert 'NOT ' not in definition
+            assert 'get_setting' in definition
+
+    def test_audit_table_replaces_changed_triggers(self, user, session):
+        session.execute(text("SELECT audit_table('user', '{age}')"))
+        for name, xmin, definition in audit_triggers(session, 'user'):
+            assert "'{age}'" in definition
+        user.age = 30
+        session.flush()
+        assert last_activity(session)['verb'] == 'insert'
+
+    def test_audit_tables(self, versioning_manager, user_class, session):
+        session.execute(text('CREATE TABLE tag (id integer, name text)'))
+        tag = sa.Table(
+            'tag',
+            sa.MetaData(),
+            sa.Column('id', sa.Integer),
+            sa.Column('name', sa.Text)
+        )
+        versioning_manager.audit_tables(
+            session,
+            [user_class.__table__, (tag, ['name'])]
+        )
+        session.execute(text("INSERT INTO tag VALUES (1, 'Some tag')"))
+        activity = last_activity(session)
+        assert activity['table_name'] == 'tag'
+        assert activity['changed_data'] == {'id': 1}
+
+    def test_audit_schema(self, session):
+        session.execute(text('CREATE TABLE tag (id integer)'))
+        get_migration_chunk_table().create(
+            session.connection(),
+            checkfirst=True
+        )
+        activity_checkpoint_table(sa.MetaData(), None).create(
+            session.connection()
+        )
+        session.execute(text("SELECT audit_schema('public')"))
+        assert audit_triggers(session, 'tag')
+        assert not audit_triggers(session, 'activity')
+        assert not audit_triggers(session, 'transaction')
+        assert not audit_triggers(session, 'audit_sql_object')
+        assert not audit_triggers(session, 'activity_migration_chunk')
+        assert not audit_triggers(session, 'activity_checkpoint')
+        session.execute(text('INSERT INTO tag VALUES (1)'))
+        assert last_activity(session)['table_name'] == 'tag'
@@ -0,0 +1,233 @@
+import pytest
+import sqlalchemy as sa
+from sqlalchemy import text
+
+from postgresql_audit import ImproperlyConfigured, VersioningManager
+
+
+@pytest.fixture
+def versioning_manager(base):
+    vm = VersioningManager(checkpoint_intervals={'user': 3})
+    vm.init(base)
+    yield vm
+    vm.remove_listeners()
+
+
+def get_checkpoints(versioning_manager, session):
+    checkpoint = versioning_manager.checkpoint_table
+    return session.execute(
+        sa.select(checkpoint.c.record_key, checkpoint.c.data)
+        .order_by(checkpoint.c.activity_id)
+    ).all()
+
+
+def last_issued_at(activity_cls, session):
+    return session.execute(
+        sa.select(sa.func.max(activity_cls.issued_at))
+    ).scalar()
+
+
+def rename(session, user, *names):
+    for name in names:
+        user.name = name
+        session.commit()
+
+
+@pytest.mark.usefixtures('table_creator')
+class TestReconstruct(object):
+    def test_latest_state(self, versioning_manager, user, session):
+        rename(session, user, 'Jack', 'Luke')
+        assert versioning_manager.reconstruct(session, 'user', user.id) == {
+            'id': user.id,
+            'name': 'Luke',
+            'age': 15
+        }
+
+    def test_state_at_time(
+        self,
+        versioning_manager,
+        activity_cls,
+        user_class,
+        user,
+        session
+    ):
+        rename(session, user, 'Jack')
+        at = last_issued_at(activity_cls, session)
+        rename(session, user, 'Luke')
+        assert versioning_manager.reconstruct(
+            session,
+            user_class,
+            user.id,
+            at=at
+        )['name'] == 'Jack'
+
+    def test_before_insert(
+        self,
+        versioning_manager,
+        activity_cls,
+        user_class,
+        session
+    ):
+        session.add(user_class(name='Jack'))
+        session.commit()
+        at = last_issued_at(activity_cls, session)
+        user = user_class(name='John')
+        session.add(user)
+        session.commit()
+        assert versioning_manager.reconstruct(
+            session,
+            user_class.__table__,
+            user.id,
+            at=at
+        ) is None
+
+    def test_deleted_record(self, versioning_manager, user, session):
+        user_id = user.id
+        session.delete(user)
+        session.commit()
+        assert versioning_manager.reconstruct(session, 'user', user_id) is None
+
+    def test_reinserted_record(
+        self,
+        versioning_manager,
+        user_class,
+        user,
+        session
+    ):
+        user_id = user.id
+        session.delete(user)
+        session.commit()
+        session.add(user_class(id=user_id, name='Jack'))
+        session.commit()
+        assert versioning_manager.reconstruct(session, 'user', user_id) == {
+            'id': user_id,
+            'name': 'Jack',
+            'age': None
+        }
+
+    def test_composite_key(self, versioning_manager, session):
+        assert versioning_manager.reconstruct(
+            session,
+            'article',
+            (1, 'unknown')
+        ) is None
+
+
+@pytest.mark.usefixtures('table_creator')
+class TestCreateCheckpoints(object):
+    def test_records_below_interval(self, versioning_manager, user, session):
+        rename(session, user, 'Jack')
+        assert versioning_manager.create_checkpoints(session) == 0
+
+    def test_creates_checkpoint(self, versioning_manager, user, session):
+        rename(session, user, 'Jack', 'Luke')
+        assert versioning_manager.create_checkpoints(session) == 1
+        assert get_checkpoints(versioning_manager, session) == [
+            ([user.id], {'id': user.id, 'name': 'Luke', 'age': 15})
+        ]
+
+    def test_counts_activities_since_latest_checkpoint(
+        self,
+        versioning_manager,
+        user,
+        session
+    ):
+        rename(session, user, 'Jack', 'Luke')
+        versioning_manager.create_checkpoints(session)
+        rename(session, user, 'Leia', 'Han')
+        assert versioning_manager.create_checkpoints(session) == 0
+        rename(session, user, 'Obi-Wan')
+        assert versioning_manager.create_checkpoints(session) == 1
+        assert get_checkpoints(versioning_manager, session)[-1].data[
+            'name'
+        ] == 'Obi-Wan'
+
+    def test_skips_deleted_records(self, versioning_manager, user, session):
+        rename(session, user, 'Jack')
+        session.delete(user)
+        session.commit()
+        assert versioning_manager.create_checkpoints(session) == 0
+
+    def test_skips_tables_without_interval(
+        self,
+        versioning_manager,
+        article,
+        session
+    ):
+        rename(session, article, 'Some other article', 'Third article')
+        assert versioning_manager.create_checkpoints(session) == 0
+
+    def test_filters_tables(self, versioning_manager, user, session):
+        rename(session, user, 'Jack', 'Luke')
+        assert versioning_manager.create_checkpoints(
+            session,
+            tables=['article']
+        ) == 0
+
+    def test_reconstruct_starts_from_checkpoint(
+        self,
+        versioning_manager,
+        activity_cls,
+        user,
+        session
+    ):
+        rename(session, user, 'Jack', 'Luke')
+        versioning_manager.create_checkpoints(session)
+        rename(session, user, 'Leia')
+        # Activities before the checkpoint are not needed anymore.
+        session.execute(
+            sa.update(activity_cls)
+            .where(activity_cls.verb != 'update')
+            .values(changed_data={'age': 99})
+            .execution_options(synchronize_session=False)
+        )
+        session.execute(
+            sa.update(activity_cls)
+            .where(activity_cls.changed_data['name'].astext != 'Leia')
+            .values(old_data={}, changed_data={})
+            .execution_options(synchronize_session=False)
+        )
+        assert versioning_manager.reconstruct(session, 'user', user.id) == {
+            'id': user.id,
+            'name': 'Leia',
+            'age': 15
+        }
+
+    def test_reconstruct_before_checkpoint(
+        self,
+        versioning_manager,
+        activity_cls,
+        user,
+        session
+    ):
+        rename(session, user, 'Jack')
+        at = last_issued_at(activity_cls, session)
+        rename(session, user, 'Luke')
+        versioning_manager.create_checkpoints(session)
+        assert versioning_manager.reconstruct(
+            session,
+            'user',
+            user.id,
+            at=at
+        )['name'] == 'Jack'
+
+
+class TestWithoutCheckpointTable(object):
+    def test_raises_error(self, base, session):
+        vm = VersioningManager()
+        vm.init(base)
+        try:
+            with pytest.raises(ImproperlyConfigured):
+                vm.reconstruct(session, 'user', 1)
+            with pytest.raises(ImproperlyConfigured):
+                vm.create_checkpoints(session)
+        finally:
+            vm.remove_listeners()
+
+
+@pytest.mark.usefixtures('table_creator')
+class TestCheckpointTable(object):
+    def test_created_with_activity_table(self, session):
+        assert session.execute(
+            text("SELECT to_regclass('activity_checkpoint') IS NOT NULL")
+        ).scalar()
@@ -0,0 +1,169 @@
+import csv
+import io
+import json
+from datetime import datetime, timedelta
+
+import pytest
+import sqlalchemy as sa
+
+
+@pytest.fixture
+def users(versioning_manager, session, user_class):
+    users = []
+    for actor_id, name in [('1', 'John'), ('2', 'Jack'), ('1', 'Luke')]:
+        versioning_manager.values = {'actor_id': actor_id}
+        user = user_class(name=name, age=15)
+        session.add(user)
+        session.commit()
+        users.append(user)
+    versioning_manager.values = {}
+    return users
+
+
+def read_ndjson(file):
+    return [json.loads(line) for line in file.getvalue().splitlines()]
+
+
+def read_csv(file):
+    return list(csv.DictReader(io.StringIO(file.getvalue())))
+
+
+@pytest.mark.usefixtures('versioning_manager', 'table_creator', 'users')
+class TestIterExport(object):
+    def test_rows(self, versioning_manager, session):
+        rows = list(versioning_manager.iter_export(session))
+        assert [row['changed_data']['name'] for row in rows] == [
+            'John',
+            'Jack',
+            'Luke'
+        ]
+        assert [row['actor_id'] for row in rows] == ['1', '2', '1']
+        assert set(rows[0]) == {
+            'id',
+            'schema_name',
+            'table_name',
+            'issued_at',
+            'verb',
+            'old_data',
+            'changed_data',
+            'transaction_id',
+            'actor_id',
+            'client_addr',
+        }
+
+    def test_filters_by_actor(self, versioning_manager, session):
+        rows = versioning_manager.iter_export(session, actor_id='2')
+        assert [row['changed_data']['name'] for row in rows] == ['Jack']
+
+    def test_filters_by_tables(self, versioning_manager, article, session):
+        rows = versioning_manager.iter_export(session, tables=['article'])
+        assert [row['table_name'] for row in rows] == ['article']
+
+    def test_filters_by_time(
+        self,
+        versioning_manager,
+        activity_cls,
+        session
+    ):
+        start = datetime(2024, 1, 1)
+        activities = session.scalars(
+            sa.select(activity_cls).order_by(activity_cls.id)
+        ).all()
+        for days, activity in enumerate(activities):
+            activity.issued_at = start + timedelta(days=days)
+        session.commit()
+        rows = versioning_manager.iter_export(
+            session,
+            start=start + timedelta(days=1),
+            end=start + timedelta(days=2)
+        )
+        assert [row['changed_data']['name'] for row in rows] == ['Jack']
+
+    def test_uses_server_side_cursor(self, versioning_manager, engine):
+        with engine.connect() as connection:
+            rows = versioning_manager.iter_export(connection, batch_size=1)
+            next(rows)
+            assert connection.exec_driver_sql(
+                'SELECT count(*) FROM pg_cursors'
+            ).scalar() == 1
+
+
+@pytest.mark.usefixtures('versioning_manager', 'table_creator', 'users')
+class TestExport(object):
+    def test_ndjson(self, versioning_manager, session):
+        file = io.StringIO()
+        assert versioning_manager.export(session, file) == 3
+        rows = read_ndjson(file)
+        assert [row['changed_data']['name'] for row in rows] == [
+            'John',
+            'Jack',
+            'Luke'
+        ]
+        assert [row['actor_id'] for row in rows] == ['1', '2', '1']
+
+    @pytest.mark.parametrize('use_copy', [True, False])
+    def test_csv(self, versioning_manager, session, use_copy):
+        file = io.StringIO()
+        assert versioning_manager.export(
+            session,
+            file,
+            format='csv',
+            actor_id='1',
+            use_copy=use_copy
+        ) == 2
+        rows = read_csv(file)
+        assert [json.loads(row['changed_data'])['name'] for row in rows] == [
+            'John',
+            'Luke'
+        ]
+        assert rows[0]['verb'] == 'insert'
+        assert rows[0]['client_addr'] == ''
+
+    def test_csv_with_and_without_copy_match(
+        self,
+        versioning_manager,
+        session
+    ):
+        files = [io.StringIO(), io.StringIO()]
+        for file, use_copy in zip(files, [True, False]):
+            versioning_manager.export(
+                session,
+                file,
+                format='csv',
+                use_copy=use_copy
+            )
+        assert read_csv(files[0]) == read_csv(files[1])
+
+    def test_filters(self, versioning_manager, article, session):
+        file = io.StringIO()
+        versioning_manager.export(
+            session,
+            file,
+            tables=['article'],
+            start=datetime(2000, 1, 1)
+        )
+        assert [row['table_name'] for row in read_ndjson(file)] == [
+            'article'
+        ]
+
+    @pytest.mark.parametrize('use_copy', [True, False])
+    def test_csv_filters_by_tables(
+        self,
+        versioning_manager,
+        article,
+        session,
+        use_copy
+    ):
+        file = io.StringIO()
+        assert versioning_manager.export(
+            session,
+            file,
+            format='csv',
+            tables=['article'],
+            use_copy=use_copy
+        ) == 1
+        assert [row['table_name'] for row in read_csv(file)] == ['article']
+
+    def test_unknown_format(self, versioning_manager, session):
+        with pytest.raises(ValueError):
+            versioning_manager.export(session, io.StringIO(), format='xml')
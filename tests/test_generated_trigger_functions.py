@@ -0,0 +1,248 @@
+import pytest
+import sqlalchemy as sa
+from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import JSON
+
+from postgresql_audit import VersioningManager
+
+from .utils import last_activity
+
+
+@pytest.fixture(params=[True, False], ids=['stmt_level', 'row_level'])
+def versioning_manager(base, schema_name, request):
+    vm = VersioningManager(
+        schema_name=schema_name,
+        use_statement_level_triggers=request.param,
+        use_generated_trigger_functions=True
+    )
+    vm.init(base)
+    yield vm
+    vm.remove_listeners()
+
+
+@pytest.fixture
+def user_class(base):
+    class User(base):
+        __tablename__ = 'user'
+        __versioned__ = {}
+        id = sa.Column(sa.Integer, primary_key=True)
+        name = sa.Column(sa.String(100))
+        age = sa.Column(sa.Integer)
+        settings = sa.Column(JSON)
+
+    return User
+
+
+@pytest.mark.usefixtures('versioning_manager', 'table_creator')
+class TestGeneratedTriggerFunctions(object):
+    def test_creates_table_specific_function(self, user, session):
+        assert session.execute(
+            text(
+                "SELECT count(*) FROM pg_trigger "
+                "JOIN pg_proc ON pg_proc.oid = pg_trigger.tgfoid "
+                "WHERE tgrelid = 'user'::regclass "
+                "AND proname = 'create_activity_' || tgrelid::oid"
+            )
+        ).scalar() > 0
+
+    def test_insert(self, user, session):
+        activity = last_activity(session)
+        assert activity['old_data'] == {}
+        assert activity['changed_data'] == {
+            'id': user.id,
+            'name': 'John',
+            'age': 15,
+            'settings': None
+        }
+        assert activity['table_name'] == 'user'
+        assert activity['native_transaction_id']
+        assert activity['verb'] == 'insert'
+
+    def test_update(self, user, session):
+        user.name = 'Luke'
+        session.flush()
+        activity = last_activity(session)
+        assert activity['old_data'] == {
+            'id': user.id,
+            'name': 'John',
+            'age': 15,
+            'settings': None
+        }
+        assert activity['changed_data'] == {'name': 'Luke'}
+        assert activity['verb'] == 'update'
+
+    def test_update_to_null(self, user, session):
+        user.age = None
+        session.flush()
+        activity = last_activity(session)
+        assert activity['changed_data'] == {'age': None}
+
+    def test_update_column_without_equality_operator(self, user, session):
+        user.settings = {'theme': 'dark'}
+        session.flush()
+        activity = last_activity(session)
+        assert activity['changed_data'] == {'settings': {'theme': 'dark'}}
+
+    def test_update_without_changes_is_skipped(
+        self,
+        user,
+        user_class,
+        session,
+        activity_cls
+    ):
+        session.execute(
+            user_class.__table__.update().values(name=user_class.name)
+        )
+        assert session.query(activity_cls).count() == 1
+
+    def test_delete(self, user, session):
+        session.delete(user)
+        session.flush()
+        activity = last_activity(session)
+        assert activity['old_data'] == {
+            'id': user.id,
+            'name': 'John',
+            'age': 15,
+            'settings': None
+        }
+        assert activity['changed_data'] == {}
+        assert activity['verb'] == 'delete'
+
+
+@pytest.mark.usefixtures('versioning_manager', 'table_creator')
+class TestGeneratedTriggerFunctionsWithColumnExclusion(object):
+    @pytest.fixture
+    def user(self, session, user_class):
+        session.execute(text('''SELECT audit_table('user', '{age}')'''))
+        user = user_class(name='John', age=15)
+        session.add(user)
+        session.flush()
+        return user
+
+    def test_insert(self, user, session):
+        activity = last_activity(session)
+        assert activity['changed_data'] == {
+            'id': user.id,
+            'name': 'John',
+            'settings': None
+        }
+
+    def test_update(self, user, session):
+        user.name = 'Luke'
+        user.age = 18
+        session.flush()
+        activity = last_activity(session)
+        assert activity['changed_data'] == {'name': 'Luke'}
+        assert activity['old_data'] == {
+            'id': user.id,
+            'name': 'John',
+            'settings': None
+        }
+
+    def test_update_of_excluded_column_is_skipped(
+        self,
+        user,
+        session,
+        activity_cls
+    ):
+        user.age = 18
+        session.flush()
+        assert session.query(activity_cls).count() == 1
+
+    def test_delete(self, user, session):
+        session.delete(user)
+        session.flush()
+        activity = last_activity(session)
+        assert activity['old_data'] == {
+            'id': user.id,
+            'name': 'John',
+            'settings': None
+        }
+
+
+@pytest.mark.usefixtures('versioning_manager', 'table_creator')
+class TestGeneratedTriggerFunctionsUpdatePairing(object):
+    @pytest.fixture
+    def users(self, table_creator, session, user_class):
+        session.execute(
+            user_class.__table__.insert(),
+            [{'id': i, 'name': 'User %s' % i, 'age': i} for i in range(1, 51)]
+        )
+        session.flush()
+
+    def updates(self, session, activity_cls):
+        return session.query(activity_cls).filter_by(verb='update').all()
+
+    @pytest.mark.usefixtures('users')
+    def test_pairs_rows_by_primary_key(
+        self,
+        session,
+        user_class,
+        activity_cls
+    ):
+        session.execute(
+            user_class.__table__.update().values(
+                name=sa.func.upper(user_class.name)
+            )
+        )
+        activities = self.updates(session, activity_cls)
+        assert len(activities) == 50
+        for activity in activities:
+            assert activity.changed_data == {
+                'name': activity.old_data['name'].upper()
+            }
+
+    @pytest.mark.usefixtures('users')
+    def test_primary_key_update(self, session, user_class, activity_cls):
+        session.execute(
+            user_class.__table__.update().values(id=user_class.id + 100)
+        )
+        activities = self.updates(session, activity_cls)
+        assert len(activities) == 50
+        for activity in activities:
+            assert activity.changed_data == {
+                'id': activity.old_data['id'] + 100
+            }
+
+
+@pytest.mark.usefixtures('versioning_manager', 'table_creator')
+class TestGeneratedTriggerFunctionsWithLongTableNames(object):
+    @pytest.fixture
+    def models(self, base):
+        prefix = 'table_with_a_long_name_sharing_its_prefix_'
+
+        class Foo(base):
+            __tablename__ = prefix + 'foo'
+            __versioned__ = {}
+            id = sa.Column(sa.Integer, primary_key=True)
+            foo = sa.Column(sa.String(100))
+
+        class Bar(base):
+            __tablename__ = prefix + 'bar'
+            __versioned__ = {}
+            id = sa.Column(sa.Integer, primary_key=True)
+            bar = sa.Column(sa.String(100))
+
+        return [Foo, Bar]
+
+    def test_tables_get_separate_functions(self, models, session):
+        for model in models:
+            record = model(id=1, **{model.__tablename__[-3:]: 'value'})
+            session.add(record)
+            session.flush()
+            record.id = 2
+            session.flush()
+            session.delete(record)
+            session.flush()
+        assert session.execute(
+            text(
+                "SELECT table_name, verb FROM activity ORDER BY id"
+            )
+        ).all() == [
+            (models[0].__tablename__, 'insert'),
+            (models[0].__tablename__, 'update'),
+            (models[0].__tablename__, 'delete'),
+            (models[1].__tablename__, 'insert'),
+            (models[1].__tablename__, 'update'),
+            (models[1].__tablename__, 'delete'),
+        ]
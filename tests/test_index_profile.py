@@ -0,0 +1,110 @@
+import pytest
+from sqlalchemy import text
+
+from postgresql_audit import (
+    create_activity_indexes,
+    ImproperlyConfigured,
+    IndexProfile,
+    VersioningManager
+)
+
+
+@pytest.fixture
+def index_profile():
+    return IndexProfile(
+        brin=['issued_at', 'id'],
+        gin=['changed_data'],
+        tables=['article'],
+        pages_per_range=16
+    )
+
+
+def get_index_definitions(connection):
+    return dict(
+        connection.execute(
+            text(
+                "SELECT indexname, indexdef FROM pg_indexes "
+                "WHERE tablename = 'activity'"
+            )
+        ).all()
+    )
+
+
+def assert_profile_indexes(index_definitions):
+    assert "USING brin (issued_at) WITH (pages_per_range='16')" in (
+        index_definitions['ix_activity_issued_at_brin']
+    )
+    assert 'USING brin (id)' in index_definitions['ix_activity_id_brin']
+    assert 'USING gin (changed_data)' in (
+        index_definitions['ix_activity_changed_data_gin']
+    )
+    assert "WHERE (table_name = 'article'::text)" in (
+        index_definitions['ix_activity_article_id']
+    )
+
+
+class TestIndexProfile(object):
+    def test_index_names(self, index_profile):
+        assert [index.name for index in index_profile.indexes()] == [
+            'ix_activity_issued_at_brin',
+            'ix_activity_id_brin',
+            'ix_activity_changed_data_gin',
+            'ix_activity_article_id',
+        ]
+
+    def test_gin_index_on_unknown_column(self):
+        with pytest.raises(ImproperlyConfigured):
+            IndexProfile(gin=['table_name'])
+
+
+@pytest.mark.usefixtures('table_creator')
+class TestIndexProfileCreation(object):
+    @pytest.fixture
+    def versioning_manager(self, base, index_profile):
+        vm = VersioningManager(index_profile=index_profile)
+        vm.init(base)
+        yield vm
+        vm.remove_listeners()
+
+    def test_creates_indexes(self, session):
+        assert_profile_indexes(get_index_definitions(session))
+
+    def test_partial_index_is_used(self, article, session):
+        session.execute(text('SET LOCAL enable_seqscan = off'))
+        plan = '\n'.join(
+            session.execute(
+                text(
+                    "EXPLAIN SELECT id FROM activity "
+                    "WHERE table_name = 'article' ORDER BY id"
+                )
+            ).scalars()
+        )
+        assert 'ix_activity_article_id' in plan
+
+
+@pytest.mark.usefixtures('table_creator')
+class TestCreateActivityIndexes(object):
+    def test_creates_indexes(self, index_profile, engine):
+        with engine.begin() as connection:
+            names = create_activity_indexes(connection, index_profile)
+            assert_profile_indexes(get_index_definitions(connection))
+        assert names == [
+            index.name for index in index_profile.indexes()
+        ]
+
+    def test_leaves_existing_indexes_alone(self, index_profile, engine):
+        with engine.begin() as connection:
+            create_activity_indexes(connection, index_profile)
+            create_activity_indexes(connection, index_profile)
+            assert_profile_indexes(get_index_definitions(connection))
+
+    def test_concurrently(self, index_profile, engine):
+        with engine.connect().execution_options(
+            isolation_level='AUTOCOMMIT'
+        ) as connection:
+            create_activity_indexes(
+                connection,
+                index_profile,
+                concurrently=True
+            )
+            assert_profile_indexes(get_index_definitions(connection))
@@ -27,6 +27,12 @@ class TestJSONBChangeKeyName(object):
                 'key2',
                 {"key2": 3}
             ),
+            (
+                '{}',
+                'key1',
+                'key2',
+                {}
+            ),
         )
     )
     def test_raw_sql(self, session, data, old_key, new_key, expected):
@@ -80,3 +86,22 @@ class TestJSONBChangeKeyName(object):
             sa.select(jsonb_change_key_name(data, old_key, new_key))
         ).scalar()
         assert result == expected
+
+
+@pytest.mark.usefixtures('activity_cls', 'table_creator')
+@pytest.mark.parametrize(
+    ('signature', 'volatility'),
+    (
+        ('jsonb_change_key_name(jsonb, text, text)', 'i'),
+        ('jsonb_subtract(jsonb, jsonb)', 'i'),
+        ('get_setting(text, text)', 's'),
+    )
+)
+def test_function_markings(session, signature, volatility):
+    assert session.execute(
+        sa.text(
+            'SELECT provolatile, proparallel FROM pg_proc '
+            'WHERE oid = CAST(:signature AS regprocedure)'
+        ),
+        {'signature': signature}
+    ).one() == (volatility, 's')
@@ -0,0 +1,145 @@
+import pytest
+import sqlalchemy as sa
+import sqlalchemy_utils
+
+from postgresql_audit.base import DeclarativeClassMap
+
+
+@pytest.fixture
+def entity_classes(base):
+    class Entity(base):
+        __tablename__ = 'entity'
+        __versioned__ = {}
+        id = sa.Column(sa.Integer, primary_key=True)
+        type = sa.Column(sa.String(50))
+        name = sa.Column(sa.String(100))
+        __mapper_args__ = {
+            'polymorphic_on': type,
+            'polymorphic_identity': 'entity'
+        }
+
+    class Person(Entity):
+        __mapper_args__ = {'polymorphic_identity': 'person'}
+
+    return Entity, Person
+
+
+@pytest.fixture
+def models(user_class, article_class, entity_classes):
+    return [user_class, article_class] + list(entity_classes)
+
+
+@pytest.fixture
+def activities(session, activity_cls, user_class, article_class):
+    user = user_class(name='John', age=15)
+    session.add(user)
+    session.commit()
+    session.add(article_class(name='Some article'))
+    session.commit()
+    user.name = 'Luke'
+    session.commit()
+    return session.scalars(
+        sa.select(activity_cls).order_by(activity_cls.id)
+    ).all()
+
+
+@pytest.mark.usefixtures('versioning_manager', 'table_creator')
+class TestMaterialize(object):
+    def test_objects(self, activities, activity_cls, user_class):
+        objects = list(activity_cls.materialize(activities))
+        assert [obj.__class__.__name__ for obj in objects] == [
+            'User',
+            'Article',
+            'User'
+        ]
+        assert objects[2].name == 'Luke'
+        assert objects[2].age == 15
+
+    def test_dicts(self, activities, activity_cls, user_class):
+        data = list(activity_cls.materialize(activities, as_dict=True))
+        assert data == [activity.data for activity in activities]
+
+    def test_dicts_are_copies(self, activities, activity_cls):
+        data = next(activity_cls.materialize(activities, as_dict=True))
+        data['name'] = 'Jack'
+        assert activities[0].changed_data['name'] == 'John'
+
+    def test_stream(self, activities, activity_cls, session):
+        stream = session.scalars(
+            sa.select(activity_cls).order_by(activity_cls.id)
+        ).yield_per(1)
+        assert [
+            obj.name for obj in activity_cls.materialize(stream)
+        ] == ['John', 'Some article', 'Luke']
+
+    def test_rows(self, activities, activity_cls, session):
+        rows = session.execute(
+            sa.select(
+                activity_cls.table_name,
+                activity_cls.old_data,
+                activity_cls.changed_data
+            ).order_by(activity_cls.id)
+        )
+        assert [
+            obj.name for obj in activity_cls.materialize(rows)
+        ] == ['John', 'Some article', 'Luke']
+
+    def test_resolves_classes_once(
+        self,
+        activities,
+        activity_cls,
+        monkeypatch
+    ):
+        calls = []
+        get_class_by_table = sqlalchemy_utils.get_class_by_table
+
+        def get_class_by_table_spy(*args):
+            calls.append(args[1].name)
+            return get_class_by_table(*args)
+
+        monkeypatch.setattr(
+            sqlalchemy_utils,
+            'get_class_by_table',
+            get_class_by_table_spy
+        )
+        list(activity_cls.materialize(activities * 10))
+        assert sorted(calls) == ['article', 'user']
+
+    def test_object(self, activities):
+        assert activities[2].object.name == 'Luke'
+
+
+@pytest.mark.usefixtures('versioning_manager', 'table_creator')
+class TestDeclarativeClassMap(object):
+    def test_polymorphic_classes(self, base, entity_classes):
+        Entity, Person = entity_classes
+        class_map = DeclarativeClassMap(base)
+        assert class_map.get('entity', {'type': 'person'}) is Person
+        assert class_map.get('entity', {'type': 'entity'}) is Entity
+        assert class_map.get('entity', {'type': 'person'}) is Person
+        assert set(class_map.classes) == {
+            ('entity', 'person'),
+            ('entity', 'entity')
+        }
+
+    def test_polymorphic_activities(
+        self,
+        entity_classes,
+        activity_cls,
+        session
+    ):
+        Entity, Person = entity_classes
+        session.add(Person(name='John'))
+        session.commit()
+        session.add(Entity(name='Some entity'))
+        session.commit()
+        objects = activity_cls.materialize(
+            session.scalars(sa.select(activity_cls).order_by(activity_cls.id))
+        )
+        assert [obj.__class__ for obj in objects] == [Person, Entity]
+
+    def test_unmapped_table(self, base):
+        sa.Table('unmapped', base.metadata, sa.Column('id', sa.Integer))
+        class_map = DeclarativeClassMap(base)
+        assert class_map.get('unmapped', {}) is None
+        assert class_map.classes == {}
@@ -5,6 +5,7 @@ from postgresql_audit import (
     add_column,
     alter_column,
     change_column_name,
+    MigrationPlan,
     remove_column,
     rename_table
 )
@@ -212,3 +213,197 @@ class TestAlterColumn(object):
             'age': 15,
             'name': 'John'
         }
+
+
+@pytest.mark.usefixtures('activity_cls', 'table_creator')
+class TestChunkedMigrations(object):
+    @pytest.fixture
+    def users(self, session, user_class):
+        users = [user_class(name='User %s' % i, age=i) for i in range(5)]
+        session.add_all(users)
+        session.commit()
+        return users
+
+    def test_requires_engine(self, engine):
+        with engine.begin() as connection:
+            with pytest.raises(ValueError):
+                rename_table(connection, 'user', 'user2', chunk_size=2)
+
+    @pytest.mark.parametrize('workers', [1, 3])
+    def test_updates_all_chunks(
+        self,
+        session,
+        engine,
+        users,
+        article,
+        versioning_manager,
+        workers
+    ):
+        calls = []
+        assert rename_table(
+            engine,
+            'user',
+            'user2',
+            chunk_size=2,
+            workers=workers,
+            progress=lambda completed, total: calls.append(
+                (completed, total)
+            )
+        ) == 5
+        assert sorted(calls) == [(1, 3), (2, 3), (3, 3)]
+        activity_cls = versioning_manager.activity_cls
+        assert session.query(activity_cls).filter_by(
+            table_name='user2'
+        ).count() == 5
+        assert session.query(activity_cls).filter_by(
+            table_name='article'
+        ).count() == 1
+
+    def test_resumes_interrupted_migration(self, session, engine, users):
+        def double_age(value, activity_table):
+            return sa.cast(value, sa.Integer) * 2
+
+        def interrupt(completed, total):
+            raise RuntimeError('Interrupted')
+
+        with pytest.raises(RuntimeError):
+            alter_column(
+                engine,
+                'user',
+                'age',
+                double_age,
+                chunk_size=2,
+                progress=interrupt
+            )
+        assert alter_column(
+            engine,
+            'user',
+            'age',
+            double_age,
+            chunk_size=2
+        ) == 3
+        with engine.begin() as connection:
+            ages = connection.execute(
+                sa.text(
+                    "SELECT changed_data['age'] FROM activity "
+                    "WHERE table_name = 'user' ORDER BY id"
+                )
+            ).scalars().all()
+            assert connection.execute(
+                sa.text('SELECT count(*) FROM activity_migration_chunk')
+            ).scalar() == 0
+        assert ages == [0, 2, 4, 6, 8]
+
+
+@pytest.mark.usefixtures('activity_cls', 'table_creator')
+class TestMigrationPlan(object):
+    def test_composes_operations(self, session, user, article, engine):
+        user.name = 'Luke'
+        session.commit()
+        plan = (
+            MigrationPlan('user')
+            .change_column_name('name', 'full_name')
+            .remove_column('age')
+            .alter_column(
+                'id',
+                lambda value, activity_table: sa.cast(value, sa.Text)
+            )
+        )
+        with engine.begin() as connection:
+            assert plan.execute(connection) == 2
+            activity = last_activity(connection)
+        assert activity['old_data'] == {
+            'id': str(user.id),
+            'full_name': 'John'
+        }
+        assert activity['changed_data'] == {'full_name': 'Luke'}
+
+    def test_alters_renamed_column(self, session, user, engine):
+        plan = (
+            MigrationPlan('user')
+            .change_column_name('age', 'years')
+            .alter_column(
+                'years',
+                lambda value, activity_table: sa.cast(value, sa.Integer) + 1
+            )
+        )
+        with engine.begin() as connection:
+            assert plan.execute(connection) == 1
+            activity = last_activity(connection)
+        assert activity['changed_data'] == {
+            'id': user.id,
+            'name': 'John',
+            'years': 16
+        }
+
+    def test_alters_column_to_literal_value(self, session, user, engine):
+        user.name = 'Luke'
+        session.commit()
+        plan = MigrationPlan('user').alter_column(
+            'name',
+            lambda value, activity_table: 'anon'
+        )
+        with engine.begin() as connection:
+            assert plan.execute(connection) == 2
+            activity = last_activity(connection)
+        assert activity['old_data']['name'] == 'anon'
+        assert activity['changed_data'] == {'name': 'anon'}
+
+    def test_alembic_operations(self, session, user, engine):
+        class Operations(object):
+            def __init__(self, connection):
+                self.connection = connection
+
+            def execute(self, statement):
+                self.connection.execute(statement)
+
+            def get_bind(self):
+                return self.connection
+
+        plan = MigrationPlan('user').change_column_name('name', 'full_name')
+        with engine.begin() as connection:
+            assert plan.execute(Operations(connection)) == 1
+            activity = last_activity(connection)
+        assert activity['changed_data']['full_name'] == 'John'
+
+    def test_skips_activities_without_columns(self, session, user, engine):
+        plan = MigrationPlan('user').remove_column('unknown')
+        with engine.begin() as connection:
+            assert plan.execute(connection) == 0
+
+    def test_add_column_and_rename_table(self, session, user, engine):
+        plan = (
+            MigrationPlan('user')
+            .add_column('some_column', 'value')
+            .rename_table('user2')
+        )
+        with engine.begin() as connection:
+            assert plan.execute(connection) == 1
+            activity = last_activity(connection)
+        assert activity['table_name'] == 'user2'
+        assert activity['changed_data']['some_column'] == 'value'
+
+    def test_uses_gin_indexes(self, session, user, engine):
+        plan = (
+            MigrationPlan('user')
+            .change_column_name('name', 'full_name')
+            .remove_column('age')
+        )
+        query = plan.query().compile(dialect=engine.dialect)
+        with engine.begin() as connection:
+            for column in ['old_data', 'changed_data']:
+                connection.exec_driver_sql(
+                    'CREATE INDEX ON activity USING gin ({})'.format(column)
+                )
+            connection.exec_driver_sql('SET LOCAL enable_seqscan = off')
+            explain = '\n'.join(
+                connection.exec_driver_sql(
+                    'EXPLAIN ' + query.string,
+                    query.params
+                ).scalars()
+            )
+        assert 'Bitmap Index Scan' in explain
+
+    def test_chunked_execution(self, session, user, article, engine):
+        plan = MigrationPlan('user').remove_column('age')
+        assert plan.execute(engine, chunk_size=1) == 1
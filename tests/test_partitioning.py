@@ -0,0 +1,158 @@
+from datetime import datetime, timezone
+
+import pytest
+from sqlalchemy import text
+
+from postgresql_audit import VersioningManager
+
+
+@pytest.fixture
+def versioning_manager(base, schema_name):
+    vm = VersioningManager(schema_name=schema_name, partitioned=True)
+    vm.init(base)
+    yield vm
+    vm.remove_listeners()
+
+
+def activity_partition(connection):
+    return connection.execute(
+        text(
+            'SELECT tableoid::regclass::text FROM activity '
+            'ORDER BY id DESC LIMIT 1'
+        )
+    ).scalar()
+
+
+@pytest.mark.usefixtures('versioning_manager', 'table_creator')
+class TestPartitionedActivity(object):
+    def test_activity_table_is_partitioned(self, session):
+        assert session.execute(
+            text(
+                "SELECT relkind FROM pg_class "
+                "WHERE oid = 'activity'::regclass"
+            )
+        ).scalar() == 'p'
+
+    def test_insert_without_partitions_uses_default_partition(
+        self,
+        user,
+        session
+    ):
+        assert activity_partition(session) == 'activity_default'
+
+    def test_insert_into_current_partition(
+        self,
+        versioning_manager,
+        user_class,
+        session
+    ):
+        versioning_manager.create_partitions(session, count=2)
+        user = user_class(name='John')
+        session.add(user)
+        session.flush()
+        assert activity_partition(session) == (
+            'activity_p{:%Y%m01}'.format(datetime.now(timezone.utc))
+        )
+
+    def test_create_partitions(self, versioning_manager, session):
+        names = versioning_manager.create_partitions(
+            session,
+            count=3,
+            start=datetime(2020, 11, 15)
+        )
+        assert names == [
+            'activity_p20201101',
+            'activity_p20201201',
+            'activity_p20210101',
+        ]
+        assert versioning_manager.get_partitions(session) == [
+            (
+                'activity_p20201101',
+                datetime(2020, 11, 1),
+                datetime(2020, 12, 1)
+            ),
+            (
+                'activity_p20201201',
+                datetime(2020, 12, 1),
+                datetime(2021, 1, 1)
+            ),
+            (
+                'activity_p20210101',
+                datetime(2021, 1, 1),
+                datetime(2021, 2, 1)
+            ),
+        ]
+
+    def test_create_partitions_is_idempotent(
+        self,
+        versioning_manager,
+        session
+    ):
+        start = datetime(2020, 1, 1)
+        versioning_manager.create_partitions(session, count=2, start=start)
+        versioning_manager.create_partitions(session, count=3, start=start)
+        assert len(versioning_manager.get_partitions(session)) == 3
+
+    def test_create_partitions_moves_rows_from_default_partition(
+        self,
+        versioning_manager,
+        user,
+        session
+    ):
+        versioning_manager.create_partitions(session, count=1)
+        assert activity_partition(session) == (
+            'activity_p{:%Y%m01}'.format(datetime.now(timezone.utc))
+        )
+        assert session.execute(
+            text('SELECT count(*) FROM activity_default')
+        ).scalar() == 0
+        assert session.execute(
+            text(
+                "SELECT relispartition FROM pg_class "
+                "WHERE oid = 'activity_default'::regclass"
+            )
+        ).scalar()
+
+    def test_create_partitions_with_unknown_interval(
+        self,
+        versioning_manager,
+        session
+    ):
+        with pytest.raises(ValueError):
+            versioning_manager.create_partitions(session, interval='hour')
+
+    def test_drop_partitions(self, versioning_manager, session):
+        versioning_manager.create_partitions(
+            session,
+            count=3,
+            interval='day',
+            start=datetime(2020, 1, 1)
+        )
+        assert versioning_manager.drop_partitions(
+            session,
+            before=datetime(2020, 1, 2, 12)
+        ) == ['activity_p20200101']
+        assert [
+            name for name, start, end
+            in versioning_manager.get_partitions(session)
+        ] == ['activity_p20200102', 'activity_p20200103']
+        assert session.execute(
+            text("SELECT to_regclass('activity_p20200101')")
+        ).scalar() is None
+
+    def test_detach_partitions(self, versioning_manager, session):
+        versioning_manager.create_partitions(
+            session,
+            count=2,
+            interval='year',
+            start=datetime(2020, 6, 1)
+        )
+        assert versioning_manager.detach_partitions(
+            session,
+            before=datetime(2021, 1, 1)
+        ) == ['activity_p20200101']
+        assert session.execute(
+            text("SELECT relkind FROM pg_class "
+                 "WHERE oid = 'activity_p20200101'::regclass")
+        ).scalar() == 'r'
+        assert len(versioning_manager.get_partitions(session)) == 1
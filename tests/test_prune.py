@@ -0,0 +1,225 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+import sqlalchemy as sa
+
+from postgresql_audit import VersioningManager
+
+
+def utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def age(session, cls, days):
+    session.execute(
+        sa.update(cls).values(
+            issued_at=utcnow() - timedelta(days=days)
+        )
+    )
+    session.commit()
+
+
+def count(session, cls):
+    return session.scalar(sa.select(sa.func.count()).select_from(cls))
+
+
+def table_names(session, activity_cls):
+    return session.scalars(
+        sa.select(activity_cls.table_name).order_by(activity_cls.id)
+    ).all()
+
+
+@pytest.fixture
+def old_activities(
+    versioning_manager,
+    session,
+    activity_cls,
+    transaction_cls,
+    user_class
+):
+    versioning_manager.values = {'actor_id': '1'}
+    session.add_all([user_class(name='John'), user_class(name='Jack')])
+    session.commit()
+    age(session, activity_cls, 100)
+    age(session, transaction_cls, 100)
+
+
+@pytest.mark.usefixtures('versioning_manager', 'table_creator')
+class TestPrune(object):
+    def test_default_retention(
+        self,
+        versioning_manager,
+        old_activities,
+        article,
+        activity_cls,
+        engine,
+        session
+    ):
+        result = versioning_manager.prune(
+            engine,
+            default_retention=timedelta(days=30)
+        )
+        assert result.activities == 2
+        assert result.duration >= 0
+        assert table_names(session, activity_cls) == ['article']
+
+    def test_table_retention(
+        self,
+        versioning_manager,
+        old_activities,
+        article_class,
+        activity_cls,
+        engine,
+        session
+    ):
+        session.add(article_class(name='Some article'))
+        session.commit()
+        age(session, activity_cls, 100)
+        result = versioning_manager.prune(
+            engine,
+            retention={'article': timedelta(days=30)}
+        )
+        assert result.activities == 1
+        assert table_names(session, activity_cls) == ['user', 'user']
+
+    def test_table_retention_overrides_default(
+        self,
+        versioning_manager,
+        old_activities,
+        activity_cls,
+        engine,
+        session
+    ):
+        result = versioning_manager.prune(
+            engine,
+            retention={'user': timedelta(days=365)},
+            default_retention=timedelta(days=30)
+        )
+        assert result.activities == 0
+        assert count(session, activity_cls) == 2
+
+    def test_batches(
+        self,
+        versioning_manager,
+        old_activities,
+        user_class,
+        activity_cls,
+        engine,
+        session,
+        monkeypatch
+    ):
+        session.add_all([user_class(name=str(i)) for i in range(5)])
+        session.commit()
+        age(session, activity_cls, 100)
+        transactions = []
+        begin = engine.begin
+
+        def begin_spy():
+            transactions.append(None)
+            return begin()
+
+        monkeypatch.setattr(engine, 'begin', begin_spy)
+        result = versioning_manager.prune(
+            engine,
+            default_retention=timedelta(days=30),
+            batch_size=2
+        )
+        assert result.activities == 7
+        # Four batches of activities and one of transactions.
+        assert len(transactions) == 5
+        assert count(session, activity_cls) == 0
+
+    def test_sleeps_between_batches(
+        self,
+        versioning_manager,
+        old_activities,
+        engine,
+        monkeypatch
+    ):
+        sleeps = []
+        monkeypatch.setattr('time.sleep', sleeps.append)
+        versioning_manager.prune(
+            engine,
+            default_retention=timedelta(days=30),
+            batch_size=1,
+            sleep=0.5
+        )
+        assert sleeps == [0.5, 0.5, 0.5]
+
+    def test_orphaned_transactions(
+        self,
+        versioning_manager,
+        old_activities,
+        transaction_cls,
+        engine,
+        session
+    ):
+        result = versioning_manager.prune(
+            engine,
+            default_retention=timedelta(days=30)
+        )
+        assert result.transactions == 1
+        assert count(session, transaction_cls) == 0
+
+    def test_keeps_transactions_with_activities(
+        self,
+        versioning_manager,
+        old_activities,
+        transaction_cls,
+        engine,
+        session
+    ):
+        result = versioning_manager.prune(
+            engine,
+            retention={'article': timedelta(days=30)}
+        )
+        assert result.transactions == 0
+        assert count(session, transaction_cls) == 1
+
+    def test_keeps_recent_transactions(
+        self,
+        versioning_manager,
+        transaction_cls,
+        engine,
+        session
+    ):
+        session.add(transaction_cls(issued_at=utcnow()))
+        session.commit()
+        result = versioning_manager.prune(
+            engine,
+            default_retention=timedelta(days=30)
+        )
+        assert result.transactions == 0
+
+    def test_without_retention(self, versioning_manager, engine):
+        assert versioning_manager.prune(engine)[:2] == (0, 0)
+
+
+@pytest.mark.usefixtures('table_creator')
+class TestPruneWithStagingTable(object):
+    @pytest.fixture
+    def versioning_manager(self, base):
+        vm = VersioningManager(use_staging_table=True)
+        vm.init(base)
+        yield vm
+        vm.remove_listeners()
+
+    def test_keeps_transactions_of_staged_changes(
+        self,
+        versioning_manager,
+        transaction_cls,
+        user_class,
+        engine,
+        session
+    ):
+        versioning_manager.values = {'actor_id': '1'}
+        session.add(user_class(name='John'))
+        session.commit()
+        age(session, transaction_cls, 100)
+        result = versioning_manager.prune(
+            engine,
+            default_retention=timedelta(days=30)
+        )
+        assert result.transactions == 0
+        assert count(session, transaction_cls) == 1
+        assert versioning_manager.drain(engine) == 1
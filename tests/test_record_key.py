@@ -0,0 +1,137 @@
+import pytest
+import sqlalchemy as sa
+from sqlalchemy import text
+
+from postgresql_audit import VersioningManager
+
+from .utils import last_activity
+
+
+@pytest.fixture(
+    params=[
+        (True, False),
+        (False, False),
+        (True, True),
+        (False, True),
+    ],
+    ids=[
+        'stmt_level',
+        'row_level',
+        'generated_stmt_level',
+        'generated_row_level',
+    ]
+)
+def versioning_manager(base, request):
+    use_statement_level_triggers, use_generated_trigger_functions = (
+        request.param
+    )
+    vm = VersioningManager(
+        use_statement_level_triggers=use_statement_level_triggers,
+        use_generated_trigger_functions=use_generated_trigger_functions
+    )
+    vm.init(base)
+    yield vm
+    vm.remove_listeners()
+
+
+@pytest.fixture
+def membership_class(base):
+    class Membership(base):
+        __tablename__ = 'membership'
+        __versioned__ = {}
+        user_id = sa.Column(sa.Integer, primary_key=True)
+        group_name = sa.Column(sa.String(100), primary_key=True)
+        role = sa.Column(sa.String(100))
+
+    return Membership
+
+
+@pytest.fixture
+def models(user_class, article_class, membership_class):
+    return [user_class, article_class, membership_class]
+
+
+@pytest.mark.usefixtures('versioning_manager', 'table_creator')
+class TestRecordKey(object):
+    def test_insert(self, user, session):
+        assert last_activity(session)['record_key'] == [user.id]
+
+    def test_update(self, user, session):
+        user.name = 'Luke'
+        session.commit()
+        assert last_activity(session)['record_key'] == [user.id]
+
+    def test_delete(self, user, session):
+        session.delete(user)
+        session.commit()
+        assert last_activity(session)['record_key'] == [user.id]
+
+    def test_composite_primary_key(self, membership_class, session):
+        session.add(
+            membership_class(user_id=1, group_name='admins', role='owner')
+        )
+        session.commit()
+        assert last_activity(session)['record_key'] == [1, 'admins']
+
+    def test_excluded_primary_key(
+        self,
+        versioning_manager,
+        user_class,
+        session
+    ):
+        session.execute(text('''SELECT audit_table('user', '{id}')'''))
+        session.add(user_class(name='John'))
+        session.commit()
+        assert last_activity(session)['record_key'] is None
+
+    def test_history_for(
+        self,
+        user,
+        user_class,
+        article,
+        activity_cls,
+        session
+    ):
+        user.name = 'Luke'
+        session.add(user_class(name='Jack'))
+        session.commit()
+        activities = session.scalars(activity_cls.history_for(user)).all()
+        assert [activity.verb for activity in activities] == [
+            'insert',
+            'update'
+        ]
+        assert activities[1].changed_data == {'name': 'Luke'}
+
+    def test_history_for_composite_primary_key(
+        self,
+        membership_class,
+        activity_cls,
+        session
+    ):
+        membership = membership_class(
+            user_id=1,
+            group_name='admins',
+            role='owner'
+        )
+        session.add(membership)
+        session.add(
+            membership_class(user_id=1, group_name='users', role='owner')
+        )
+        session.commit()
+        activity = session.scalars(
+            activity_cls.history_for(membership)
+        ).one()
+        assert activity.changed_data['group_name'] == 'admins'
+
+    def test_history_for_uses_index(self, user, activity_cls, session):
+        query = activity_cls.history_for(user).compile(
+            dialect=session.bind.dialect
+        )
+        session.execute(text('SET LOCAL enable_seqscan = off'))
+        plan = '\n'.join(
+            session.connection().exec_driver_sql(
+                'EXPLAIN ' + query.string,
+                query.params
+            ).scalars()
+        )
+        assert 'ix_activity_record_key' in plan
@@ -0,0 +1,71 @@
+import pytest
+from sqlalchemy import text
+
+from postgresql_audit import VersioningManager
+
+
+def recorded_names(session):
+    return set(
+        session.execute(text('SELECT name FROM audit_sql_object')).scalars()
+    )
+
+
+@pytest.mark.usefixtures('versioning_manager', 'table_creator')
+class TestInstallSqlObjects(object):
+    def test_records_installed_objects(self, versioning_manager, session):
+        assert {
+            name for name, sql in versioning_manager.sql_objects()
+        } <= recorded_names(session)
+
+    def test_skips_current_objects(self, versioning_manager, session):
+        assert versioning_manager.install_sql_objects(session) == []
+
+    def test_upgrades_changed_objects(self, versioning_manager, session):
+        session.execute(
+            text(
+                "UPDATE audit_sql_object SET checksum = 'outdated' "
+                "WHERE name = 'operators'"
+            )
+        )
+        assert versioning_manager.install_sql_objects(session) == [
+            'operators'
+        ]
+        assert versioning_manager.install_sql_objects(session) == []
+
+    def test_force(self, versioning_manager, session):
+        assert versioning_manager.install_sql_objects(
+            session,
+            force=True
+        ) == [name for name, sql in versioning_manager.sql_objects()]
+
+    def test_keeps_dependent_objects(self, versioning_manager, session):
+        session.execute(
+            text(
+                "CREATE VIEW activity_diff AS "
+                "SELECT changed_data - old_data AS diff FROM activity"
+            )
+        )
+        versioning_manager.install_sql_objects(session, force=True)
+        assert session.execute(
+            text("SELECT to_regclass('activity_diff') IS NOT NULL")
+        ).scalar()
+        session.execute(text('DROP VIEW activity_diff'))
+
+    def test_upgrades_objects_of_other_configuration(
+        self,
+        versioning_manager,
+        session
+    ):
+        manager = VersioningManager(
+            use_statement_level_triggers=(
+                not versioning_manager.use_statement_level_triggers
+            )
+        )
+        assert set(manager.install_sql_objects(session)) == {
+            'create_activity',
+            'audit_table',
+        }
+        assert set(versioning_manager.install_sql_objects(session)) == {
+            'create_activity',
+            'audit_table',
+        }
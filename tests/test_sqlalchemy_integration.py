@@ -221,6 +221,90 @@ class TestActivityCreation(object):
         assert session.query(versioning_manager.transaction_cls).count() == 1
 
 
+@pytest.mark.usefixtures('versioning_manager', 'table_creator')
+class TestTransactionInsertsPerTransaction(object):
+    @pytest.fixture
+    def transaction_inserts(self, engine):
+        statements = []
+
+        def receive_before_cursor_execute(conn, cursor, statement, *args):
+            if statement.startswith('INSERT INTO transaction'):
+                statements.append(statement)
+
+        sa.event.listen(
+            engine,
+            'before_cursor_execute',
+            receive_before_cursor_execute
+        )
+        yield statements
+        sa.event.remove(
+            engine,
+            'before_cursor_execute',
+            receive_before_cursor_execute
+        )
+
+    @pytest.fixture
+    def actor(self, versioning_manager):
+        versioning_manager.values = {'actor_id': 1}
+
+    @pytest.mark.usefixtures('actor')
+    def test_inserts_once_per_transaction(
+        self,
+        user_class,
+        session,
+        transaction_inserts
+    ):
+        user = user_class(name='John')
+        session.add(user)
+        session.flush()
+        user.name = 'Luke'
+        session.flush()
+        user.age = 18
+        session.flush()
+        assert len(transaction_inserts) == 1
+
+    @pytest.mark.usefixtures('actor')
+    def test_inserts_again_in_new_transaction(
+        self,
+        user_class,
+        session,
+        transaction_inserts,
+        transaction_cls
+    ):
+        session.add(user_class(name='John'))
+        session.commit()
+        session.add(user_class(name='Luke'))
+        session.commit()
+        assert len(transaction_inserts) == 2
+        assert session.query(transaction_cls).count() == 2
+
+    @pytest.mark.usefixtures('actor')
+    def test_inserts_again_after_savepoint_rollback(
+        self,
+        user_class,
+        session,
+        activity_cls
+    ):
+        session.add(user_class(name='John'))
+        session.commit()
+        savepoint = session.begin_nested()
+        session.add(user_class(name='Luke'))
+        session.flush()
+        savepoint.rollback()
+        session.add(user_class(name='Matti'))
+        session.flush()
+        activity = session.query(activity_cls).order_by(
+            activity_cls.id.desc()
+        ).first()
+        assert activity.transaction.actor_id == '1'
+
+    def test_reuses_insert_statement(self, versioning_manager):
+        assert (
+            versioning_manager.transaction_insert_stmt(('actor_id',)) is
+            versioning_manager.transaction_insert_stmt(('actor_id',))
+        )
+
+
 @pytest.mark.usefixtures('versioning_manager', 'table_creator')
 class TestColumnExclusion(object):
     """
@@ -402,6 +486,49 @@ class TestIsModified(object):
         session.delete(article)
         assert versioning_manager.is_modified(session)
 
+    def test_audited_attributes(self, versioning_manager, article_class):
+        assert versioning_manager.audited_attributes(article_class) == {
+            'id': ('id',),
+            'name': ('name',),
+            '_created_at': ('_created_at',),
+            'author_id': ('author_id',),
+            'author': ('author_id',),
+        }
+
+    def test_attribute_set_to_its_current_value(
+        self,
+        versioning_manager,
+        article,
+        session
+    ):
+        article.name = article.name
+        assert not versioning_manager.is_modified(article)
+        assert not versioning_manager.is_modified(session)
+
+    def test_only_checks_changed_objects(
+        self,
+        versioning_manager,
+        article_class,
+        session,
+        monkeypatch
+    ):
+        session.add_all([
+            article_class(name='Article %s' % i) for i in range(10)
+        ])
+        session.commit()
+        articles = session.query(article_class).all()
+        articles[3].name = 'Article updated'
+        checked = []
+        is_modified = versioning_manager.is_modified
+
+        def is_modified_spy(obj):
+            checked.append(obj)
+            return is_modified(obj)
+
+        monkeypatch.setattr(versioning_manager, 'is_modified', is_modified_spy)
+        assert is_modified(session)
+        assert checked == [articles[3]]
+
 
 @pytest.mark.usefixtures('versioning_manager', 'table_creator')
 class TestActivityObject(object):
@@ -412,3 +539,129 @@ class TestActivityObject(object):
         activity = session.query(activity_cls).first()
         assert activity.object.__class__ == user.__class__
         assert activity.object.id == user.id
+
+
+@pytest.mark.usefixtures('versioning_manager', 'table_creator')
+class TestStatementLevelUpdatePairing(object):
+    @pytest.fixture
+    def users(self, table_creator, session, user_class):
+        session.execute(
+            user_class.__table__.insert(),
+            [{'id': i, 'name': 'User %s' % i, 'age': i} for i in range(1, 51)]
+        )
+        session.flush()
+
+    def updates(self, session, activity_cls):
+        return session.query(activity_cls).filter_by(verb='update').all()
+
+    def primary_key_lookups(self, session):
+        return session.execute(
+            sa.text(
+                "SELECT coalesce(sum(calls), 0) "
+                "FROM pg_stat_xact_user_functions "
+                "WHERE funcname = 'primary_key_columns'"
+            )
+        ).scalar()
+
+    def index_catalog_scans(self, session):
+        return session.execute(
+            sa.text(
+                "SELECT coalesce(seq_scan, 0) + coalesce(idx_scan, 0) "
+                "FROM pg_stat_xact_sys_tables WHERE relname = 'pg_index'"
+            )
+        ).scalar()
+
+    @pytest.mark.usefixtures('users')
+    def test_uses_key_columns_of_trigger(self, session, user_class):
+        update = user_class.__table__.update().values(age=user_class.age + 1)
+        session.execute(sa.text("SET LOCAL track_functions = 'all'"))
+        session.execute(update)
+        # Querying the statistics scans the catalog as well.
+        scans = [self.index_catalog_scans(session) for _ in range(2)]
+        session.execute(update)
+        assert self.index_catalog_scans(session) - scans[1] == (
+            scans[1] - scans[0]
+        )
+        assert self.primary_key_lookups(session) == 0
+
+    def test_excluded_primary_key_column(
+        self,
+        session,
+        user_class,
+        activity_cls
+    ):
+        session.execute(sa.text("SELECT audit_table('user', '{id}')"))
+        session.execute(
+            user_class.__table__.insert(),
+            [{'id': i, 'name': 'User %s' % i, 'age': i} for i in range(1, 6)]
+        )
+        session.execute(sa.text("SET LOCAL track_functions = 'all'"))
+        session.execute(
+            user_class.__table__.update().values(
+                name=sa.func.upper(user_class.name)
+            )
+        )
+        assert self.primary_key_lookups(session) > 0
+        activities = self.updates(session, activity_cls)
+        assert len(activities) == 5
+        for activity in activities:
+            assert activity.changed_data == {
+                'name': activity.old_data['name'].upper()
+            }
+
+    @pytest.mark.usefixtures('users')
+    def test_pairs_rows_by_primary_key(
+        self,
+        session,
+        user_class,
+        activity_cls
+    ):
+        session.execute(
+            user_class.__table__.update().values(
+                name=sa.func.upper(user_class.name)
+            )
+        )
+        activities = self.updates(session, activity_cls)
+        assert len(activities) == 50
+        for activity in activities:
+            assert activity.changed_data == {
+                'name': activity.old_data['name'].upper()
+            }
+
+    @pytest.mark.usefixtures('users')
+    def test_primary_key_update(self, session, user_class, activity_cls):
+        session.execute(
+            user_class.__table__.update().values(id=user_class.id + 100)
+        )
+        activities = self.updates(session, activity_cls)
+        assert len(activities) == 50
+        for activity in activities:
+            assert activity.changed_data == {
+                'id': activity.old_data['id'] + 100
+            }
+
+    def test_table_without_primary_key(
+        self,
+        base,
+        engine,
+        session,
+        versioning_manager,
+        activity_cls
+    ):
+        table = sa.Table(
+            'tag',
+            base.metadata,
+            sa.Column('name', sa.String),
+        )
+        versioning_manager.audit_table(table)
+        with engine.begin() as connection:
+            table.create(connection)
+        session.execute(table.insert(), [{'name': 'a'}, {'name': 'b'}])
+        session.execute(
+            table.update().values(name=sa.func.upper(table.c.name))
+        )
+        activities = self.updates(session, activity_cls)
+        assert sorted(
+            (activity.old_data['name'], activity.changed_data['name'])
+            for activity in activities
+        ) == [('a', 'A'), ('b', 'B')]
@@ -0,0 +1,188 @@
+import pytest
+from sqlalchemy import text
+
+from postgresql_audit import ImproperlyConfigured, VersioningManager
+
+from .utils import last_activity
+
+
+@pytest.fixture(params=[True, False], ids=['stmt_level', 'row_level'])
+def versioning_manager(base, schema_name, request):
+    vm = VersioningManager(
+        schema_name=schema_name,
+        use_statement_level_triggers=request.param,
+        use_staging_table=True,
+        unlogged_staging_table=True
+    )
+    vm.init(base)
+    yield vm
+    vm.remove_listeners()
+
+
+def staged_count(session):
+    return session.execute(
+        text('SELECT count(*) FROM activity_staging')
+    ).scalar()
+
+
+class TestStagingTableConfiguration(object):
+    def test_generated_trigger_functions_are_not_supported(self):
+        with pytest.raises(ImproperlyConfigured):
+            VersioningManager(
+                use_staging_table=True,
+                use_generated_trigger_functions=True
+            )
+
+
+@pytest.mark.usefixtures('versioning_manager', 'table_creator')
+class TestStagingTable(object):
+    def test_staging_table_is_unlogged(self, session):
+        assert session.execute(
+            text(
+                "SELECT relpersistence FROM pg_class "
+                "WHERE oid = 'activity_staging'::regclass"
+            )
+        ).scalar() == 'u'
+
+    def test_changes_are_staged(self, user, session, activity_cls):
+        assert staged_count(session) == 1
+        assert session.query(activity_cls).count() == 0
+
+    def test_drain_insert(
+        self,
+        versioning_manager,
+        user,
+        session,
+        activity_cls
+    ):
+        assert versioning_manager.drain_staging_table(session) == 1
+        assert staged_count(session) == 0
+        activity = last_activity(session)
+        assert activity['old_data'] == {}
+        assert activity['changed_data'] == {
+            'id': user.id,
+            'name': 'John',
+            'age': 15
+        }
+        assert activity['table_name'] == 'user'
+        assert activity['native_transaction_id']
+        assert activity['verb'] == 'insert'
+
+    def test_drain_record_key(self, versioning_manager, user, session):
+        user.name = 'Luke'
+        session.flush()
+        versioning_manager.drain_staging_table(session)
+        assert last_activity(session)['record_key'] == [user.id]
+
+    def test_drain_keeps_transaction(
+        self,
+        versioning_manager,
+        user_class,
+        session,
+        activity_cls
+    ):
+        versioning_manager.values = {'actor_id': 1}
+        session.add(user_class(name='John'))
+        session.flush()
+        versioning_manager.drain_staging_table(session)
+        activity = session.query(activity_cls).one()
+        assert activity.transaction.actor_id == '1'
+
+    def test_drain_update(self, versioning_manager, user, session):
+        user.name = 'Luke'
+        session.flush()
+        versioning_manager.drain_staging_table(session)
+        activity = last_activity(session)
+        assert activity['old_data'] == {
+            'id': user.id,
+            'name': 'John',
+            'age': 15
+        }
+        assert activity['changed_data'] == {'name': 'Luke'}
+        assert activity['verb'] == 'update'
+
+    def test_drain_skips_updates_without_changes(
+        self,
+        versioning_manager,
+        user,
+        user_class,
+        session,
+        activity_cls
+    ):
+        session.execute(
+            user_class.__table__.update().values(name=user_class.name)
+        )
+        assert versioning_manager.drain_staging_table(session) == 2
+        assert session.query(activity_cls).count() == 1
+
+    def test_drain_delete(self, versioning_manager, user, session):
+        session.delete(user)
+        session.flush()
+        versioning_manager.drain_staging_table(session)
+        activity = last_activity(session)
+        assert activity['old_data'] == {
+            'id': user.id,
+            'name': 'John',
+            'age': 15
+        }
+        assert activity['changed_data'] == {}
+        assert activity['verb'] == 'delete'
+
+    def test_drain_with_column_exclusion(
+        self,
+        versioning_manager,
+        user_class,
+        session
+    ):
+        session.execute(text('''SELECT audit_table('user', '{age}')'''))
+        user = user_class(name='John', age=15)
+        session.add(user)
+        session.flush()
+        versioning_manager.drain_staging_table(session)
+        assert last_activity(session)['changed_data'] == {
+            'id': user.id,
+            'name': 'John'
+        }
+
+    def test_drain_update_with_excluded_primary_key(
+        self,
+        versioning_manager,
+        user_class,
+        session,
+        activity_cls
+    ):
+        session.execute(text('''SELECT audit_table('user', '{id}')'''))
+        session.execute(
+            user_class.__table__.insert(),
+            [{'id': i, 'name': 'User %s' % i} for i in range(1, 6)]
+        )
+        session.execute(
+            user_class.__table__.update().values(age=user_class.id * 10)
+        )
+        versioning_manager.drain_staging_table(session)
+        activities = session.query(activity_cls).filter_by(verb='update')
+        assert sorted(
+            (activity.old_data['name'], activity.changed_data['age'])
+            for activity in activities
+        ) == [('User %s' % i, i * 10) for i in range(1, 6)]
+
+    def test_drain_in_parallel(
+        self,
+        versioning_manager,
+        engine,
+        user_class,
+        session,
+        activity_cls
+    ):
+        session.execute(
+            user_class.__table__.insert(),
+            [{'name': 'User %s' % i} for i in range(100)]
+        )
+        session.commit()
+        assert versioning_manager.drain(
+            engine,
+            batch_size=10,
+            workers=3
+        ) == 100
+        assert session.query(activity_cls).count() == 100
+        assert staged_count(session) == 0
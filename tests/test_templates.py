@@ -0,0 +1,37 @@
+import subprocess
+import sys
+
+import pytest
+
+from postgresql_audit import base, VersioningManager
+
+
+class TestTemplates(object):
+    def test_templates_are_read_once(self, monkeypatch):
+        VersioningManager(schema_name='audit').render_tmpl(
+            'audit_table_stmt_level.sql'
+        )
+
+        def read_file(file_):
+            raise AssertionError('{} was read again'.format(file_))
+
+        monkeypatch.setattr(base, 'read_file', read_file)
+        manager = VersioningManager(schema_name='audit')
+        manager.render_tmpl('audit_table_stmt_level.sql')
+
+    def test_rendered_per_context(self):
+        assert VersioningManager(schema_name='audit').render_tmpl(
+            'drop_schema.sql'
+        ) != VersioningManager(schema_name='other').render_tmpl(
+            'drop_schema.sql'
+        )
+
+    @pytest.mark.parametrize('module', ['sqlalchemy_utils', 'flask'])
+    def test_import_does_not_import_optional_dependencies(self, module):
+        assert subprocess.check_output([
+            sys.executable,
+            '-c',
+            'import sys, postgresql_audit; print({!r} in sys.modules)'.format(
+                module
+            )
+        ]).strip() == b'False'
@@ -0,0 +1,91 @@
+import pytest
+from sqlalchemy import text
+
+from postgresql_audit import VersioningManager
+
+from .utils import last_activity
+
+
+@pytest.fixture(params=[True, False], ids=['stmt_level', 'row_level'])
+def versioning_manager(base, schema_name, request):
+    vm = VersioningManager(
+        schema_name=schema_name,
+        use_statement_level_triggers=request.param,
+        use_transaction_settings=True
+    )
+    vm.init(base)
+    yield vm
+    vm.remove_listeners()
+
+
+@pytest.mark.usefixtures('versioning_manager', 'table_creator')
+class TestTransactionSettings(object):
+    def test_creates_transaction_from_settings(
+        self,
+        versioning_manager,
+        user_class,
+        session
+    ):
+        versioning_manager.values = {
+            'actor_id': 1,
+            'client_addr': '127.0.0.1'
+        }
+        user = user_class(name='John')
+        session.add(user)
+        session.flush()
+        activity = last_activity(session)
+        transaction = session.execute(
+            text('SELECT * FROM transaction WHERE id = :id'),
+            {'id': activity['transaction_id']}
+        ).mappings().one()
+        assert transaction['actor_id'] == '1'
+        assert transaction['client_addr'] == '127.0.0.1'
+        assert transaction['native_transaction_id'] == (
+            activity['native_transaction_id']
+        )
+
+    def test_raw_inserts(self, versioning_manager, user_class, session):
+        versioning_manager.values = {'actor_id': 1}
+        versioning_manager.set_activity_values(session)
+        session.execute(user_class.__table__.insert().values(name='John'))
+        session.execute(user_class.__table__.insert().values(name='John'))
+        activities = session.execute(
+            text('SELECT transaction_id FROM activity')
+        ).scalars().all()
+        assert len(activities) == 2
+        assert activities[0] is not None
+        assert activities[0] == activities[1]
+
+    def test_single_transaction_row_across_flushes(
+        self,
+        versioning_manager,
+        user_class,
+        session,
+        transaction_cls
+    ):
+        versioning_manager.values = {'actor_id': 1}
+        user = user_class(name='John')
+        session.add(user)
+        session.flush()
+        user.name = 'Luke'
+        session.flush()
+        assert session.query(transaction_cls).count() == 1
+
+    def test_no_transaction_row_without_audited_changes(
+        self,
+        versioning_manager,
+        session,
+        transaction_cls
+    ):
+        versioning_manager.values = {'actor_id': 1}
+        versioning_manager.set_activity_values(session)
+        assert session.query(transaction_cls).count() == 0
+
+    def test_no_transaction_row_without_values(
+        self,
+        user,
+        session,
+        transaction_cls
+    ):
+        assert session.query(transaction_cls).count() == 0
+        assert last_activity(session)['transaction_id'] is None